@@ -0,0 +1,78 @@
+"""The "Analyze Reports" pipeline, run as a background job."""
+import metrics
+from metrics import span
+from risk import score_patient
+from risk_model import get_model
+
+JOB_NAME = "analysis"
+
+# Shares of the progress bar given to image analysis and lab report parsing;
+# the rest is scoring
+IMAGING_SHARE = 0.7
+LAB_SHARE = 0.15
+
+STONE_TYPES = ["Calcium Oxalate", "Uric Acid", "Struvite", "Cystine"]
+STONE_TYPE_WEIGHTS = [0.7, 0.15, 0.1, 0.05]
+
+
+def run_analysis(patient_data, images, progress, lab_report=None, slice_thickness_mm=None):
+    """Analyze the uploaded images and lab report for one patient.
+
+    `patient_data` is a snapshot of the session's patient dict, `images`
+    maps a modality to the BlobHandle of an ingested upload and
+    `lab_report` is the BlobHandle of an ingested lab report, if any.
+    `slice_thickness_mm` is the spacing of a CT study's slices, if the
+    user gave it. Returns the fields to merge into the session's
+    patient_data.
+    """
+    # Imported here so the app only loads OpenCV/scikit-image when analyzing
+    from imaging import analyze_images, combine_results
+
+    metrics.increment("analyses")
+    progress(0.05, "Analyzing images")
+    done = []
+
+    def on_result(modality, result):
+        done.append(modality)
+        progress(0.05 + IMAGING_SHARE * len(done) / len(images), f"Analyzed {modality} image")
+
+    with span("analysis.imaging"):
+        imaging = combine_results(analyze_images(images, on_result=on_result,
+                                                 slice_thickness_mm=slice_thickness_mm) if images else {})
+    stones = imaging["stones"]
+    stone_sizes = [stone["size_mm"] for stone in stones]
+    results = {
+        'stone_sizes': stone_sizes,
+        'largest_stone': max(stone_sizes, default=0.0),
+        'stone_count': len(stone_sizes),
+        'stone_locations': [stone["location"] for stone in stones],
+        # Set (or cleared) on every analysis so a stale warning does not linger
+        'slice_thickness_mm': imaging["slice_thickness_mm"],
+        'slice_thickness_assumed': imaging["slice_thickness_assumed"],
+    }
+
+    if lab_report is not None:
+        from lab_reports import extract_lab_results
+
+        progress(0.05 + IMAGING_SHARE, "Reading lab report")
+        with span("analysis.lab_report"):
+            results['lab_results'] = extract_lab_results(lab_report)
+
+    model = get_model()
+    if model is not None:
+        progress(0.9, "Predicting recurrence risk and stone type")
+        with span("analysis.predict"):
+            results['recurrence_risk'], results['stone_type'] = model.predict({**patient_data, **results})
+        results['model_version'] = model.version
+    else:
+        # No trained model yet: the stone type stays unknown and recurrence
+        # gets the rule-based score (same as the batch CLI in main.py)
+        progress(0.9, "Scoring recurrence risk")
+        results['stone_type'] = None
+        results['recurrence_risk'] = score_patient(patient_data)
+
+    # Determine if surgery is needed
+    results['surgery_needed'] = results['largest_stone'] > 6 or any(
+        "ureter" in location for location in results['stone_locations']
+    )
+    return results
@@ -0,0 +1,384 @@
+"""Per-page performance benchmark for the Streamlit app.
+
+Each scenario drives one sidebar page of app.py headlessly with Streamlit's
+AppTest harness: it sets widget values and presses the page's buttons the
+way a user would, one rerun per step. For every step it records
+
+- wall time of the rerun (median over --repeat runs),
+- size of the serialized output sent to the browser (ForwardMsg bytes),
+- traced allocation peak above what was allocated before the step, and
+  blocks still allocated after it (a separate run under tracemalloc, since
+  tracing slows everything down),
+
+and peak RSS per scenario. Every run, timed or traced, is a fresh process
+with its own scratch data directory, so each one starts cold: nothing is
+imported yet and the st.cache_resource, imaging, lab report, figure and
+survival caches are empty. Results are compared with a stored baseline and
+the run fails if any metric regressed beyond its tolerance:
+
+    python -m benchmarks.app_pages                     # compare with the baseline
+    python -m benchmarks.app_pages --update-baseline   # record a new baseline
+
+Baselines are machine-specific; record one on the machine that runs the check.
+"""
+import argparse
+import gc
+import io
+import json
+import multiprocessing
+import os
+import platform
+import resource
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+from concurrent.futures import ProcessPoolExecutor
+from datetime import date, timedelta
+
+import streamlit
+from streamlit.testing.v1 import AppTest, app_test
+from streamlit.testing.v1.local_script_runner import LocalScriptRunner
+
+APP_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "app.py")
+BASELINE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "app_pages_baseline.json")
+
+PATIENT_NAME = "Jane Doe"
+PATIENT_ID = "benchmark-patient"
+
+COHORT_PATIENTS = 20_000
+
+# Scenarios for pages served only in NEPHROCARE_CLINICIAN_MODE
+CLINICIAN_SCENARIOS = {"cohort"}
+
+# A metric regresses when it exceeds the baseline by both the relative and the absolute margin
+TOLERANCES = {
+    "wall_ms": (0.5, 25.0),
+    "output_kb": (0.1, 2.0),
+    "alloc_peak_kb": (0.5, 512.0),
+    "alloc_blocks": (0.5, 5000),
+    "peak_rss_mb": (0.2, 25.0),
+}
+
+RUN_TIMEOUT = 60
+
+_output_bytes = [0]
+
+
+class _MeasuringScriptRunner(LocalScriptRunner):
+    # Records the serialized size of everything a run sends to the browser
+    def run(self, *args, **kwargs):
+        tree = super().run(*args, **kwargs)
+        _output_bytes[0] = sum(msg.ByteSize() for msg in self.forward_msgs())
+        return tree
+
+
+class Recorder:
+    """Runs a scenario's steps and records per-step metrics."""
+
+    def __init__(self, traced):
+        self.at = AppTest.from_file(APP_PATH, default_timeout=RUN_TIMEOUT)
+        self.traced = traced
+        self.steps = {}
+
+    def step(self, name, action=None):
+        """Apply `action(at)` (set widgets, click buttons), then rerun the app."""
+        if action is not None:
+            action(self.at)
+        if self.traced:
+            # Collect first so the block count reflects this step, not leftover garbage
+            gc.collect()
+            tracemalloc.reset_peak()
+            traced_before = tracemalloc.get_traced_memory()[0]
+            blocks = sys.getallocatedblocks()
+        start = time.perf_counter()
+        self.at.run()
+        elapsed = time.perf_counter() - start
+        if self.at.exception:
+            raise RuntimeError(f"step '{name}' raised: {self.at.exception[0].message}")
+        metrics = {"wall_ms": elapsed * 1000, "output_kb": _output_bytes[0] / 1024}
+        if self.traced:
+            metrics["alloc_peak_kb"] = (tracemalloc.get_traced_memory()[1] - traced_before) / 1024
+            gc.collect()
+            metrics["alloc_blocks"] = sys.getallocatedblocks() - blocks
+        self.steps[name] = metrics
+
+
+def _widget(elements, label):
+    for element in elements:
+        if element.label == label:
+            return element
+    raise LookupError(f"No widget labelled {label!r}")
+
+
+def _go_to(page):
+    return lambda at: at.sidebar.radio[0].set_value(page)
+
+
+def _session_id(at):
+    # The app keeps its session id in session state, restored from a cookie (session.py)
+    return at.session_state["session_id"]
+
+
+def _seed_patient(at, **extra):
+    from session_store import get_session_store
+
+    patient = get_session_store().get(_session_id(at))
+    patient.update({
+        "patient_id": PATIENT_ID, "name": PATIENT_NAME, "age": 52, "gender": "Male", "weight": 84, "height": 178,
+        "previous_operations": 2, "last_operation": date.today() - timedelta(days=200),
+        "family_history": "One relative", "water_intake": 5, "diet": "High-protein", **extra,
+    })
+    return patient
+
+
+def _synthetic_scan(seed, size=1024):
+    """A PNG scan with a few bright, stone-like blobs on a noisy background."""
+    import cv2
+    import numpy as np
+
+    rng = np.random.default_rng(seed)
+    image = rng.normal(60, 12, (size, size)).clip(0, 255).astype(np.uint8)
+    for _ in range(3):
+        center = tuple(int(c) for c in rng.integers(size // 4, 3 * size // 4, 2))
+        axes = tuple(int(a) for a in rng.integers(8, 30, 2))
+        cv2.ellipse(image, center, axes, 0, 0, 360, 220, -1)
+    return cv2.imencode(".png", image)[1].tobytes()
+
+
+# --- Scenarios -----------------------------------------------------------------
+
+def patient_input(rec):
+    rec.step("first load")
+    rec.step("enter name", lambda at: _widget(at.text_input, "Full Name").input(PATIENT_NAME))
+    rec.step("set age", lambda at: _widget(at.number_input, "Age").set_value(52))
+    rec.step("change diet", lambda at: _widget(at.selectbox, "Primary diet type").set_value("High-protein"))
+    rec.step("tick hypertension", lambda at: _widget(at.checkbox, "Hypertension").check())
+    rec.step("move water slider", lambda at: _widget(at.slider, "Daily water intake (glasses)").set_value(9))
+
+
+def report_analysis(rec):
+    from analysis import JOB_NAME, run_analysis
+    from ingest import ingest
+    from jobs import get_manager
+
+    rec.step("first load")
+    rec.step("open page", _go_to("Report Analysis"))
+    rec.step("analyze without uploads", lambda at: _widget(at.button, "Analyze Reports").click())
+
+    # AppTest cannot fill file uploaders, so submit exactly what the button would
+    images = {modality: ingest(io.BytesIO(_synthetic_scan(seed)), f"{modality}.png", "image/png")
+              for seed, modality in enumerate(["xray", "ct"])}
+
+    def submit(at):
+        patient = _seed_patient(at)
+        get_manager().submit(_session_id(at), JOB_NAME, run_analysis, dict(patient), images)
+
+    rec.step("analysis polled to completion", submit)
+    if not rec.at.success:
+        raise RuntimeError(f"analysis did not complete: {[error.value for error in rec.at.error]}")
+    rec.step("rerun after analysis")
+
+
+def results(rec):
+    rec.step("first load")
+
+    def seed(at):
+        _seed_patient(
+            at, stone_sizes=[4.2, 7.5, 2.1], stone_locations=["Left kidney", "Right ureter", "Left kidney"],
+            largest_stone=7.5, stone_count=3, stone_type="Calcium Oxalate", recurrence_risk=62,
+            surgery_needed=True, lab_results={"urine_calcium": 310.0, "urine_citrate": 280.0, "urine_ph": 5.3},
+            analysis_complete=True,
+        )
+        at.sidebar.radio[0].set_value("Results & Recommendations")
+
+    rec.step("open page", seed)
+    rec.step("rerun")
+
+
+def doctor_connect(rec):
+    rec.step("first load")
+    rec.step("open page", _go_to("Doctor Connect"))
+    rec.step("filter specialty", lambda at: at.multiselect(key="doctor_specialties").select(
+        at.multiselect(key="doctor_specialties").options[0]))
+    rec.step("minimum rating", lambda at: at.slider(key="doctor_min_rating").set_value(4.0))
+    rec.step("next page", lambda at: at.number_input(key="doctor_page").increment())
+    rec.step("book consultation", lambda at: next(
+        button for button in at.button if (button.key or "").startswith("doc_")).click())
+
+
+def health_tracker(rec):
+    from tracker_store import get_store
+
+    # Two years of history for the patient the page will show
+    store = get_store()
+    today = date.today()
+    for day in range(730):
+        store.add_entry(PATIENT_ID, today - timedelta(days=day + 1), water_intake=4 + day % 7,
+                        pain_level=day % 4, medication_taken=day % 3 != 0, recurrence_risk=40 + day % 25)
+    store.flush()
+
+    rec.step("first load")
+
+    def open_page(at):
+        _seed_patient(at, recurrence_risk=55)
+        at.sidebar.radio[0].set_value("Health Tracker")
+
+    rec.step("open page", open_page)
+    rec.step("log water", lambda at: at.slider(key="daily_water").set_value(8))
+    rec.step("save daily entry", lambda at: _widget(at.button, "Save Daily Entry").click())
+    rec.step("weekly view", lambda at: at.radio(key="dashboard_view").set_value("Weekly"))
+    rec.step("risk trends", lambda at: at.radio(key="dashboard_chart").set_value("Risk Trends"))
+    rec.step("all time", lambda at: at.radio(key="dashboard_view").set_value("All time"))
+
+
+def cohort(rec):
+    from analysis import STONE_TYPES
+    from cohort_store import get_cohort_store
+
+    # A clinic-sized cohort with spread-out risks, stone types and log dates
+    today = date.today()
+    get_cohort_store().upsert_many(
+        (f"{i:06d}", {"name": f"Patient {i:06d}", "recurrence_risk": i * 37 % 101,
+                      "stone_type": STONE_TYPES[i % len(STONE_TYPES)], "largest_stone": 1 + i * 7 % 140 / 10,
+                      "surgery_needed": i % 3 == 0, "last_log": today - timedelta(days=i % 730)})
+        for i in range(COHORT_PATIENTS))
+
+    rec.step("first load")
+    rec.step("open page", _go_to("Clinician Cohort"))
+    if not rec.at.dataframe:
+        raise RuntimeError("the cohort table was not shown; is NEPHROCARE_CLINICIAN_MODE set?")
+    rec.step("risk range", lambda at: at.select_slider(key="cohort_risk").set_range(
+        at.select_slider(key="cohort_risk").options[5], at.select_slider(key="cohort_risk").options[-1]))
+    rec.step("filter stone type", lambda at: at.multiselect(key="cohort_stone_types").select(
+        at.multiselect(key="cohort_stone_types").options[0]))
+    rec.step("name prefix", lambda at: at.text_input(key="cohort_prefix").input("Patient 01"))
+    rec.step("sort by stone size", lambda at: at.selectbox(key="cohort_sort").set_value("Largest stone"))
+    rec.step("next page", lambda at: at.number_input(key="cohort_page").increment())
+
+
+SCENARIOS = {
+    "patient_input": patient_input,
+    "report_analysis": report_analysis,
+    "results": results,
+    "doctor_connect": doctor_connect,
+    "health_tracker": health_tracker,
+    "cohort": cohort,
+}
+
+
+def run_scenario(name, traced):
+    """Run one scenario once in this process and return its per-step metrics and peak RSS."""
+    from workers import shutdown_pool
+
+    app_test.LocalScriptRunner = _MeasuringScriptRunner
+    if traced:
+        tracemalloc.start()
+    try:
+        rec = Recorder(traced)
+        SCENARIOS[name](rec)
+    finally:
+        if traced:
+            tracemalloc.stop()
+        # Image analysis may have started worker processes of our own
+        shutdown_pool()
+    return {"peak_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, "steps": rec.steps}
+
+
+def _run_fresh(name, traced, data_dir):
+    # A new process and data directory per run, so no run sees caches another one warmed
+    os.environ["NEPHROCARE_DATA_DIR"] = data_dir
+    os.environ["NEPHROCARE_CLINICIAN_MODE"] = "1" if name in CLINICIAN_SCENARIOS else "0"
+    with ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context("spawn")) as pool:
+        return pool.submit(run_scenario, name, traced).result()
+
+
+def measure(name, repeat, tmp):
+    """Run a scenario `repeat` times, then once under tracemalloc, and return its metrics."""
+    runs = [_run_fresh(name, run == repeat, os.path.join(tmp, name, str(run))) for run in range(repeat + 1)]
+    timed, traced = runs[:-1], runs[-1]
+    steps = {}
+    for step, metrics in traced["steps"].items():
+        steps[step] = {
+            "wall_ms": round(statistics.median(run["steps"][step]["wall_ms"] for run in timed), 2),
+            "output_kb": round(timed[-1]["steps"][step]["output_kb"], 2),
+            "alloc_peak_kb": round(metrics["alloc_peak_kb"], 1),
+            "alloc_blocks": metrics["alloc_blocks"],
+        }
+    return {"peak_rss_mb": round(max(run["peak_rss_mb"] for run in timed), 1), "steps": steps}
+
+
+def regressions(results, baseline):
+    """Return a description of every metric worse than the baseline allows."""
+    found = []
+
+    def check(label, metric, value, base):
+        relative, absolute = TOLERANCES[metric]
+        if value > base * (1 + relative) and value - base > absolute:
+            found.append(f"{label} {metric}: {value:g} (baseline {base:g})")
+
+    for name, scenario in results.items():
+        base = baseline.get(name)
+        if base is None:
+            continue
+        check(name, "peak_rss_mb", scenario["peak_rss_mb"], base["peak_rss_mb"])
+        for step, metrics in scenario["steps"].items():
+            for metric, value in metrics.items():
+                if metric in base["steps"].get(step, {}):
+                    check(f"{name} / {step}", metric, value, base["steps"][step][metric])
+    return found
+
+
+def _print_results(results):
+    print(f"{'scenario / step':<48}{'wall ms':>10}{'out KB':>9}{'alloc KB':>10}{'blocks':>9}")
+    for name, scenario in results.items():
+        print(f"{name} (peak RSS {scenario['peak_rss_mb']:.0f} MB)")
+        for step, metrics in scenario["steps"].items():
+            print(f"  {step:<46}{metrics['wall_ms']:>10.1f}{metrics['output_kb']:>9.1f}"
+                  f"{metrics['alloc_peak_kb']:>10.0f}{metrics['alloc_blocks']:>9}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--scenario", action="append", choices=list(SCENARIOS),
+                        help="scenario to run (repeatable; default: all)")
+    parser.add_argument("--repeat", type=int, default=5, help="timed runs per scenario")
+    parser.add_argument("--baseline", default=BASELINE_PATH)
+    parser.add_argument("--update-baseline", action="store_true", help="store these results as the baseline")
+    args = parser.parse_args(argv)
+
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        for name in args.scenario or SCENARIOS:
+            results[name] = measure(name, args.repeat, tmp)
+    _print_results(results)
+
+    if args.update_baseline:
+        stored = {}
+        if os.path.exists(args.baseline):
+            with open(args.baseline, encoding="utf-8") as f:
+                stored = json.load(f).get("scenarios", {})
+        stored.update(results)
+        with open(args.baseline, "w", encoding="utf-8") as f:
+            json.dump({"environment": {"python": platform.python_version(), "streamlit": streamlit.__version__,
+                                       "platform": platform.platform(), "cpus": os.cpu_count()},
+                       "scenarios": stored}, f, indent=2)
+            f.write("\n")
+        print(f"Baseline written to {args.baseline}")
+        return 0
+
+    if not os.path.exists(args.baseline):
+        print(f"No baseline at {args.baseline}; run with --update-baseline to record one")
+        return 0
+    with open(args.baseline, encoding="utf-8") as f:
+        found = regressions(results, json.load(f)["scenarios"])
+    if found:
+        print("REGRESSIONS", *found, sep="\n")
+        return 1
+    print("OK (no regressions against the baseline)")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
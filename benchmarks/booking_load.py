@@ -0,0 +1,118 @@
+"""Concurrent booking load test for the appointment scheduler.
+
+Several processes, each with many threads, fire bookings at a small set of
+doctors, days and slots so that most requests collide. Afterwards the store
+is checked for double bookings and for calendar bitmaps that disagree with
+the appointment table. Exits non-zero if any conflict is found.
+
+    python -m benchmarks.booking_load --processes 4 --threads 16 --bookings 4000
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from datetime import date, datetime, timedelta
+
+from scheduling import SLOT_TIMES, Scheduler, SlotUnavailable
+
+# Bookings are for the coming days, evaluated as if it were this moment
+NOW = datetime.combine(date.today(), datetime.min.time())
+
+
+def _worker(path, threads, bookings, doctors, days, seed):
+    scheduler = Scheduler(path)
+    rng = random.Random(seed)
+    requests = [(rng.randrange(doctors), NOW.date() + timedelta(days=rng.randrange(days)), rng.choice(SLOT_TIMES))
+                for _ in range(bookings)]
+
+    def attempt(request):
+        doctor_id, day, slot_time = request
+        start = time.perf_counter()
+        try:
+            scheduler.book(doctor_id, day, slot_time, f"patient-{seed}", now=NOW)
+            booked = True
+        except SlotUnavailable:
+            booked = False
+        return booked, time.perf_counter() - start
+
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        outcomes = list(pool.map(attempt, requests))
+    return sum(booked for booked, _ in outcomes), [latency for _, latency in outcomes]
+
+
+def check_store(scheduler):
+    """Return a list of problems found in the store (empty if consistent)."""
+    conn = scheduler._connection()
+    problems = []
+    duplicates = conn.execute(
+        "SELECT doctor_id, day, slot, COUNT(*) FROM appointment GROUP BY doctor_id, day, slot HAVING COUNT(*) > 1"
+    ).fetchall()
+    problems += [f"double booking: {row}" for row in duplicates]
+
+    expected = Counter()
+    for doctor_id, day, slot in conn.execute("SELECT doctor_id, day, slot FROM appointment"):
+        expected[(doctor_id, day)] |= 1 << slot
+    for doctor_id, day, booked in conn.execute("SELECT doctor_id, day, booked FROM calendar"):
+        if booked != expected.get((doctor_id, day), 0):
+            problems.append(f"bitmap mismatch for doctor {doctor_id} on {day}: {booked:b} != {expected[(doctor_id, day)]:b}")
+    return problems
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--processes", type=int, default=4)
+    parser.add_argument("--threads", type=int, default=16, help="threads per process")
+    parser.add_argument("--bookings", type=int, default=4000, help="total booking attempts")
+    parser.add_argument("--doctors", type=int, default=20)
+    parser.add_argument("--days", type=int, default=14)
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "scheduling.db")
+        scheduler = Scheduler(path)
+        per_process = args.bookings // args.processes
+
+        start = time.perf_counter()
+        with ProcessPoolExecutor(max_workers=args.processes) as pool:
+            futures = [pool.submit(_worker, path, args.threads, per_process, args.doctors, args.days, seed)
+                       for seed in range(args.processes)]
+            results = [future.result() for future in futures]
+        elapsed = time.perf_counter() - start
+
+        succeeded = sum(booked for booked, _ in results)
+        latencies = sorted(latency for _, process_latencies in results for latency in process_latencies)
+        stored = scheduler._connection().execute("SELECT COUNT(*) FROM appointment").fetchone()[0]
+        capacity = args.doctors * args.days * len(SLOT_TIMES)
+
+        lookups = 2000
+        lookup_start = time.perf_counter()
+        for i in range(lookups):
+            scheduler.next_free_slot(i % args.doctors, now=NOW)
+        lookup_ms = (time.perf_counter() - lookup_start) / lookups * 1000
+
+        problems = check_store(scheduler)
+        if stored != succeeded:
+            problems.append(f"{succeeded} bookings reported success but {stored} are stored")
+
+    attempts = per_process * args.processes
+    print(f"{attempts} booking attempts from {args.processes} processes x {args.threads} threads in {elapsed:.2f}s "
+          f"({attempts / elapsed:.0f}/s)")
+    print(f"{succeeded} booked, {attempts - succeeded} rejected, {capacity} slots available")
+    print(f"booking latency p50 {latencies[len(latencies) // 2] * 1000:.2f} ms, "
+          f"p99 {latencies[int(len(latencies) * 0.99)] * 1000:.2f} ms")
+    print(f"next_free_slot: {lookup_ms:.3f} ms per query")
+    if problems:
+        print(f"FAILED: {len(problems)} conflict(s)")
+        for problem in problems[:20]:
+            print(f"  {problem}")
+        return 1
+    print("OK: no conflicting bookings")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,114 @@
+"""Clinician cohort store benchmark: load, re-scoring, paged queries and histograms.
+
+Fills a scratch cohort with synthetic patients, then times a cold load from
+SQLite, paged queries for the filters and sorts the Clinician Cohort page
+offers, histograms from the maintained counts and by scanning, and single
+patient re-scores. Exits non-zero if the maintained histogram ever disagrees
+with a full recount or a paged query's p50 is over QUERY_BUDGET_MS.
+
+    python -m benchmarks.cohort_queries --patients 100000
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+from datetime import date, timedelta
+
+import numpy as np
+
+from analysis import STONE_TYPES
+from cohort_store import CohortStore
+
+QUERY_BUDGET_MS = 50.0
+
+QUERIES = {
+    "everyone by risk": {},
+    "uric acid, risk 50-79, by stone size": dict(min_risk=50, max_risk=79, stone_types=["Uric Acid"],
+                                                 sort="largest_stone"),
+    "surgery, by last log": dict(surgery=True, sort="last_log"),
+    "name prefix, by name": dict(prefix="patient 01", sort="name", descending=False),
+    "page 200 by risk": dict(offset=200 * 50),
+}
+
+
+def _rows(n, seed):
+    rng = np.random.default_rng(seed)
+    risks = rng.integers(0, 101, n)
+    stones = rng.integers(-1, len(STONE_TYPES), n)
+    largest = rng.uniform(1, 15, n).round(1)
+    surgery = rng.random(n) < 0.3
+    days = rng.integers(0, 730, n)
+    start = date.today() - timedelta(days=730)
+    for i in range(n):
+        yield f"{i:06d}", {
+            "name": f"Patient {i:06d}", "recurrence_risk": int(risks[i]), "stone_type": STONE_TYPES[stones[i]] if stones[i] >= 0 else None,
+            "largest_stone": float(largest[i]), "surgery_needed": bool(surgery[i]),
+            "last_log": start + timedelta(days=int(days[i])),
+        }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--patients", type=int, default=100_000)
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--rescores", type=int, default=2000)
+    args = parser.parse_args(argv)
+
+    failed = False
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "cohort.db")
+        store = CohortStore(path)
+        start = time.perf_counter()
+        store.upsert_many(_rows(args.patients, seed=0))
+        print(f"bulk load: {args.patients} patients in {time.perf_counter() - start:.2f}s")
+        store.close()
+
+        start = time.perf_counter()
+        store = CohortStore(path)
+        print(f"cold start: loaded {len(store)} patients from SQLite in {(time.perf_counter() - start) * 1000:.0f} ms")
+
+        for name, query in QUERIES.items():
+            times = []
+            for i in range(args.repeat):
+                start = time.perf_counter()
+                total, rows = store.query(**query)
+                times.append(time.perf_counter() - start)
+            first, p50 = times[0] * 1000, np.median(times) * 1000
+            print(f"query {name}: {total} matches, first {first:.1f} ms, p50 {p50:.2f} ms")
+            if p50 > QUERY_BUDGET_MS:
+                print(f"FAILED: p50 over the {QUERY_BUDGET_MS} ms budget")
+                failed = True
+
+        for name, query in [("maintained counts", dict(min_risk=50, max_risk=79, surgery=True)),
+                            ("row scan (unaligned range)", dict(min_risk=55, max_risk=79, surgery=True))]:
+            start = time.perf_counter()
+            for _ in range(args.repeat):
+                store.histogram(**query)
+            print(f"histogram from {name}: {(time.perf_counter() - start) / args.repeat * 1000:.3f} ms")
+
+        # Re-score random patients one at a time, as the app does when an analysis completes
+        rng = np.random.default_rng(1)
+        start = time.perf_counter()
+        for i in rng.integers(0, args.patients, args.rescores):
+            store.upsert(f"{i:06d}", recurrence_risk=int(rng.integers(0, 101)),
+                         stone_type=STONE_TYPES[int(rng.integers(0, len(STONE_TYPES)))])
+        elapsed = time.perf_counter() - start
+        print(f"re-score: {args.rescores} single-patient updates, {elapsed / args.rescores * 1000:.2f} ms each")
+
+        maintained = store.histogram()
+        # A name prefix every patient matches forces the scan path
+        scanned = store.histogram(prefix="patient")
+        if not np.array_equal(maintained, scanned):
+            print("FAILED: maintained histogram counts differ from a full recount")
+            failed = True
+        store.close()
+
+    if failed:
+        return 1
+    print("OK")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,147 @@
+"""CT volume benchmark: assembly, 3D segmentation time and peak memory by slice count.
+
+Writes synthetic abdominal CT studies (Hounsfield units, with a spine, ribs
+running the length of the study and three spherical stones of known size)
+as .npy arrays and as zips of PNG slices, then analyzes each in a fresh
+process. Slices are --thickness mm apart: zips record it in their study.json
+and .npy studies, which cannot, pass it to analyze_volume(). Exits non-zero if a stone is missed, mis-sized by more than
+SIZE_TOLERANCE_MM or misplaced, if anything else is reported as a stone, or
+if peak memory grows by more than RSS_GROWTH_MB from the smallest study to
+the largest.
+
+    python -m benchmarks.ct_volume --slices 100 400 --size 512
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import resource
+import sys
+import tempfile
+import time
+import zipfile
+from concurrent.futures import ProcessPoolExecutor
+
+import cv2
+import numpy as np
+
+SIZE_TOLERANCE_MM = 1.0
+RSS_GROWTH_MB = 32.0
+
+# (diameter mm, x as a fraction of the width, depth as a fraction of the study, expected location)
+STONES = [
+    (4.0, 0.35, 0.2, "Right kidney upper pole"),
+    (7.0, 0.65, 0.4, "Left kidney lower pole"),
+    (11.0, 0.4, 0.65, "Right ureter"),
+]
+STONE_HU = 900
+
+
+def _slice(index, slices, size, mm_per_pixel, thickness, rng):
+    y, x = np.ogrid[:size, :size]
+    image = np.full((size, size), -1000.0)
+    body = ((x - size / 2) / (size * 0.45)) ** 2 + ((y - size / 2) / (size * 0.35)) ** 2 <= 1
+    image[body] = 40
+    # Spine, and two ribs that run through every slice
+    image[(x - size / 2) ** 2 + (y - size * 0.7) ** 2 <= (20 / mm_per_pixel) ** 2] = 700
+    for rib_x in (0.12, 0.88):
+        image[(x - size * rib_x) ** 2 + (y - size * 0.5) ** 2 <= (4 / mm_per_pixel) ** 2] = 700
+    for diameter, fx, fz, _ in STONES:
+        dz = (index - fz * slices) * thickness
+        radius_sq = (diameter / 2) ** 2 - dz ** 2
+        if radius_sq > 0:
+            stone = ((x - fx * size) * mm_per_pixel) ** 2 + ((y - size * 0.45) * mm_per_pixel) ** 2 <= radius_sq
+            image[stone] = STONE_HU
+    return (image + rng.normal(0, 15, image.shape)).astype(np.int16)
+
+
+def write_study(path, fmt, slices, size, thickness=1.0, seed=0):
+    """Write a synthetic study as a .npy array or a zip of PNG slices, one slice at a time."""
+    from ct_volume import hounsfield_to_uint8
+    from imaging import FIELD_OF_VIEW_MM
+
+    rng = np.random.default_rng(seed)
+    mm_per_pixel = FIELD_OF_VIEW_MM["ct"] / size
+    if fmt == "npy":
+        with open(path, "wb") as f:
+            np.lib.format.write_array_header_1_0(f, {"descr": "<i2", "fortran_order": False,
+                                                     "shape": (slices, size, size)})
+            for index in range(slices):
+                f.write(_slice(index, slices, size, mm_per_pixel, thickness, rng).tobytes())
+    else:
+        with zipfile.ZipFile(path, "w", zipfile.ZIP_STORED) as archive:
+            archive.writestr("study/study.json", json.dumps({"slice_thickness_mm": thickness}))
+            for index in range(slices):
+                image = hounsfield_to_uint8(_slice(index, slices, size, mm_per_pixel, thickness, rng))
+                archive.writestr(f"study/slice{index}.png", cv2.imencode(".png", image)[1].tobytes())
+
+
+def _analyze(handle, thickness):
+    from ct_volume import analyze_volume
+
+    start = time.perf_counter()
+    result = analyze_volume(handle, thickness)
+    elapsed = time.perf_counter() - start
+    return result, elapsed, resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def check(result, thickness):
+    """Return a description of every way `result` differs from the synthetic study."""
+    problems = []
+    if result["slice_thickness_mm"] != thickness or result["slice_thickness_assumed"]:
+        problems.append(f"slice thickness taken as {result['slice_thickness_mm']} mm, expected {thickness} mm")
+    found = sorted(result["stones"], key=lambda stone: stone["size_mm"])
+    if len(found) != len(STONES):
+        return [f"found {len(found)} stones, expected {len(STONES)}: {found}"]
+    for (diameter, _, _, location), stone in zip(STONES, found):
+        if abs(stone["size_mm"] - diameter) > SIZE_TOLERANCE_MM:
+            problems.append(f"{diameter} mm stone measured as {stone['size_mm']} mm")
+        if stone["location"] != location:
+            problems.append(f"{diameter} mm stone placed in {stone['location']}, expected {location}")
+    return problems
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--slices", type=int, nargs="+", default=[100, 400])
+    parser.add_argument("--size", type=int, default=512, help="slice width and height in pixels")
+    parser.add_argument("--thickness", type=float, default=1.5, help="distance between slices in mm")
+    parser.add_argument("--format", choices=["npy", "zip"], action="append", help="default: both")
+    args = parser.parse_args(argv)
+
+    failures = []
+    with tempfile.TemporaryDirectory() as tmp:
+        # Keep the benchmark's blobs out of the real data directory (workers inherit this)
+        os.environ["NEPHROCARE_DATA_DIR"] = tmp
+        from ingest import ingest
+
+        for fmt in args.format or ["npy", "zip"]:
+            peaks = []
+            for slices in sorted(args.slices):
+                path = os.path.join(tmp, f"study.{fmt}")
+                write_study(path, fmt, slices, args.size, args.thickness)
+                with open(path, "rb") as f:
+                    handle = ingest(f, os.path.basename(path))
+                os.remove(path)
+                # A fresh process per study, so peak RSS is this study's alone
+                with ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context("spawn")) as pool:
+                    # Only the zip says how far apart its slices are
+                    thickness = args.thickness if fmt == "npy" else None
+                    result, elapsed, peak_mb = pool.submit(_analyze, handle, thickness).result()
+                peaks.append(peak_mb)
+                print(f"{fmt} {slices} x {args.size}x{args.size} ({handle.size / 1e6:.0f} MB): {elapsed:.2f}s "
+                      f"({elapsed / slices * 1000:.1f} ms/slice), peak RSS {peak_mb:.0f} MB, stones "
+                      + ", ".join(f"{stone['size_mm']} mm ({stone['location']})" for stone in result["stones"]))
+                failures += [f"{fmt} {slices} slices: {problem}" for problem in check(result, args.thickness)]
+            if peaks[-1] - peaks[0] > RSS_GROWTH_MB:
+                failures.append(f"{fmt}: peak RSS grew from {peaks[0]:.0f} MB to {peaks[-1]:.0f} MB")
+
+    if failures:
+        print("FAILED", *failures, sep="\n")
+        return 1
+    print("OK")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,135 @@
+"""Lab report extraction benchmark.
+
+Generates synthetic multi-page lab reports (Flate-compressed PDF text
+layers), then times extraction page by page in-process, on the process pool
+and from the analyte cache, and checks the extracted values against the ones
+written into each report. Exits non-zero on a mismatch.
+
+    python -m benchmarks.lab_extraction --reports 8 --pages 40
+"""
+import argparse
+import io
+import os
+import random
+import sys
+import tempfile
+import time
+import zlib
+
+# Readings written into every report:
+# (line template, field, conversion to the extracted unit, value range, decimals)
+READINGS = [
+    ("24-hour urine volume {} mL/24h", "urine_volume", lambda v: v / 1000, (900, 3200), 0),
+    ("Calcium, 24h urine {} mg/24h", "urine_calcium", lambda v: v, (80, 400), 0),
+    ("Oxalate (urine) {} mmol/day", "urine_oxalate", lambda v: v * 88.02, (0.2, 0.8), 2),
+    ("Citrate, urine {} mg/day", "urine_citrate", lambda v: v, (150, 900), 0),
+    ("Uric acid, urine {} mg/day", "urine_uric_acid", lambda v: v, (300, 1000), 0),
+    ("Urine pH {}", "urine_ph", lambda v: v, (4.8, 7.4), 1),
+    ("Serum calcium {} mg/dL", "serum_calcium", lambda v: v, (8.0, 11.0), 1),
+    ("Serum uric acid {} umol/L", "serum_uric_acid", lambda v: v * 168.1 / 10000, (200, 500), 0),
+]
+
+FILLER = ["Hemoglobin {:.1f} g/dL", "White cell count {:.1f} x10^9/L", "Sodium {:.0f} mmol/L",
+          "Potassium {:.1f} mmol/L", "Creatinine {:.2f} mg/dL", "Glucose (fasting) {:.0f} mg/dL"]
+
+
+def _escape(text):
+    return text.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)")
+
+
+def write_pdf(pages):
+    """Return a minimal PDF whose pages show the given lists of text lines."""
+    objects = [b"<< /Type /Catalog /Pages 2 0 R >>", None, b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>"]
+    kids = []
+    for lines in pages:
+        content = ["BT /F1 10 Tf 14 TL 50 780 Td"] + [f"({_escape(line)}) Tj T*" for line in lines] + ["ET"]
+        stream = zlib.compress("\n".join(content).encode("latin-1"))
+        objects.append(b"<< /Length %d /Filter /FlateDecode >>\nstream\n" % len(stream) + stream + b"\nendstream")
+        objects.append(b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] "
+                       b"/Resources << /Font << /F1 3 0 R >> >> /Contents %d 0 R >>" % (len(objects)))
+        kids.append(len(objects))
+    objects[1] = b"<< /Type /Pages /Kids [%s] /Count %d >>" % (
+        b" ".join(b"%d 0 R" % kid for kid in kids), len(kids))
+
+    out = io.BytesIO()
+    out.write(b"%PDF-1.4\n")
+    offsets = []
+    for number, body in enumerate(objects, start=1):
+        offsets.append(out.tell())
+        out.write(b"%d 0 obj\n" % number + body + b"\nendobj\n")
+    xref = out.tell()
+    out.write(b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1))
+    out.writelines(b"%010d 00000 n \n" % offset for offset in offsets)
+    out.write(b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(objects) + 1, xref))
+    return out.getvalue()
+
+
+def synthetic_report(pages, rng):
+    """Return (pdf bytes, expected analytes) for one report."""
+    page_lines = [[f"Patient lab report - page {page + 1} of {pages}"]
+                  + [rng.choice(FILLER).format(rng.uniform(1, 150)) for _ in range(50)]
+                  for page in range(pages)]
+    expected = {}
+    readings_page = page_lines[rng.randrange(pages)]
+    for template, field, convert, (low, high), decimals in READINGS:
+        value = round(rng.uniform(low, high), decimals)
+        readings_page.insert(rng.randrange(1, len(readings_page)), template.format(value))
+        expected[field] = round(convert(value), 2)
+    return write_pdf(page_lines), expected
+
+
+def _timed(fn, *args, **kwargs):
+    start = time.perf_counter()
+    result = fn(*args, **kwargs)
+    return result, time.perf_counter() - start
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--reports", type=int, default=8)
+    parser.add_argument("--pages", type=int, default=40, help="pages per report")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        # Keep the benchmark's blobs out of the real data directory (workers inherit this)
+        os.environ["NEPHROCARE_DATA_DIR"] = tmp
+        from ingest import ingest
+        from lab_reports import _result_cache, extract_lab_results, extract_text
+        from workers import MAX_WORKERS, get_pool
+
+        rng = random.Random(args.seed)
+        reports = []
+        for index in range(args.reports):
+            data, expected = synthetic_report(args.pages, rng)
+            reports.append((ingest(io.BytesIO(data), f"report-{index}.pdf", "application/pdf"), expected))
+        total_mb = sum(handle.size for handle, _ in reports) / 1e6
+        print(f"{args.reports} reports x {args.pages} pages ({total_mb:.1f} MB), {MAX_WORKERS} workers")
+
+        # Start the workers up front so pool start-up isn't charged to the first report
+        get_pool().submit(int).result()
+
+        serial = parallel = cached = 0.0
+        failures = []
+        for handle, expected in reports:
+            serial += _timed(extract_text, handle, parallel=False)[1]
+            parallel += _timed(extract_text, handle)[1]
+            results = extract_lab_results(handle)
+            _, hit = _timed(extract_lab_results, handle)
+            cached += hit
+            if results != expected:
+                failures.append(f"{handle.name}: got {results}, expected {expected}")
+
+        for label, elapsed in [("serial", serial), ("parallel", parallel), ("cached", cached)]:
+            print(f"{label:>8}: {elapsed / args.reports * 1000:8.2f} ms/report")
+        print(f"cache hits: {_result_cache.hits}, misses: {_result_cache.misses}")
+
+    if failures:
+        print("FAILED", *failures, sep="\n")
+        return 1
+    print("OK")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
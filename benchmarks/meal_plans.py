@@ -0,0 +1,104 @@
+"""Meal plan optimizer benchmark: plan time, cache hits and plan quality.
+
+Plans a day for every stone type under several sets of constraints with a
+cold cache, then again from the cache, and compares each plan's cost with
+the best of a much larger brute-force random sample. Exits non-zero if a
+cold plan takes longer than PLAN_BUDGET_MS, a plan repeats a food or breaks
+its constraints, or the optimizer does worse than the brute-force sample.
+
+    python -m benchmarks.meal_plans --brute-force 200000
+"""
+import argparse
+import statistics
+import sys
+import time
+
+import numpy as np
+
+import diet
+from analysis import STONE_TYPES
+
+PLAN_BUDGET_MS = 250.0
+
+CONSTRAINTS = [
+    {},
+    {"vegetarian": True},
+    {"dairy_free": True},
+    {"vegetarian": True, "dairy_free": True, "exclude": ("Lemonade", "Tofu")},
+]
+
+
+def _cost(plan, stone_type):
+    low, high, weight = diet.targets(stone_type)
+    totals = np.array([plan["totals"][nutrient] for nutrient in diet.NUTRIENTS])
+    return float(diet._cost(totals, low, high, weight))
+
+
+def brute_force(stone_type, samples, constraints, seed=1):
+    """Lowest cost among `samples` random plans without repeated foods."""
+    allowed = diet.allowed_foods(**constraints)
+    groups = [group for _, slot_groups in diet.SLOTS for group in slot_groups]
+    rng = np.random.default_rng(seed)
+    low, high, weight = diet.targets(stone_type)
+    best = np.inf
+    for start in range(0, samples, 50_000):
+        count = min(50_000, samples - start)
+        picks = np.stack([rng.choice(np.flatnonzero(allowed & (diet.GROUPS == group)), count)
+                          for group in groups], axis=1)
+        cost = diet._cost(diet.COMPOSITION[picks].sum(axis=1), low, high, weight)
+        ordered = np.sort(picks, axis=1)
+        cost[(ordered[:, 1:] == ordered[:, :-1]).any(axis=1)] = np.inf
+        best = min(best, float(cost.min()))
+    return best
+
+
+def check_plan(plan, constraints):
+    """Return a description of every way `plan` breaks its constraints."""
+    foods = [row["food"] for row in plan["meals"]]
+    allowed = diet.allowed_foods(**constraints)
+    problems = [f"{food} is not allowed" for food in foods if not allowed[diet.FOOD_INDEX[food]]]
+    if len(set(foods)) != len(foods):
+        problems.append(f"repeats a food: {foods}")
+    return problems
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--brute-force", type=int, default=200_000, help="random plans in the comparison search")
+    parser.add_argument("--repeat", type=int, default=1000, help="cached lookups timed per plan")
+    args = parser.parse_args(argv)
+
+    diet._plan_cache.clear()
+    failures = []
+    cold, warm = [], []
+    for stone_type in [None, *STONE_TYPES]:
+        for constraints in CONSTRAINTS:
+            label = f"{stone_type or 'General'} {constraints or ''}".strip()
+            start = time.perf_counter()
+            plan = diet.meal_plan(stone_type, **constraints)
+            cold.append(elapsed := (time.perf_counter() - start) * 1000)
+            start = time.perf_counter()
+            for _ in range(args.repeat):
+                diet.meal_plan(stone_type, **constraints)
+            warm.append((time.perf_counter() - start) / args.repeat * 1e6)
+
+            cost, best = _cost(plan, stone_type), brute_force(stone_type, args.brute_force, constraints)
+            print(f"{label}: {elapsed:.1f} ms, score {plan['score']}, cost {cost:.4f} "
+                  f"(brute force over {args.brute_force:,} plans: {best:.4f})")
+            if elapsed > PLAN_BUDGET_MS:
+                failures.append(f"{label}: {elapsed:.0f} ms is over the {PLAN_BUDGET_MS:.0f} ms budget")
+            if cost > best + 1e-9:
+                failures.append(f"{label}: optimizer cost {cost:.4f} is worse than brute force {best:.4f}")
+            failures += [f"{label}: {problem}" for problem in check_plan(plan, constraints)]
+
+    print(f"cold plan: median {statistics.median(cold):.1f} ms, max {max(cold):.1f} ms; "
+          f"cached: median {statistics.median(warm):.1f} us")
+    if failures:
+        print("FAILED", *failures, sep="\n")
+        return 1
+    print("OK")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
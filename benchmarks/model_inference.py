@@ -0,0 +1,97 @@
+"""Risk model training, latency and throughput benchmark.
+
+Trains the recurrence-risk and stone-type model on a synthetic labelled
+cohort streamed from a scratch file in chunks, then measures artifact load
+time, single-patient latency (as the app calls it, from a patient_data dict)
+and batch throughput (as the score command calls it, from a DataFrame).
+Exits non-zero if single-patient p50 latency is over 1 ms or if the single
+and batch paths disagree.
+
+    python -m benchmarks.model_inference --train-rows 200000 --batch-rows 1000000
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+from datetime import date
+
+import numpy as np
+
+from main import iter_chunks
+from model_training import synthetic_cohort, train_model
+from risk_model import RiskModel
+
+LATENCY_BUDGET_MS = 1.0
+
+
+def _session_patient(row):
+    # What the Patient Input page leaves in session state: dates and plain Python values
+    patient = {key: (value.item() if hasattr(value, "item") else value) for key, value in row.items()}
+    patient["last_operation"] = date.fromisoformat(patient["last_operation"])
+    patient["lab_results"] = {key: patient.pop(key) for key in list(patient)
+                              if key.startswith("urine_") and patient[key] == patient[key]}
+    return patient
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--train-rows", type=int, default=200_000)
+    parser.add_argument("--chunksize", type=int, default=50_000)
+    parser.add_argument("--epochs", type=int, default=3)
+    parser.add_argument("--single", type=int, default=5000, help="single-patient predictions to time")
+    parser.add_argument("--batch-rows", type=int, default=1_000_000)
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        train_path = os.path.join(tmp, "cohort.csv")
+        synthetic_cohort(args.train_rows, seed=1).to_csv(train_path, index=False)
+
+        start = time.perf_counter()
+        model = train_model(lambda: iter_chunks(train_path, args.chunksize), epochs=args.epochs)
+        elapsed = time.perf_counter() - start
+        print(f"train: {args.train_rows} rows x {args.epochs} epochs in {elapsed:.1f}s "
+              f"({args.train_rows * (args.epochs + 2) / elapsed:,.0f} rows/s over all passes)")
+        print(f"holdout: {model.metadata['holdout']}")
+
+        artifact_path = os.path.join(tmp, "risk_model.npz")
+        model.save(artifact_path)
+        start = time.perf_counter()
+        model = RiskModel.load(artifact_path)
+        print(f"artifact: {os.path.getsize(artifact_path) / 1024:.1f} KiB, "
+              f"loaded in {(time.perf_counter() - start) * 1000:.2f} ms")
+
+    cohort = synthetic_cohort(max(args.batch_rows, 1000), seed=2).drop(columns=["recurred", "stone_type"])
+    patients = [_session_patient(row) for row in cohort.head(1000).to_dict("records")]
+
+    latencies = np.empty(args.single)
+    for i in range(args.single):
+        patient = patients[i % len(patients)]
+        start = time.perf_counter()
+        model.predict(patient)
+        latencies[i] = time.perf_counter() - start
+    p50, p99 = np.percentile(latencies, [50, 99]) * 1000
+    print(f"single patient: p50 {p50:.3f} ms, p99 {p99:.3f} ms over {args.single} calls")
+
+    start = time.perf_counter()
+    batch_risk, batch_types = model.predict_columns(cohort)
+    elapsed = time.perf_counter() - start
+    print(f"batch: {len(cohort)} patients in {elapsed * 1000:.0f} ms ({len(cohort) / elapsed:,.0f} patients/s)")
+
+    mismatches = [i for i, patient in enumerate(patients)
+                  if model.predict(patient) != (batch_risk[i], batch_types[i])]
+    failed = False
+    if mismatches:
+        print(f"FAILED: single and batch predictions differ for {len(mismatches)} patients, e.g. row {mismatches[0]}")
+        failed = True
+    if p50 > LATENCY_BUDGET_MS:
+        print(f"FAILED: single-patient p50 {p50:.3f} ms is over the {LATENCY_BUDGET_MS} ms budget")
+        failed = True
+    if failed:
+        return 1
+    print("OK")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,219 @@
+"""Reminder scheduler benchmark: insert, cancel and delivery throughput at scale.
+
+Schedules --reminders reminders in a scratch database (a fraction of them
+already due, the rest spread over the next year), cancels a random
+fraction one at a time, delivers everything due in batches, then reopens
+the database as a restarted server would and delivers the next two days.
+Finally a smaller set is delivered by email to a local SMTP stand-in, which
+checks that each patient gets their own message and no subject names them.
+Exits non-zero if a due reminder is not delivered exactly once, a cancelled
+one is delivered, reminders are lost across the restart, the heap grows
+past MAX_QUEUED, or single inserts or cancels get more than
+LATENCY_GROWTH times slower from an empty store to a full one.
+
+    python -m benchmarks.reminder_throughput --reminders 1000000
+"""
+import argparse
+import os
+import resource
+import socketserver
+import sys
+import tempfile
+import threading
+import time
+from collections import Counter
+
+import numpy as np
+
+LATENCY_GROWTH = 3.0
+LATENCY_SAMPLES = 2000
+CHUNK = 10_000
+DAY = 86400.0
+
+
+class CountingNotifier:
+    """Counts deliveries per reminder id."""
+
+    def __init__(self):
+        self.counts = Counter()
+        self.batches = 0
+
+    def send(self, reminders):
+        self.batches += 1
+        self.counts.update(reminder.id for reminder in reminders)
+
+
+class _SMTPSink(socketserver.StreamRequestHandler):
+    # Just enough SMTP to accept mail and count the reminder lines in each message
+    def handle(self):
+        self.wfile.write(b"220 sink\r\n")
+        while line := self.rfile.readline():
+            command = line[:4].upper()
+            if command == b"RCPT":
+                self.server.recipient(line)
+                self.wfile.write(b"250 ok\r\n")
+            elif command == b"DATA":
+                self.wfile.write(b"354 go ahead\r\n")
+                body = []
+                while (line := self.rfile.readline()) not in (b".\r\n", b""):
+                    body.append(line)
+                self.server.received(body)
+                self.wfile.write(b"250 queued\r\n")
+            elif command == b"QUIT":
+                self.wfile.write(b"221 bye\r\n")
+                return
+            else:
+                self.wfile.write(b"250 ok\r\n")
+
+
+class SMTPSink(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+
+    def __init__(self):
+        super().__init__(("127.0.0.1", 0), _SMTPSink)
+        self.messages = 0
+        self.lines = 0
+        self.recipients = set()
+        self.named_subjects = 0
+        self._lock = threading.Lock()
+
+    def recipient(self, line):
+        with self._lock:
+            self.recipients.add(line.strip())
+
+    def received(self, body):
+        # Reminder lines follow the blank line after the headers
+        headers, content = body[:body.index(b"\r\n")], body[body.index(b"\r\n") + 1:]
+        with self._lock:
+            self.messages += 1
+            self.lines += sum(1 for line in content if line.strip())
+            self.named_subjects += sum(1 for line in headers if line.startswith(b"Subject:") and b"patient-" in line)
+
+
+def _rss_mb():
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def _latency_us(operation, samples):
+    start = time.perf_counter()
+    for args in samples:
+        operation(*args)
+    return (time.perf_counter() - start) / len(samples) * 1e6
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--reminders", type=int, default=1_000_000)
+    parser.add_argument("--due", type=float, default=0.2, help="fraction already due")
+    parser.add_argument("--cancel", type=float, default=0.1, help="fraction cancelled")
+    parser.add_argument("--smtp-reminders", type=int, default=20_000, help="reminders delivered by email")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args(argv)
+
+    failures = []
+    with tempfile.TemporaryDirectory() as tmp:
+        os.environ["NEPHROCARE_DATA_DIR"] = tmp
+        from reminders import KINDS, MAX_QUEUED, ReminderScheduler, SMTPNotifier
+
+        rng = np.random.default_rng(args.seed)
+        now = time.time()
+        path = os.path.join(tmp, "reminders.db")
+        notifier = CountingNotifier()
+        scheduler = ReminderScheduler(path=path, notifier=notifier)
+        n = args.reminders
+        due = np.where(rng.random(n) < args.due, now - rng.random(n) * DAY, now + rng.random(n) * 365 * DAY)
+        patients = rng.integers(0, max(1, n // 10), n)
+
+        def probe(label):
+            # Single inserts and cancels at the current table size, undone afterwards
+            probes = [(f"probe-{i}", KINDS[0], now + 400 * DAY + i, "probe") for i in range(LATENCY_SAMPLES)]
+            ids = []
+            insert = _latency_us(lambda *row: ids.append(scheduler.add(*row)), probes)
+            cancel = _latency_us(scheduler.cancel, [(reminder_id,) for reminder_id in ids])
+            print(f"{label}: add {insert:.0f} us, cancel {cancel:.0f} us")
+            return insert, cancel
+
+        empty = probe("empty store")
+        ids = []
+        start = time.perf_counter()
+        for first in range(0, n, CHUNK):
+            ids += scheduler.add_many((f"patient-{patients[i]}", KINDS[i % len(KINDS)], float(due[i]),
+                                       "Reminder", None) for i in range(first, min(n, first + CHUNK)))
+        elapsed = time.perf_counter() - start
+        print(f"add_many {n:,}: {elapsed:.2f}s ({n / elapsed:,.0f}/s), peak RSS {_rss_mb():.0f} MB")
+        full = probe(f"{n:,} pending")
+        for name, before, after in zip(["add", "cancel"], empty, full):
+            if after > before * LATENCY_GROWTH:
+                failures.append(f"{name} went from {before:.0f} us to {after:.0f} us per call")
+
+        ids = np.array(ids)
+        cancelled = rng.random(n) < args.cancel
+        start = time.perf_counter()
+        for reminder_id in ids[cancelled]:
+            scheduler.cancel(int(reminder_id))
+        elapsed = time.perf_counter() - start
+        print(f"cancel {cancelled.sum():,}: {elapsed:.2f}s ({cancelled.sum() / elapsed:,.0f}/s)")
+
+        expected = set(ids[(due <= now) & ~cancelled].tolist())
+        start = time.perf_counter()
+        delivered = scheduler.run_pending(now)
+        elapsed = time.perf_counter() - start
+        print(f"delivered {delivered:,} in {notifier.batches} batches: {elapsed:.2f}s "
+              f"({delivered / max(elapsed, 1e-9):,.0f}/s), heap {scheduler.stats()['queued']:,}, "
+              f"peak RSS {_rss_mb():.0f} MB")
+        if scheduler.stats()["queued"] > MAX_QUEUED:
+            failures.append(f"heap holds {scheduler.stats()['queued']:,} entries, over {MAX_QUEUED:,}")
+        if set(notifier.counts) != expected:
+            failures.append(f"delivered {len(set(notifier.counts) & expected):,} of {len(expected):,} due "
+                            f"reminders and {len(set(notifier.counts) - expected):,} others")
+        if notifier.counts and max(notifier.counts.values()) > 1:
+            failures.append("some reminders were delivered more than once")
+        scheduler.close()
+
+        # A restarted server picks up where the last one stopped
+        notifier = CountingNotifier()
+        scheduler = ReminderScheduler(path=path, notifier=notifier)
+        remaining = int((~cancelled).sum()) - len(expected)
+        if scheduler.stats()["pending"] != remaining:
+            failures.append(f"{scheduler.stats()['pending']:,} reminders pending after restart, expected {remaining:,}")
+        if scheduler.run_pending(now):
+            failures.append("reminders were delivered again after restart")
+        later = now + 2 * DAY
+        expected = set(ids[(due > now) & (due <= later) & ~cancelled].tolist())
+        scheduler.run_pending(later)
+        if set(notifier.counts) != expected or (notifier.counts and max(notifier.counts.values()) > 1):
+            failures.append(f"after restart delivered {len(notifier.counts):,} reminders, expected {len(expected):,}")
+        print(f"after restart: {remaining:,} pending, {len(notifier.counts):,} delivered over the next two days")
+        scheduler.close()
+
+        if args.smtp_reminders:
+            sink = SMTPSink()
+            threading.Thread(target=sink.serve_forever, daemon=True).start()
+            notifier = SMTPNotifier(host="127.0.0.1", port=sink.server_address[1])
+            scheduler = ReminderScheduler(path=os.path.join(tmp, "smtp.db"), notifier=notifier)
+            m = args.smtp_reminders
+            scheduler.add_many((f"patient-{i // 5}", KINDS[i % len(KINDS)], now - i, "Reminder", None)
+                               for i in range(m))
+            start = time.perf_counter()
+            delivered = scheduler.run_pending(now)
+            elapsed = time.perf_counter() - start
+            sink.shutdown()
+            print(f"smtp: {delivered:,} reminders in {sink.messages:,} emails: {elapsed:.2f}s "
+                  f"({delivered / elapsed:,.0f}/s)")
+            if delivered != m or sink.lines != m:
+                failures.append(f"smtp: {sink.lines:,} of {m:,} reminders reached the mail server")
+            if len(sink.recipients) != -(-m // 5):
+                failures.append(f"smtp: {-(-m // 5):,} patients were mailed at {len(sink.recipients):,} addresses")
+            if sink.named_subjects:
+                failures.append(f"smtp: {sink.named_subjects:,} subjects name the patient")
+            scheduler.close()
+
+    if failures:
+        print("FAILED", *failures, sep="\n")
+        return 1
+    print("OK")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,97 @@
+"""Per-session memory footprint and session store behaviour under many sessions.
+
+Compares a fully filled-in patient_data dict (what session state used to
+hold) with the equivalent PatientRecord, then drives a scratch SessionStore
+with many sessions and a small memory cap, and checks that it stays under the
+cap, spills to disk and restores every record intact. Exits non-zero if the
+cap is exceeded or a restored record differs.
+
+    python -m benchmarks.session_memory --sessions 20000 --max-mb 2
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import date, timedelta
+
+from patient_record import PatientRecord
+from session_store import SessionStore
+
+
+def _patient(i):
+    return {
+        "name": f"Patient {i}", "age": 20 + i % 70, "gender": ["Male", "Female", "Other"][i % 3],
+        "weight": 60 + i % 50, "height": 150 + i % 45, "previous_operations": i % 4,
+        "last_operation": date(2024, 1, 1) + timedelta(days=i % 600), "family_history": "One relative",
+        "water_intake": 1 + i % 15, "diet": "High-protein", "hypertension": i % 2 == 0, "diabetes": False,
+        "uti_history": False, "kidney_disease": False, "medications": "Potassium citrate 10 mEq twice daily",
+        "activity_level": "Lightly active", "smoking": "Never", "alcohol": "Occasional", "stress_level": 1 + i % 10,
+        "stone_sizes": [4.25, 7.5, 2.0], "largest_stone": 7.5, "stone_count": 3,
+        "stone_locations": ["Left kidney", "Right ureter", "Left kidney"],
+        "lab_results": {"urine_calcium": 310.0 + i % 50, "urine_citrate": 280.0, "urine_ph": 5.3},
+        "stone_type": "Calcium Oxalate", "recurrence_risk": 30 + i % 60, "model_version": "20240101000000",
+        "surgery_needed": True, "analysis_complete": True,
+    }
+
+
+def _traced_bytes(make, count):
+    # Net bytes still allocated per object after building many of them
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    objects = [make(i) for i in range(count)]
+    after = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del objects
+    return (after - before) / count
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sessions", type=int, default=20_000)
+    parser.add_argument("--max-mb", type=float, default=2.0, help="session store memory cap")
+    args = parser.parse_args(argv)
+
+    dict_bytes = _traced_bytes(_patient, 2000)
+    record_bytes = _traced_bytes(lambda i: PatientRecord(_patient(i)), 2000)
+    footprint = sum(PatientRecord(_patient(i)).footprint() for i in range(2000)) / 2000
+    print(f"patient_data dict: {dict_bytes:,.0f} B/session; PatientRecord: {record_bytes:,.0f} B/session "
+          f"(footprint() estimate {footprint:,.0f} B)")
+
+    failed = False
+    with tempfile.TemporaryDirectory() as tmp:
+        store = SessionStore(tmp, max_bytes=int(args.max_mb * 1024 * 1024), min_resident=0)
+        ids = [f"{i:032x}" for i in range(args.sessions)]
+        start = time.perf_counter()
+        for i, session_id in enumerate(ids):
+            store.get(session_id).update(_patient(i))
+        elapsed = time.perf_counter() - start
+        print(f"filled {args.sessions} sessions in {elapsed:.2f}s")
+
+        # Footprints are taken when a record is handed out, so the second pass sees filled records
+        start = time.perf_counter()
+        mismatched = [session_id for i, session_id in enumerate(ids)
+                      if store.get(session_id).to_state() != PatientRecord(_patient(i)).to_state()]
+        elapsed = time.perf_counter() - start
+        stats = store.stats()
+        on_disk = len(os.listdir(tmp))
+        print(f"re-read all sessions (restoring spilled ones) in {elapsed:.2f}s "
+              f"({elapsed / args.sessions * 1e6:.0f} us/session): {stats['sessions']} in memory "
+              f"({stats['bytes'] / 1024:,.0f} KiB of {stats['max_bytes'] / 1024:,.0f} KiB, "
+              f"{stats['bytes_per_session']:,.0f} B/session), {on_disk} on disk")
+        if stats["bytes"] > stats["max_bytes"]:
+            print("FAILED: the store is over its memory cap")
+            failed = True
+        if mismatched:
+            print(f"FAILED: {len(mismatched)} records changed on the way through the store, e.g. {mismatched[0]}")
+            failed = True
+
+    if failed:
+        return 1
+    print("OK")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
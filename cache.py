@@ -0,0 +1,60 @@
+"""Small in-process caches shared across Streamlit sessions."""
+import threading
+import weakref
+from collections import OrderedDict
+
+# name -> LRUCache, for caches created with a name (reported by metrics.py)
+_named = weakref.WeakValueDictionary()
+
+
+def named_caches():
+    """Return a snapshot of the live named caches, keyed by name."""
+    return dict(_named)
+
+
+class LRUCache:
+    """Thread-safe mapping with a fixed number of entries and LRU eviction."""
+
+    def __init__(self, maxsize=128, name=None):
+        if maxsize < 1:
+            raise ValueError("maxsize must be at least 1")
+        self.maxsize = maxsize
+        self.name = name
+        self.hits = 0
+        self.misses = 0
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        if name is not None:
+            _named[name] = self
+
+    def get(self, key, default=None):
+        with self._lock:
+            try:
+                value = self._data[key]
+            except KeyError:
+                self.misses += 1
+                return default
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key, value):
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def __contains__(self, key):
+        with self._lock:
+            return key in self._data
+
+    def __len__(self):
+        with self._lock:
+            return len(self._data)
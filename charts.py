@@ -0,0 +1,122 @@
+"""Chart data layer for the Health Tracker dashboard.
+
+Long series are downsampled to about the chart's pixel width with
+Largest-Triangle-Three-Buckets (LTTB), which keeps peaks and dips that plain
+decimation would drop. Series that are still large after that use WebGL
+traces. Built figures are cached as JSON per (patient, series, view, end
+date) together with the tracker store revision they were built from, so a
+chart is only rebuilt when new log entries arrive. Each caller gets its own
+figure parsed from the cached JSON, so sessions never share a mutable figure.
+"""
+import math
+
+import numpy as np
+import plotly.graph_objects as go
+import plotly.io as pio
+
+from cache import LRUCache
+from metrics import span
+
+# Roughly the pixel width of a full-width chart; longer series are downsampled
+MAX_POINTS = 1500
+
+# Above this many points, SVG traces get sluggish in the browser
+WEBGL_THRESHOLD = 500
+
+FIGURE_CACHE_SIZE = 512
+
+_figure_cache = LRUCache(FIGURE_CACHE_SIZE, name="figures")
+
+
+def lttb(x, y, threshold):
+    """Return the indices of `threshold` points chosen by LTTB.
+
+    `x` and `y` are numeric arrays of equal length with `x` ascending. The
+    first and last points are always kept.
+    """
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+    n = len(x)
+    if threshold >= n or threshold < 3:
+        return np.arange(n)
+
+    # Bucket b covers [edges[b], edges[b + 1]); the first and last point sit outside
+    every = (n - 2) / (threshold - 2)
+    edges = np.minimum(n - 1, np.floor(np.arange(threshold - 1) * every).astype(np.int64) + 1)
+    edges[-1] = n - 1
+
+    selected = np.empty(threshold, dtype=np.int64)
+    selected[0] = 0
+    selected[-1] = n - 1
+    a = 0
+    for bucket in range(threshold - 2):
+        start, end = edges[bucket], edges[bucket + 1]
+        # The next bucket's average (or the last point) is the triangle's third corner
+        if bucket + 2 < len(edges):
+            next_start, next_end = end, edges[bucket + 2]
+            avg_x = x[next_start:next_end].mean()
+            avg_y = y[next_start:next_end].mean()
+        else:
+            avg_x, avg_y = x[-1], y[-1]
+        areas = np.abs((x[a] - avg_x) * (y[start:end] - y[a]) - (x[a] - x[start:end]) * (avg_y - y[a]))
+        a = start + int(np.argmax(areas))
+        selected[bucket + 1] = a
+    return selected
+
+
+def _as_numeric(x):
+    # Dates become day ordinals, which is all LTTB needs
+    if len(x) and hasattr(x[0], "toordinal"):
+        return np.fromiter((value.toordinal() for value in x), dtype=np.float64, count=len(x))
+    return np.asarray(x, dtype=np.float64)
+
+
+def series_figure(x, y, title, x_label, y_label, kind="line", hlines=(), max_points=MAX_POINTS):
+    """Build a line or bar figure for one series, downsampled if needed.
+
+    `hlines` is a sequence of (y, color, label) reference lines.
+    """
+    points = len(x)
+    if points > max_points:
+        keep = lttb(_as_numeric(x), y, max_points)
+        x = [x[i] for i in keep]
+        y = [y[i] for i in keep]
+
+    if len(x) > WEBGL_THRESHOLD:
+        trace = go.Scattergl(x=x, y=y, mode="lines")
+    elif kind == "bar":
+        trace = go.Bar(x=x, y=y)
+    else:
+        trace = go.Scatter(x=x, y=y, mode="lines+markers")
+
+    if points > len(x):
+        title = f"{title} ({len(x)} of {points} points shown)"
+    fig = go.Figure(trace)
+    fig.update_layout(title=title, xaxis_title=x_label, yaxis_title=y_label)
+    for value, color, label in hlines:
+        fig.add_hline(y=value, line_dash="dash", line_color=color, annotation_text=label)
+    return fig
+
+
+def cached_figure(key, revision, build):
+    """Return the figure for `key`, rebuilding it only if `revision` changed.
+
+    `build` is a zero-argument function returning a figure, or None when there
+    is nothing to plot. The cache holds the serialized figure.
+    """
+    entry = _figure_cache.get(key)
+    if entry is None or entry[0] != revision:
+        with span("figure.build"):
+            fig = build()
+        entry = (revision, None if fig is None else fig.to_json())
+        _figure_cache.put(key, entry)
+    if entry[1] is None:
+        return None
+    # The JSON came from plotly itself; skip_invalid also makes parsing several times faster
+    return pio.from_json(entry[1], skip_invalid=True)
+
+
+def finite_points(x, y):
+    """Drop points whose y value is missing or not finite."""
+    points = [(a, b) for a, b in zip(x, y) if b is not None and math.isfinite(b)]
+    return [a for a, _ in points], [b for _, b in points]
@@ -0,0 +1,413 @@
+"""Clinician cohort: one summary row per patient, held column-wise.
+
+Each patient's display name and latest recurrence_risk, stone_type,
+largest_stone, surgery_needed and last Health Tracker log date are kept,
+keyed by the stable patient id, in NumPy arrays
+(persisted to SQLite), so filtering a 100k-patient cohort is a few vector
+comparisons. Patient counts per (stone type, surgery, risk bucket) are kept
+up to date on every write, so the risk histogram for the usual filters never
+scans the rows, and the sorted order for each sort column is cached until
+the next write. Queries return only the requested page of rows.
+
+Every write bumps a revision counter in the database and stamps the rows it
+writes with it, so each query first applies the rows other processes (such
+as `main.py score --cohort-id`) have written since this store last looked.
+"""
+import sqlite3
+import threading
+
+import numpy as np
+
+from analysis import STONE_TYPES
+from config import data_path
+
+DB_FILE = "cohort.db"
+
+PAGE_SIZE = 50
+
+# Risk histogram buckets: 0-9, 10-19, ..., 90-100, then one for patients not yet scored
+BUCKET_WIDTH = 10
+RISK_BUCKETS = 10
+UNSCORED = RISK_BUCKETS
+
+COLUMNS = ["name", "recurrence_risk", "stone_type", "largest_stone", "surgery_needed", "last_log"]
+SORT_COLUMNS = ["patient_id"] + COLUMNS
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS cohort (
+    patient_id TEXT PRIMARY KEY,
+    name TEXT,
+    recurrence_risk INTEGER,
+    stone_type TEXT,
+    largest_stone REAL,
+    surgery_needed INTEGER NOT NULL DEFAULT 0,
+    last_log TEXT,
+    revision INTEGER NOT NULL DEFAULT 0
+) WITHOUT ROWID;
+
+-- Bumped by every write, whichever process makes it
+CREATE TABLE IF NOT EXISTS revision (
+    id INTEGER PRIMARY KEY CHECK (id = 0),
+    value INTEGER NOT NULL
+);
+INSERT OR IGNORE INTO revision (id, value) VALUES (0, 0);
+"""
+
+REVISION_INDEX = "CREATE INDEX IF NOT EXISTS cohort_revision ON cohort (revision)"
+
+_SELECT = ("SELECT patient_id, name, recurrence_risk, stone_type, largest_stone, surgery_needed, last_log "
+           "FROM cohort")
+
+_STONE_CODES = {stone_type: code for code, stone_type in enumerate(STONE_TYPES)}
+# Sorting by stone type is alphabetical, with unknown (-1) first
+_STONE_SORT_RANK = np.argsort(np.argsort(["", *STONE_TYPES])).astype(np.float64)
+_NAT = np.datetime64("NaT", "D")
+
+
+def risk_bucket(risk):
+    """Histogram bucket of a recurrence risk (percent), or UNSCORED for None."""
+    if risk is None or risk < 0:
+        return UNSCORED
+    return min(int(risk) // BUCKET_WIDTH, RISK_BUCKETS - 1)
+
+
+def bucket_labels():
+    return [f"{b * BUCKET_WIDTH}-{b * BUCKET_WIDTH + BUCKET_WIDTH - 1}" for b in range(RISK_BUCKETS - 1)] + [
+        f"{(RISK_BUCKETS - 1) * BUCKET_WIDTH}-100"]
+
+
+class CohortStore:
+    """In-memory columnar cohort backed by SQLite, with incrementally maintained counts."""
+
+    def __init__(self, path=None):
+        self.path = path or data_path(DB_FILE)
+        self._conn = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(SCHEMA)
+        columns = [column[1] for column in self._conn.execute("PRAGMA table_info(cohort)")]
+        if "name" not in columns:
+            self._conn.execute("ALTER TABLE cohort ADD COLUMN name TEXT")
+        if "revision" not in columns:
+            self._conn.execute("ALTER TABLE cohort ADD COLUMN revision INTEGER NOT NULL DEFAULT 0")
+        self._conn.execute(REVISION_INDEX)
+        self._lock = threading.Lock()
+        self._version = 0
+        # (sort column, descending) -> (version, row order); (sorted lowercase names, order)
+        self._orders = {}
+        self._prefix_index = None
+        self._load()
+
+    def _allocate(self, capacity):
+        self._ids = np.empty(capacity, dtype=object)
+        self._names = np.empty(capacity, dtype=object)
+        self._risk = np.full(capacity, -1, dtype=np.int16)
+        self._stone = np.full(capacity, -1, dtype=np.int8)
+        self._largest = np.full(capacity, np.nan, dtype=np.float32)
+        self._surgery = np.zeros(capacity, dtype=bool)
+        self._last_log = np.full(capacity, _NAT, dtype="datetime64[D]")
+
+    def _grow(self):
+        columns = ("_ids", "_names", "_risk", "_stone", "_largest", "_surgery", "_last_log")
+        old = [getattr(self, column) for column in columns]
+        self._allocate(max(1024, 2 * len(self._ids)))
+        for column, values in zip(columns, old):
+            getattr(self, column)[:len(values)] = values
+
+    def _db_revision(self):
+        return self._conn.execute("SELECT value FROM revision").fetchone()[0]
+
+    def _load(self):
+        # Read the revision first: rows written meanwhile are applied again by the next _sync
+        self._revision = self._db_revision()
+        rows = self._conn.execute(_SELECT).fetchall()
+        n = len(rows)
+        self._allocate(max(1024, n))
+        self._size = n
+        if n:
+            ids, names, risks, stones, largest, surgery, last_log = zip(*rows)
+            self._ids[:n] = ids
+            self._names[:n] = names
+            self._risk[:n] = [-1 if risk is None else risk for risk in risks]
+            self._stone[:n] = [_STONE_CODES.get(stone, -1) for stone in stones]
+            self._largest[:n] = np.array(largest, dtype=np.float64)
+            self._surgery[:n] = np.array(surgery, dtype=bool)
+            self._last_log[:n] = np.array([day or "NaT" for day in last_log], dtype="datetime64[D]")
+        self._row = {patient_id: i for i, patient_id in enumerate(self._ids[:n])}
+        self._counts = np.zeros((len(STONE_TYPES) + 1, 2, RISK_BUCKETS + 1), dtype=np.int64)
+        buckets = np.where(self._risk[:n] < 0, UNSCORED,
+                           np.minimum(self._risk[:n] // BUCKET_WIDTH, RISK_BUCKETS - 1))
+        np.add.at(self._counts, (self._stone[:n] + 1, self._surgery[:n].astype(int), buckets), 1)
+        self._version += 1
+
+    def _sync(self):
+        """Apply rows that other connections wrote since this store last read the database."""
+        revision = self._db_revision()
+        if revision == self._revision:
+            return
+        rows = self._conn.execute(_SELECT + " WHERE revision > ?", (self._revision,)).fetchall()
+        for patient_id, *values in rows:
+            fields = dict(zip(COLUMNS, values))
+            if fields["stone_type"] not in _STONE_CODES:
+                fields["stone_type"] = None
+            self._apply(patient_id, fields)
+        self._revision = revision
+        self._version += 1
+
+    def _cell(self, row):
+        return self._stone[row] + 1, int(self._surgery[row]), risk_bucket(int(self._risk[row]))
+
+    def upsert(self, patient_id, **fields):
+        """Create or update one patient's row; fields not given keep their value."""
+        self.upsert_many([(patient_id, fields)])
+
+    def upsert_many(self, rows):
+        """Apply (patient_id, fields) updates in one transaction; returns how many rows changed."""
+        rows = list(rows)
+        # Validate everything first, so a bad row leaves the store untouched
+        for _, fields in rows:
+            unknown = set(fields) - set(COLUMNS)
+            if unknown:
+                raise ValueError(f"Unknown cohort column(s): {', '.join(sorted(unknown))}")
+            stone_type = fields.get("stone_type")
+            if stone_type is not None and stone_type not in _STONE_CODES:
+                raise ValueError(f"Unknown stone type {stone_type!r}")
+        with self._lock:
+            cursor = self._conn.cursor()
+            try:
+                cursor.execute("BEGIN IMMEDIATE")
+                # Catch up first, so fields not given keep the value another process wrote
+                self._sync()
+                changed = {patient_id: self._apply(patient_id, fields) for patient_id, fields in rows}
+                self._version += 1
+                cursor.execute("UPDATE revision SET value = value + 1")
+                revision = self._db_revision()
+                cursor.executemany(
+                    "INSERT OR REPLACE INTO cohort (patient_id, name, recurrence_risk, stone_type, largest_stone, "
+                    "surgery_needed, last_log, revision) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                    [(*self._db_row(row), revision) for row in changed.values()])
+                cursor.execute("COMMIT")
+            except BaseException:
+                if self._conn.in_transaction:
+                    cursor.execute("ROLLBACK")
+                # Memory and disk disagree now; reload from disk
+                self._load()
+                raise
+            self._revision = revision
+        return len(changed)
+
+    def _apply(self, patient_id, fields):
+        # Set one patient's fields in memory, adding the row if it is new; returns the row
+        row = self._row.get(patient_id)
+        if row is None:
+            if self._size == len(self._ids):
+                self._grow()
+            row = self._row[patient_id] = self._size
+            self._size += 1
+            self._ids[row], self._names[row] = patient_id, None
+            self._risk[row], self._stone[row], self._largest[row] = -1, -1, np.nan
+            self._surgery[row], self._last_log[row] = False, _NAT
+            self._prefix_index = None
+        else:
+            self._counts[self._cell(row)] -= 1
+        self._set(row, fields)
+        self._counts[self._cell(row)] += 1
+        return row
+
+    def record_log(self, patient_id, day):
+        """Note a Health Tracker entry for `day`; keeps the latest date."""
+        with self._lock:
+            row = self._row.get(patient_id)
+            if row is not None and self._last_log[row] >= np.datetime64(day, "D"):
+                return
+        self.upsert(patient_id, last_log=day)
+
+    def _set(self, row, fields):
+        if "name" in fields:
+            if fields["name"] != self._names[row]:
+                self._prefix_index = None
+            self._names[row] = fields["name"] or None
+        if "recurrence_risk" in fields:
+            risk = fields["recurrence_risk"]
+            self._risk[row] = -1 if risk is None or risk != risk else int(round(risk))
+        if "stone_type" in fields:
+            stone_type = fields["stone_type"]
+            self._stone[row] = -1 if stone_type is None else _STONE_CODES[stone_type]
+        if "largest_stone" in fields:
+            largest = fields["largest_stone"]
+            self._largest[row] = np.nan if largest is None else largest
+        if "surgery_needed" in fields:
+            self._surgery[row] = bool(fields["surgery_needed"])
+        if "last_log" in fields:
+            day = fields["last_log"]
+            self._last_log[row] = _NAT if day is None else np.datetime64(day, "D")
+
+    def _db_row(self, row):
+        risk, stone, largest, last_log = self._risk[row], self._stone[row], self._largest[row], self._last_log[row]
+        return (self._ids[row], self._names[row], None if risk < 0 else int(risk), None if stone < 0 else STONE_TYPES[stone],
+                None if np.isnan(largest) else float(largest), int(self._surgery[row]),
+                None if np.isnat(last_log) else str(last_log))
+
+    # --- Queries ------------------------------------------------------------
+
+    def _mask(self, min_risk, max_risk, stone_types, surgery, prefix):
+        n = self._size
+        mask = np.ones(n, dtype=bool)
+        if min_risk > 0 or max_risk < 100:
+            risk = self._risk[:n]
+            mask &= (risk >= min_risk) & (risk <= max_risk)
+        if stone_types:
+            mask &= np.isin(self._stone[:n], [_STONE_CODES[stone_type] for stone_type in stone_types])
+        if surgery is not None:
+            mask &= self._surgery[:n] == surgery
+        if prefix:
+            matches = np.zeros(n, dtype=bool)
+            matches[self._prefix_rows(prefix.lower())] = True
+            mask &= matches
+        return mask
+
+    def _prefix_rows(self, prefix):
+        if self._prefix_index is None:
+            lowered = np.array([(name or "").lower() for name in self._names[:self._size]], dtype=object)
+            order = np.argsort(lowered, kind="stable")
+            self._prefix_index = (lowered[order], order)
+        keys, order = self._prefix_index
+        # Every name starting with `prefix` sorts between prefix and prefix + the highest code point
+        start, end = np.searchsorted(keys, [prefix, prefix + "\U0010ffff"])
+        return order[start:end]
+
+    def _sort_key(self, column):
+        n = self._size
+        if column == "patient_id":
+            rank = np.empty(n, dtype=np.float64)
+            rank[np.argsort(self._ids[:n], kind="stable")] = np.arange(n)
+            return rank
+        if column == "name":
+            if self._prefix_index is None:
+                self._prefix_rows("")
+            rank = np.empty(n, dtype=np.float64)
+            rank[self._prefix_index[1]] = np.arange(n)
+            return rank
+        if column == "recurrence_risk":
+            return self._risk[:n].astype(np.float64)
+        if column == "stone_type":
+            return _STONE_SORT_RANK[self._stone[:n] + 1]
+        if column == "largest_stone":
+            return np.nan_to_num(self._largest[:n].astype(np.float64), nan=-np.inf)
+        if column == "surgery_needed":
+            return self._surgery[:n].astype(np.float64)
+        if column == "last_log":
+            days = self._last_log[:n]
+            return np.where(np.isnat(days), -np.inf, days.astype(np.int64).astype(np.float64))
+        raise ValueError(f"Cannot sort by {column!r}")
+
+    def _order(self, sort, descending):
+        cached = self._orders.get((sort, descending))
+        if cached is not None and cached[0] == self._version:
+            return cached[1]
+        key = self._sort_key(sort)
+        # Stable, so ties keep insertion order and pages never overlap
+        order = np.argsort(-key if descending else key, kind="stable")
+        self._orders[(sort, descending)] = (self._version, order)
+        return order
+
+    def query(self, min_risk=0, max_risk=100, stone_types=None, surgery=None, prefix="",
+              sort="recurrence_risk", descending=True, offset=0, limit=PAGE_SIZE):
+        """Return (matching patients, one page of rows as dicts).
+
+        Patients not yet scored only match when the risk range is the full 0-100.
+        """
+        with self._lock:
+            self._sync()
+            mask = self._mask(min_risk, max_risk, stone_types, surgery, prefix)
+            order = self._order(sort, descending)
+            matching = order[mask[order]]
+            page = matching[offset:offset + limit]
+            rows = [{
+                "patient_id": self._ids[row],
+                "name": self._names[row],
+                "recurrence_risk": None if self._risk[row] < 0 else int(self._risk[row]),
+                "stone_type": None if self._stone[row] < 0 else STONE_TYPES[self._stone[row]],
+                "largest_stone": None if np.isnan(self._largest[row]) else round(float(self._largest[row]), 1),
+                "surgery_needed": bool(self._surgery[row]),
+                "last_log": None if np.isnat(self._last_log[row]) else self._last_log[row].item(),
+            } for row in page]
+            return len(matching), rows
+
+    def histogram(self, min_risk=0, max_risk=100, stone_types=None, surgery=None, prefix=""):
+        """Return patient counts, shape (unknown + stone types, RISK_BUCKETS + 1).
+
+        Row 0 is patients without a stone type, then one row per STONE_TYPES
+        entry; the last column counts patients not yet scored. Uses the
+        maintained counts unless a name prefix is given or the risk range
+        does not fall on bucket edges.
+        """
+        with self._lock:
+            self._sync()
+            in_range = self._buckets_in_range(min_risk, max_risk)
+            if prefix or in_range is None:
+                n = self._size
+                mask = self._mask(min_risk, max_risk, stone_types, surgery, prefix)
+                risk = self._risk[:n][mask]
+                buckets = np.where(risk < 0, UNSCORED, np.minimum(risk // BUCKET_WIDTH, RISK_BUCKETS - 1))
+                counts = np.zeros((len(STONE_TYPES) + 1, RISK_BUCKETS + 1), dtype=np.int64)
+                np.add.at(counts, (self._stone[:n][mask] + 1, buckets), 1)
+                return counts
+            counts = self._counts if surgery is None else self._counts[:, [int(surgery)]]
+            counts = counts.sum(axis=1)
+            if stone_types:
+                keep = np.zeros(len(STONE_TYPES) + 1, dtype=bool)
+                keep[[_STONE_CODES[stone_type] + 1 for stone_type in stone_types]] = True
+                counts = np.where(keep[:, None], counts, 0)
+            return np.where(in_range, counts, 0)
+
+    def _buckets_in_range(self, min_risk, max_risk):
+        # Which histogram columns a risk filter keeps, or None if it splits a bucket
+        if min_risk <= 0 and max_risk >= 100:
+            return np.ones(RISK_BUCKETS + 1, dtype=bool)
+        if min_risk % BUCKET_WIDTH or (max_risk + 1) % BUCKET_WIDTH and max_risk != 100:
+            return None
+        starts = np.arange(RISK_BUCKETS) * BUCKET_WIDTH
+        ends = np.append(starts[1:] - 1, 100)
+        return np.append((starts >= min_risk) & (ends <= max_risk), False)
+
+    def revision(self):
+        """A counter that changes on every write (for caching anything derived from queries).
+
+        Writes made by other processes count too.
+        """
+        with self._lock:
+            self._sync()
+            return self._version
+
+    def stats(self):
+        with self._lock:
+            self._sync()
+            counts = self._counts
+            return {
+                "patients": self._size,
+                "scored": int(counts[..., :UNSCORED].sum()),
+                "surgery_needed": int(counts[:, 1].sum()),
+            }
+
+    def __len__(self):
+        with self._lock:
+            self._sync()
+            return self._size
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_cohort_store():
+    """Return the process-wide CohortStore."""
+    global _store
+    with _store_lock:
+        if _store is None:
+            _store = CohortStore()
+        return _store
@@ -0,0 +1,23 @@
+"""Runtime configuration read from the environment."""
+import os
+
+# Where local stores (SQLite databases, uploaded files, ...) are kept
+DATA_DIR = os.environ.get("NEPHROCARE_DATA_DIR", os.path.join(os.path.expanduser("~"), ".nephrocare"))
+
+# Clinician-only pages (every patient's results) are served only when this is set;
+# run such an instance where only clinicians can reach it
+CLINICIAN_MODE = os.environ.get("NEPHROCARE_CLINICIAN_MODE", "0") not in ("", "0", "false")
+
+
+def data_path(*parts):
+    """Return a path inside DATA_DIR, creating parent directories as needed."""
+    path = os.path.join(DATA_DIR, *parts)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    return path
+
+
+def data_dir(*parts):
+    """Return a directory inside DATA_DIR, creating it if needed."""
+    path = os.path.join(DATA_DIR, *parts)
+    os.makedirs(path, exist_ok=True)
+    return path
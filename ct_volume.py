@@ -0,0 +1,372 @@
+"""Multi-slice CT studies: assembly into an on-disk volume and 3D stone segmentation.
+
+A study is uploaded either as a zip of axial slice images (PNG, JPEG, TIFF
+or BMP, ordered by file name from head to feet) or as one stacked NumPy
+.npy array of shape (slices, rows, columns). Slices are decoded one at a
+time into a uint8 volume file under DATA_DIR/volumes; a .npy that is already
+uint8 and small enough in-plane is used in place. Integer and float arrays
+are taken to be Hounsfield units and mapped through HU_WINDOW.
+
+Neither format records the distance between slices. A zip may carry it in
+a STUDY_INFO member ({"slice_thickness_mm": 2.5}), and callers may pass it
+to analyze_volume(); otherwise slices are assumed to be SLICE_THICKNESS_MM
+apart and the result says so. A wrong thickness scales every stone's
+through-plane extent, so sizes and volumes are only as good as it is.
+
+Segmentation streams the volume through memory maps in slabs of about
+SLAB_VOXELS voxels, so peak memory does not depend on the number of slices:
+
+1. each slice gets the blur and white top-hat used for a single CT image
+   (imaging.py), written to a second volume file, while the intensity
+   statistics that set the detection threshold are accumulated;
+2. each thresholded slab is labelled in 3D with scikit-image, and
+   components touching the previous slab's last slice are joined with a
+   union-find;
+3. components are measured from running voxel moments (count, centroid and
+   second moments), so only those still open at the slab boundary are
+   carried forward.
+
+Measuring in 3D drops structures that look stone-sized on every slice but
+run through many of them, such as ribs and calcified vessels.
+"""
+import heapq
+import json
+import os
+import re
+import tempfile
+import zipfile
+from collections import namedtuple
+
+import cv2
+import numpy as np
+from skimage import measure
+
+from config import data_dir
+from imaging import (FIELD_OF_VIEW_MM, MAX_DIMENSION, MAX_STONE_MM, MAX_STONES, MIN_CONTRAST, MIN_STONE_MM,
+                     decode_image, downsample, stone_location, tiled_tophat, tophat_kernel)
+from ingest import blob_path
+
+VOLUME_DIR = "volumes"
+
+# Distance between slices when the study does not say; in-plane scale comes from FIELD_OF_VIEW_MM
+SLICE_THICKNESS_MM = 1.0
+MAX_SLICE_THICKNESS_MM = 10.0
+
+# Optional member of a zipped study giving its slice spacing
+STUDY_INFO = "study.json"
+
+# Voxels per slab (at least one slice); 3D labelling needs ~20 bytes per voxel
+SLAB_VOXELS = 2 * 1024 * 1024
+
+# Upload limits (a zip's slices are checked before they are decompressed)
+MAX_SLICES = 2000
+MAX_SLICE_BYTES = 64 * 1024 * 1024
+
+SLICE_EXTENSIONS = (".png", ".jpg", ".jpeg", ".tif", ".tiff", ".bmp")
+
+# Hounsfield range mapped onto 0-255 for array uploads (a bone window)
+HU_WINDOW = (-500.0, 1500.0)
+
+_ZIP_MAGIC = b"PK\x03\x04"
+_NPY_MAGIC = b"\x93NUMPY"
+_NPY_HEADERS = {(1, 0): np.lib.format.read_array_header_1_0, (2, 0): np.lib.format.read_array_header_2_0}
+
+# A C-ordered uint8 volume of `shape` stored in `path` from byte `offset`
+Volume = namedtuple("Volume", ["path", "offset", "shape"])
+
+
+def volume_format(handle):
+    """Return "zip" or "npy" for an upload holding a CT study, or None for a single image."""
+    with open(blob_path(handle.digest), "rb") as f:
+        magic = f.read(len(_NPY_MAGIC))
+    if magic.startswith(_ZIP_MAGIC):
+        return "zip"
+    if magic == _NPY_MAGIC:
+        return "npy"
+    return None
+
+
+def study_slice_thickness(handle):
+    """Return the slice thickness in mm a zipped study's STUDY_INFO gives, or None."""
+    if volume_format(handle) != "zip":
+        return None
+    with zipfile.ZipFile(blob_path(handle.digest)) as archive:
+        names = [name for name in archive.namelist()
+                 if os.path.basename(name) == STUDY_INFO and not name.startswith("__MACOSX/")]
+        if not names:
+            return None
+        try:
+            thickness = json.loads(archive.read(names[0]))["slice_thickness_mm"]
+        except (ValueError, KeyError, TypeError):
+            raise ValueError(f"{STUDY_INFO} must be a JSON object with a slice_thickness_mm number") from None
+    return _checked_thickness(thickness)
+
+
+def _checked_thickness(thickness):
+    if isinstance(thickness, bool) or not isinstance(thickness, (int, float)) \
+            or not 0 < thickness <= MAX_SLICE_THICKNESS_MM:
+        raise ValueError(f"Slice thickness must be a number of mm in (0, {MAX_SLICE_THICKNESS_MM:g}], "
+                         f"got {thickness!r}")
+    return float(thickness)
+
+
+def _slabs(path, offset, shape, dtype, slab=None):
+    # Map one slab at a time, so only the slab being processed is resident
+    depth, height, width = shape
+    slab = slab or max(1, SLAB_VOXELS // (height * width))
+    slice_bytes = height * width * np.dtype(dtype).itemsize
+    for start in range(0, depth, slab):
+        stop = min(depth, start + slab)
+        yield start, np.memmap(path, dtype=dtype, mode="r", offset=offset + start * slice_bytes,
+                               shape=(stop - start, height, width))
+
+
+def read_slabs(volume, slab=None):
+    """Yield (first slice index, array of up to `slab` slices) through the volume.
+
+    By default each slab holds about SLAB_VOXELS voxels.
+    """
+    return _slabs(volume.path, volume.offset, volume.shape, np.uint8, slab)
+
+
+def hounsfield_to_uint8(values):
+    """Map Hounsfield units through HU_WINDOW onto 0-255."""
+    low, high = HU_WINDOW
+    scaled = np.nan_to_num((values.astype(np.float32) - low) * (255.0 / (high - low)))
+    return np.clip(scaled, 0, 255).astype(np.uint8)
+
+
+def _natural_key(name):
+    # slice2.png sorts before slice10.png
+    return [int(part) if part.isdigit() else part.lower() for part in re.split(r"(\d+)", name)]
+
+
+def _is_slice(name):
+    base = os.path.basename(name)
+    return (not name.startswith("__MACOSX/") and not base.startswith(".")
+            and base.lower().endswith(SLICE_EXTENSIONS))
+
+
+def _assemble_zip(path, out_path):
+    with zipfile.ZipFile(path) as archive:
+        members = sorted((member for member in archive.infolist()
+                          if not member.is_dir() and _is_slice(member.filename)),
+                         key=lambda member: _natural_key(member.filename))
+        if not members:
+            raise ValueError("The zip file contains no slice images")
+        if len(members) > MAX_SLICES:
+            raise ValueError(f"The study has {len(members)} slices; at most {MAX_SLICES} are supported")
+        shape = None
+        with open(out_path, "wb") as out:
+            for member in members:
+                if member.file_size > MAX_SLICE_BYTES:
+                    raise ValueError(f"Slice {member.filename} is too large")
+                try:
+                    image = downsample(decode_image(archive.read(member)))
+                except ValueError:
+                    raise ValueError(f"Could not decode slice {member.filename}") from None
+                if shape is None:
+                    shape = image.shape
+                elif image.shape != shape:
+                    raise ValueError(f"Slice {member.filename} is {image.shape[1]}x{image.shape[0]} pixels, "
+                                     f"expected {shape[1]}x{shape[0]}")
+                out.write(np.ascontiguousarray(image).tobytes())
+    return Volume(out_path, 0, (len(members), *shape))
+
+
+def _assemble_npy(path, out_path):
+    with open(path, "rb") as f:
+        version = np.lib.format.read_magic(f)
+        if version not in _NPY_HEADERS:
+            raise ValueError(f"Unsupported .npy format version {version}")
+        shape, fortran_order, dtype = _NPY_HEADERS[version](f)
+        offset = f.tell()
+    if len(shape) != 3 or 0 in shape:
+        raise ValueError(f"Expected a (slices, rows, columns) array, got shape {shape}")
+    if fortran_order or dtype.kind not in "uif":
+        raise ValueError("Expected a C-ordered integer or float array")
+    depth, height, width = shape
+    if depth > MAX_SLICES:
+        raise ValueError(f"The study has {depth} slices; at most {MAX_SLICES} are supported")
+    if offset + depth * height * width * dtype.itemsize > os.path.getsize(path):
+        raise ValueError("The .npy file is truncated")
+    if dtype == np.uint8 and max(height, width) <= MAX_DIMENSION:
+        return Volume(path, offset, shape)
+
+    with open(out_path, "wb") as out:
+        for _, slab in _slabs(path, offset, shape, dtype):
+            for values in slab:
+                image = downsample(values if dtype == np.uint8 else hounsfield_to_uint8(values))
+                out.write(np.ascontiguousarray(image).tobytes())
+    return Volume(out_path, 0, (depth, *image.shape))
+
+
+def assemble_volume(handle, directory):
+    """Build the uint8 volume for an uploaded CT study, writing scratch files to `directory`."""
+    path = blob_path(handle.digest)
+    out_path = os.path.join(directory, "volume.u8")
+    fmt = volume_format(handle)
+    if fmt == "zip":
+        return _assemble_zip(path, out_path)
+    if fmt == "npy":
+        return _assemble_npy(path, out_path)
+    raise ValueError("Not a CT study: expected a zip of slices or a .npy array")
+
+
+def _tophat_pass(volume, out_path, kernel):
+    # Filter every slice into `out_path`; returns the detection threshold
+    total = total_sq = 0.0
+    with open(out_path, "wb") as out:
+        for _, slab in read_slabs(volume):
+            for image in slab:
+                filtered = tiled_tophat(cv2.GaussianBlur(np.asarray(image), (3, 3), 0), kernel)
+                values = filtered.astype(np.float64)
+                total += values.sum()
+                total_sq += np.square(values).sum()
+                out.write(filtered.tobytes())
+    count = np.prod(volume.shape)
+    mean = total / count
+    std = np.sqrt(max(0.0, total_sq / count - mean * mean))
+    return max(MIN_CONTRAST, mean + 3 * std)
+
+
+def _moments(labels, count, start, spacing):
+    # Per label: voxel count and sums of z, y, x, zz, yy, xx, zy, zx, yx (mm)
+    z, y, x = np.nonzero(labels)
+    ids = labels[z, y, x]
+    z = (z + start) * spacing[0]
+    y = y * spacing[1]
+    x = x * spacing[2]
+    moments = np.empty((count, 10))
+    moments[:, 0] = np.bincount(ids, minlength=count + 1)[1:]
+    for column, weights in enumerate([z, y, x, z * z, y * y, x * x, z * y, z * x, y * x], start=1):
+        moments[:, column] = np.bincount(ids, weights=weights, minlength=count + 1)[1:]
+    return moments
+
+
+def _touching(previous, current):
+    # Unique (previous label, current label) pairs of 26-connected voxels in adjacent slices
+    height, width = current.shape
+    pairs = []
+    for dy in (-1, 0, 1):
+        for dx in (-1, 0, 1):
+            a = previous[max(0, -dy):height - max(0, dy), max(0, -dx):width - max(0, dx)]
+            b = current[max(0, dy):height - max(0, -dy), max(0, dx):width - max(0, -dx)]
+            both = (a > 0) & (b > 0)
+            pairs.append(np.stack([a[both], b[both]], axis=1))
+    return np.unique(np.concatenate(pairs), axis=0)
+
+
+def _find(parent, node):
+    while parent[node] != node:
+        parent[node] = parent[parent[node]]
+        node = parent[node]
+    return node
+
+
+def _union(parent, a, b):
+    a, b = _find(parent, a), _find(parent, b)
+    if a != b:
+        parent[max(a, b)] = min(a, b)
+
+
+def label_components(volume, threshold, spacing):
+    """Yield the voxel moments of each 3D connected component above `threshold`.
+
+    Components are 26-connected. Each slice is thresholded and opened as a
+    single image would be, and every slab is labelled in one go; labels of
+    the previous slab's last slice are carried over so components spanning
+    slabs are joined.
+    """
+    opening = cv2.getStructuringElement(cv2.MORPH_ELLIPSE, (3, 3))
+    open_moments = np.zeros((0, 10))
+    # Previous slab's last slice, labelled 1..len(open_moments) by open component
+    boundary = None
+    for start, slab in read_slabs(volume):
+        mask = np.empty(slab.shape, dtype=np.uint8)
+        for i, image in enumerate(slab):
+            mask[i] = cv2.morphologyEx((image > threshold).astype(np.uint8), cv2.MORPH_OPEN, opening)
+        labels, count = measure.label(mask, connectivity=3, return_num=True)
+        carried = len(open_moments)
+        # Nodes: 0 is background, 1..carried the open components, then this slab's labels
+        parent = np.arange(carried + count + 1)
+        if boundary is not None and carried and count:
+            for a, b in _touching(boundary, labels[0]):
+                _union(parent, a, b + carried)
+        while True:
+            roots = parent[parent]
+            if np.array_equal(roots, parent):
+                break
+            parent = roots
+        merged = np.zeros((carried + count + 1, 10))
+        np.add.at(merged, roots[1:], np.concatenate([open_moments, _moments(labels, count, start, spacing)]))
+
+        nodes = np.arange(count + 1) + carried
+        nodes[0] = 0
+        last = roots[nodes[labels[-1]]]
+        still_open = np.unique(last[last > 0])
+        for root in np.setdiff1d(np.unique(roots[1:]), still_open):
+            yield merged[root]
+        renumber = np.zeros(carried + count + 1, dtype=np.int64)
+        renumber[still_open] = np.arange(1, len(still_open) + 1)
+        boundary = renumber[last]
+        open_moments = merged[still_open]
+    yield from open_moments
+
+
+def measure_component(moments, spacing):
+    """Return (size in mm, volume in mm^3, centroid (z, y, x) in mm) of a component."""
+    count = moments[0]
+    mean = moments[1:4] / count
+    zz, yy, xx, zy, zx, yx = moments[4:] / count
+    covariance = np.array([[zz, zy, zx], [zy, yy, yx], [zx, yx, xx]]) - np.outer(mean, mean)
+    # Each voxel is a box, not a point
+    covariance += np.diag(np.square(spacing) / 12)
+    # A solid ellipsoid with semi-axis a has variance a^2 / 5 along that axis
+    size = 2 * np.sqrt(5 * max(np.linalg.eigvalsh(covariance)[-1], 0.0))
+    return float(size), float(count * np.prod(spacing)), mean
+
+
+def analyze_volume(handle, slice_thickness_mm=None):
+    """Detect and measure stones in an uploaded CT study.
+
+    The slice thickness is `slice_thickness_mm` if given, else the study's
+    own (study_slice_thickness()), else SLICE_THICKNESS_MM. Returns the same
+    shape of result as imaging.analyze_image(), plus the slice count and
+    thickness and whether the thickness was assumed; each stone also has
+    its volume in mm^3.
+    """
+    if slice_thickness_mm is None:
+        slice_thickness_mm = study_slice_thickness(handle)
+    assumed = slice_thickness_mm is None
+    thickness = SLICE_THICKNESS_MM if assumed else _checked_thickness(slice_thickness_mm)
+    with tempfile.TemporaryDirectory(dir=data_dir(VOLUME_DIR)) as scratch:
+        volume = assemble_volume(handle, scratch)
+        depth, height, width = volume.shape
+        mm_per_pixel = FIELD_OF_VIEW_MM["ct"] / width
+        spacing = np.array([thickness, mm_per_pixel, mm_per_pixel])
+
+        tophat = Volume(os.path.join(scratch, "tophat.u8"), 0, volume.shape)
+        threshold = _tophat_pass(volume, tophat.path, tophat_kernel(mm_per_pixel))
+
+        # The MAX_STONES largest plausible stones, smallest first
+        largest = []
+        for index, moments in enumerate(label_components(tophat, threshold, spacing)):
+            size_mm, volume_mm3, (z, y, x) = measure_component(moments, spacing)
+            if not MIN_STONE_MM <= size_mm <= MAX_STONE_MM:
+                continue
+            stone = {
+                "size_mm": round(size_mm, 1),
+                "volume_mm3": round(volume_mm3, 1),
+                # Slices run head to feet, so depth plays the part of the image's height
+                "location": stone_location(x / (width * mm_per_pixel), z / (depth * thickness)),
+            }
+            entry = (size_mm, index, stone)
+            if len(largest) < MAX_STONES:
+                heapq.heappush(largest, entry)
+            else:
+                heapq.heappushpop(largest, entry)
+
+    stones = [stone for _, _, stone in sorted(largest, reverse=True)]
+    return {"modality": "ct", "mm_per_pixel": mm_per_pixel, "slice_thickness_mm": thickness,
+            "slice_thickness_assumed": assumed, "slices": depth, "stones": stones}
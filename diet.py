@@ -0,0 +1,296 @@
+"""Food composition, diet scoring and daily meal plans by stone type.
+
+COMPOSITION is a NumPy matrix of the stone-relevant nutrients in one
+serving of each food in FOODS (rows in FOOD_NAMES order, looked up through
+FOOD_INDEX). Values are rounded from public food-composition tables (USDA
+FoodData Central, published oxalate and purine lists) and are meant for
+guidance, not as clinical measurements.
+
+Each stone type has daily targets: a lower and/or upper bound per nutrient
+and a weight. A day's nutrient totals score 100 when every target is met,
+falling with the weighted relative distance from each missed bound.
+
+Meal plans fill a fixed set of slots (SLOTS) with one food each. The
+optimizer scores thousands of random plans at once, then improves the
+best few by trying every alternative for one slot at a time, again across
+all plans and alternatives in one array operation. Plans are cached per
+(stone type, constraints).
+"""
+import numpy as np
+
+from cache import LRUCache
+
+NUTRIENTS = ["oxalate", "calcium", "sodium", "purine", "protein", "citrate"]
+UNITS = {"oxalate": "mg", "calcium": "mg", "sodium": "mg", "purine": "mg", "protein": "g", "citrate": "mg"}
+
+# name, serving, group, tags, then one serving's nutrients in NUTRIENTS order.
+# Foods tagged "limit" can be logged and scored but are never put in a plan.
+FOODS = [
+    ("Oatmeal", "1 cup cooked", "breakfast", (), 13, 21, 9, 40, 6, 0),
+    ("Bran flakes", "1 cup", "breakfast", (), 57, 20, 220, 30, 4, 0),
+    ("Corn flakes", "1 cup", "breakfast", (), 1, 1, 200, 10, 2, 0),
+    ("Scrambled eggs", "2 eggs", "breakfast", (), 0, 60, 180, 5, 12, 0),
+    ("Whole wheat toast", "2 slices", "breakfast", (), 12, 60, 300, 40, 7, 0),
+    ("Pancakes", "2 medium", "breakfast", ("dairy",), 8, 150, 420, 20, 6, 0),
+    ("Orange", "1 medium", "fruit", (), 29, 52, 0, 15, 1, 1200),
+    ("Grapefruit", "1/2 fruit", "fruit", (), 6, 27, 0, 10, 1, 1000),
+    ("Banana", "1 medium", "fruit", (), 3, 6, 1, 5, 1, 100),
+    ("Apple", "1 medium", "fruit", (), 1, 11, 2, 5, 0, 0),
+    ("Melon", "1 cup", "fruit", (), 1, 15, 26, 5, 1, 200),
+    ("Berries", "1 cup", "fruit", (), 48, 30, 1, 20, 1, 800),
+    ("Chicken breast", "100 g", "protein", ("meat",), 0, 15, 75, 175, 31, 0),
+    ("Beef steak", "100 g", "protein", ("meat",), 0, 18, 60, 120, 26, 0),
+    ("Ham", "85 g", "protein", ("meat",), 0, 8, 1000, 120, 18, 0),
+    ("Liver", "100 g", "protein", ("meat",), 0, 6, 80, 400, 26, 0),
+    ("Salmon", "100 g", "protein", ("fish",), 0, 12, 60, 170, 22, 0),
+    ("Canned tuna", "100 g", "protein", ("fish",), 0, 11, 300, 116, 25, 0),
+    ("Sardines", "1 can (92 g)", "protein", ("fish",), 0, 350, 300, 320, 23, 0),
+    ("Shrimp", "85 g", "protein", ("fish",), 0, 60, 95, 125, 20, 0),
+    ("Tofu", "1/2 cup", "protein", (), 13, 200, 10, 68, 10, 0),
+    ("Lentils", "1/2 cup cooked", "protein", (), 8, 19, 2, 45, 9, 0),
+    ("Black beans", "1/2 cup cooked", "protein", (), 36, 23, 1, 50, 8, 0),
+    ("Navy beans", "1/2 cup cooked", "protein", (), 76, 63, 0, 50, 8, 0),
+    ("Spinach", "1/2 cup cooked", "vegetable", (), 755, 120, 63, 57, 3, 0),
+    ("Beets", "1/2 cup", "vegetable", (), 76, 14, 65, 15, 1, 0),
+    ("Okra", "1/2 cup", "vegetable", (), 57, 62, 5, 20, 2, 0),
+    ("Rhubarb", "1/2 cup", "vegetable", (), 541, 174, 4, 10, 0, 0),
+    ("Broccoli", "1 cup", "vegetable", (), 2, 60, 60, 55, 4, 0),
+    ("Cauliflower", "1/2 cup", "vegetable", (), 1, 10, 15, 25, 1, 0),
+    ("Kale", "1 cup", "vegetable", (), 2, 90, 30, 30, 3, 0),
+    ("Carrots", "1/2 cup cooked", "vegetable", (), 7, 23, 45, 10, 1, 0),
+    ("Green peas", "1/2 cup", "vegetable", (), 1, 20, 3, 60, 4, 0),
+    ("Salad greens", "2 cups", "vegetable", (), 1, 30, 10, 10, 1, 0),
+    ("Tomato", "1 medium", "vegetable", (), 1, 12, 6, 10, 1, 500),
+    ("Brown rice", "1 cup cooked", "grain", (), 24, 20, 10, 30, 5, 0),
+    ("White rice", "1 cup cooked", "grain", (), 4, 16, 2, 25, 4, 0),
+    ("Pasta", "1 cup cooked", "grain", (), 11, 10, 1, 40, 8, 0),
+    ("Quinoa", "1 cup cooked", "grain", (), 55, 31, 13, 50, 8, 0),
+    ("Couscous", "1 cup cooked", "grain", (), 15, 13, 8, 30, 6, 0),
+    ("Baked potato", "1 medium", "grain", (), 97, 26, 17, 30, 4, 0),
+    ("Sweet potato", "1 cup", "grain", (), 28, 76, 70, 20, 4, 0),
+    ("Greek yogurt", "170 g", "dairy", ("dairy",), 1, 190, 60, 0, 17, 0),
+    ("Low-fat yogurt", "1 cup", "dairy", ("dairy",), 1, 415, 160, 0, 12, 0),
+    ("Cheddar cheese", "1 oz", "dairy", ("dairy",), 0, 200, 180, 0, 7, 0),
+    ("Cottage cheese", "1/2 cup", "dairy", ("dairy",), 0, 70, 460, 0, 12, 0),
+    ("Soy yogurt", "1 cup, calcium-fortified", "dairy", (), 13, 300, 40, 20, 6, 0),
+    ("Nuts", "1 oz almonds", "snack", (), 122, 75, 0, 30, 6, 0),
+    ("Chocolate", "1 oz dark", "snack", (), 35, 20, 6, 10, 2, 0),
+    ("Potato chips", "1 oz", "snack", (), 21, 7, 150, 10, 2, 0),
+    ("Pretzels", "1 oz", "snack", (), 5, 5, 450, 10, 3, 0),
+    ("Popcorn", "3 cups", "snack", (), 4, 2, 5, 20, 3, 0),
+    ("Peanut butter", "2 tbsp", "snack", (), 13, 15, 140, 25, 7, 0),
+    ("Water", "2 glasses", "drink", (), 0, 10, 5, 0, 0, 0),
+    ("Lemonade", "1 cup, fresh lemon", "drink", (), 1, 10, 10, 0, 0, 1500),
+    ("Orange juice", "1 cup", "drink", (), 2, 25, 2, 0, 2, 2000),
+    ("Milk", "1 cup", "drink", ("dairy",), 1, 300, 105, 0, 8, 0),
+    ("Tea", "1 cup black", "drink", (), 14, 0, 7, 0, 0, 0),
+    ("Coffee", "1 cup", "drink", (), 1, 5, 5, 0, 0, 0),
+    ("Cola", "12 oz", "drink", ("limit",), 0, 7, 15, 0, 0, 0),
+    ("Beer", "12 oz", "drink", ("limit",), 1, 14, 14, 40, 2, 0),
+    ("Hot chocolate", "1 cup", "drink", ("dairy",), 65, 250, 150, 10, 8, 0),
+]
+
+FOOD_NAMES = [food[0] for food in FOODS]
+FOOD_INDEX = {name: i for i, name in enumerate(FOOD_NAMES)}
+SERVINGS = [food[1] for food in FOODS]
+GROUPS = np.array([food[2] for food in FOODS])
+TAGS = [frozenset(food[3]) for food in FOODS]
+COMPOSITION = np.array([food[4:] for food in FOODS], dtype=np.float64)
+
+# A day's meals: (meal, food group of each slot)
+SLOTS = [
+    ("Breakfast", ["breakfast", "fruit"]),
+    ("Lunch", ["protein", "grain", "vegetable"]),
+    ("Dinner", ["protein", "vegetable", "grain"]),
+    ("Snacks", ["dairy", "snack"]),
+    ("Drinks", ["drink", "drink"]),
+]
+
+# Daily targets: nutrient -> (minimum or None, maximum or None, weight). Each
+# stone type's targets add to or replace GENERAL_TARGETS.
+TARGETS = {
+    "Calcium Oxalate": {"oxalate": (None, 100, 3), "calcium": (1000, 1500, 2), "sodium": (None, 2300, 2),
+                        "protein": (50, 90, 1), "citrate": (1500, None, 2), "purine": (None, 600, 1)},
+    "Uric Acid": {"purine": (None, 400, 3), "protein": (50, 80, 2), "citrate": (2000, None, 2),
+                  "sodium": (None, 2300, 1), "calcium": (800, None, 1), "oxalate": (None, 200, 1)},
+    "Struvite": {"sodium": (None, 2300, 1), "protein": (50, 90, 1), "calcium": (800, 1200, 1),
+                 "citrate": (1000, None, 1)},
+    "Cystine": {"sodium": (None, 2000, 3), "protein": (40, 60, 3), "citrate": (2000, None, 2),
+                "calcium": (800, None, 1), "oxalate": (None, 200, 1)},
+}
+# Targets for general prevention, used alone when the stone type is not known
+GENERAL_TARGETS = {"oxalate": (None, 200, 1), "calcium": (1000, 1200, 1), "sodium": (None, 2300, 1),
+                   "protein": (50, 90, 1), "citrate": (1000, None, 1), "purine": (None, 600, 1)}
+
+# Health Tracker diet log: level -> daily amount
+PROTEIN_LEVELS = {"Low": 50.0, "Moderate": 80.0, "High": 120.0}
+SODIUM_LEVELS = {"Low": 1500.0, "Moderate": 2800.0, "High": 4500.0}
+PURINE_PER_PROTEIN_G = 5.0
+# The rest of a logged day, before the foods it lists
+BASE_DAY = {"oxalate": 80.0, "calcium": 800.0, "citrate": 300.0}
+CITRUS_SERVING = "Orange juice"
+
+# Optimizer: random plans scored at once, how many are refined, and refinement passes
+PLAN_SAMPLES = 4096
+PLAN_REFINE = 64
+PLAN_PASSES = 3
+PLAN_SEED = 0
+# Upper-bounded nutrients are kept this much further below their limit when targets are met
+MARGIN_WEIGHT = 0.01
+
+CACHE_SIZE = 256
+
+_plan_cache = LRUCache(CACHE_SIZE, name="meal_plans")
+
+
+def targets(stone_type):
+    """Return (low, high, weight) arrays in NUTRIENTS order for a stone type (None for general)."""
+    spec = {**GENERAL_TARGETS, **TARGETS.get(stone_type, {})}
+    low = np.zeros(len(NUTRIENTS))
+    high = np.full(len(NUTRIENTS), np.inf)
+    weight = np.zeros(len(NUTRIENTS))
+    for i, nutrient in enumerate(NUTRIENTS):
+        if nutrient in spec:
+            minimum, maximum, weight[i] = spec[nutrient]
+            low[i] = minimum or 0.0
+            high[i] = np.inf if maximum is None else maximum
+    return low, high, weight
+
+
+def deviations(totals, low, high):
+    """Relative distance of each total from its target range, capped at 1; shape of `totals`."""
+    over = np.maximum(0.0, totals - high) / high
+    under = np.maximum(0.0, low - totals) / np.where(low > 0, low, 1.0)
+    return np.minimum(1.0, over + under)
+
+
+def _cost(totals, low, high, weight):
+    # Weighted mean deviation, plus a small reward for headroom under pure limits
+    cost = (deviations(totals, low, high) * weight).sum(axis=-1) / weight.sum()
+    limits = (low == 0) & np.isfinite(high) & (weight > 0)
+    headroom = np.minimum(1.0, totals[..., limits] / high[limits])
+    return cost + MARGIN_WEIGHT * (headroom * weight[limits]).sum(axis=-1) / weight.sum()
+
+
+def score_totals(totals, stone_type):
+    """Score a day's nutrient totals (NUTRIENTS order) against the stone type's targets.
+
+    Returns a dict with the 0-100 score and, for each targeted nutrient, the
+    total, the target range and whether it is "low", "high" or "ok".
+    """
+    low, high, weight = targets(stone_type)
+    totals = np.asarray(totals, dtype=np.float64)
+    deviation = deviations(totals, low, high)
+    score = 100 * (1 - (deviation * weight).sum() / weight.sum())
+    nutrients = []
+    for i in np.argsort(-deviation * weight, kind="stable"):
+        if weight[i] == 0:
+            continue
+        status = "high" if totals[i] > high[i] else "low" if totals[i] < low[i] else "ok"
+        nutrients.append({
+            "nutrient": NUTRIENTS[i], "total": round(float(totals[i]), 1), "unit": UNITS[NUTRIENTS[i]],
+            "min": float(low[i]) or None, "max": None if np.isinf(high[i]) else float(high[i]), "status": status,
+        })
+    return {"score": int(round(score)), "nutrients": nutrients}
+
+
+def log_totals(protein_intake=None, sodium_intake=None, oxalate_foods=(), citrus_intake=False):
+    """Estimate a day's nutrient totals (NUTRIENTS order) from a Health Tracker diet log.
+
+    Protein and sodium come from the logged levels (purines scale with
+    protein); the listed foods and citrus add one serving each on top of
+    BASE_DAY. Unknown foods (e.g. "None") are ignored.
+    """
+    totals = np.array([BASE_DAY.get(nutrient, 0.0) for nutrient in NUTRIENTS])
+    foods = [FOOD_INDEX[food] for food in oxalate_foods or () if food in FOOD_INDEX]
+    if citrus_intake:
+        foods.append(FOOD_INDEX[CITRUS_SERVING])
+    if foods:
+        totals += COMPOSITION[foods].sum(axis=0)
+    protein = PROTEIN_LEVELS.get(protein_intake, PROTEIN_LEVELS["Moderate"])
+    totals[NUTRIENTS.index("protein")] = protein
+    totals[NUTRIENTS.index("purine")] = protein * PURINE_PER_PROTEIN_G
+    totals[NUTRIENTS.index("sodium")] = SODIUM_LEVELS.get(sodium_intake, SODIUM_LEVELS["Moderate"])
+    return totals
+
+
+def score_day(entry, stone_type):
+    """score_totals() for a Health Tracker entry (a dict with the diet log fields)."""
+    return score_totals(log_totals(entry.get("protein_intake"), entry.get("sodium_intake"),
+                                   entry.get("oxalate_foods"), entry.get("citrus_intake")), stone_type)
+
+
+def allowed_foods(vegetarian=False, dairy_free=False, exclude=()):
+    """Return a boolean mask over FOOD_NAMES of the foods a plan may use."""
+    unknown = set(exclude) - set(FOOD_INDEX)
+    if unknown:
+        raise ValueError(f"Unknown food(s): {', '.join(sorted(unknown))}")
+    banned = {"limit"}
+    if vegetarian:
+        banned |= {"meat", "fish"}
+    if dairy_free:
+        banned.add("dairy")
+    return np.array([not (tags & banned) and name not in exclude for name, tags in zip(FOOD_NAMES, TAGS)])
+
+
+def _optimize(choices, low, high, weight, rng):
+    # choices[p]: food indices allowed in slot p. Returns the best plan's food indices.
+    slots = len(choices)
+    picks = np.stack([rng.choice(options, PLAN_SAMPLES) for options in choices], axis=1)
+    totals = COMPOSITION[picks].sum(axis=1)
+    cost = _cost(totals, low, high, weight)
+    # A food used twice in one plan rules the plan out
+    ordered = np.sort(picks, axis=1)
+    cost[(ordered[:, 1:] == ordered[:, :-1]).any(axis=1)] = np.inf
+    keep = np.argsort(cost, kind="stable")[:PLAN_REFINE]
+    picks, totals = picks[keep], totals[keep]
+    rows = np.arange(len(picks))
+
+    for _ in range(PLAN_PASSES):
+        for slot in range(slots):
+            options = choices[slot]
+            # Totals with this slot swapped for each alternative: (plans, alternatives, nutrients)
+            swapped = totals[:, None, :] - COMPOSITION[picks[:, slot]][:, None, :] + COMPOSITION[options][None]
+            swap_cost = _cost(swapped, low, high, weight)
+            others = np.delete(picks, slot, axis=1)
+            swap_cost[(others[:, :, None] == options[None, None, :]).any(axis=1)] = np.inf
+            best = swap_cost.argmin(axis=1)
+            picks[:, slot] = options[best]
+            totals = swapped[rows, best]
+
+    best = _cost(totals, low, high, weight).argmin()
+    return picks[best]
+
+
+def meal_plan(stone_type, vegetarian=False, dairy_free=False, exclude=()):
+    """Return a one-day meal plan suited to the stone type (None for general prevention).
+
+    The result is a dict with "meals" (meal, food, serving) rows, the
+    plan's nutrient "totals" and its score_totals() "score" and
+    "nutrients". Plans are cached per (stone type, constraints); raises
+    ValueError if the constraints leave a slot without enough foods.
+    """
+    key = (stone_type if stone_type in TARGETS else None, bool(vegetarian), bool(dairy_free),
+           tuple(sorted(set(exclude))))
+    plan = _plan_cache.get(key)
+    if plan is not None:
+        return plan
+
+    allowed = allowed_foods(vegetarian, dairy_free, exclude)
+    groups = [group for _, slot_groups in SLOTS for group in slot_groups]
+    choices = []
+    for group in groups:
+        options = np.flatnonzero(allowed & (GROUPS == group))
+        if len(options) < groups.count(group):
+            raise ValueError(f"Not enough {group} foods left to plan a day; exclude fewer foods")
+        choices.append(options)
+
+    low, high, weight = targets(key[0])
+    picks = iter(_optimize(choices, low, high, weight, np.random.default_rng(PLAN_SEED)))
+    meals = [{"meal": meal, "food": FOOD_NAMES[food], "serving": SERVINGS[food]}
+             for meal, slot_groups in SLOTS for food in (next(picks) for _ in slot_groups)]
+    totals = COMPOSITION[[FOOD_INDEX[row["food"]] for row in meals]].sum(axis=0)
+    plan = {"meals": meals, "totals": dict(zip(NUTRIENTS, totals.round(1).tolist())),
+            **score_totals(totals, key[0])}
+    _plan_cache.put(key, plan)
+    return plan
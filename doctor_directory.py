@@ -0,0 +1,232 @@
+"""Searchable specialist directory.
+
+Doctors are stored column-wise in NumPy arrays, with inverted indexes from
+specialty and hospital to row ids, a rating-sorted index and a sorted token
+array for name prefix search. A query intersects the matching id sets,
+ranks them for the patient and only materializes the requested page, so the
+cost of rendering stays flat however many doctors are loaded.
+
+Row numbers depend on load order, so bookings refer to doctors by
+doctor_id(): the CSV's `id` column when there is one, otherwise a hash of
+name and hospital.
+"""
+import csv
+import hashlib
+import re
+
+import numpy as np
+
+PAGE_SIZE = 10
+
+# How well each specialty fits the patient, before stone-type adjustments
+SURGICAL_RELEVANCE = {"Urological Surgery": 1.0, "Urology": 0.8, "Nephrology": 0.3, "Dietetics & Nutrition": 0.1}
+CONSERVATIVE_RELEVANCE = {"Nephrology": 1.0, "Urology": 0.7, "Dietetics & Nutrition": 0.5, "Urological Surgery": 0.3}
+
+# Extra relevance for specialties suited to a stone type
+STONE_TYPE_BOOST = {
+    "Calcium Oxalate": {"Dietetics & Nutrition": 0.3},
+    "Uric Acid": {"Nephrology": 0.3, "Dietetics & Nutrition": 0.2},
+    "Struvite": {"Urology": 0.3},
+    "Cystine": {"Nephrology": 0.3},
+}
+
+# Relevance dominates ranking; rating (0-5) breaks ties within a specialty tier
+RELEVANCE_WEIGHT = 5.0
+TIE_BREAK = 1e-9
+
+_YEARS = re.compile(r"\d+")
+
+
+def _parse_years(value):
+    match = _YEARS.search(str(value))
+    return int(match.group()) if match else 0
+
+
+def _name_tokens(name):
+    # "Dr. Sarah Johnson" is searchable as "sarah johnson", "sarah" and "johnson"
+    plain = re.sub(r"^dr\.?\s+", "", name.strip().lower())
+    return {plain, *plain.split()}
+
+
+def doctor_id(record):
+    """Return the stable id of a directory record, as a non-negative 63-bit int.
+
+    An integer `id` column is used as is; any other id, or name and hospital
+    when there is no id, is hashed. Without an id column a doctor who moves
+    hospital gets a new id.
+    """
+    value = str(record.get("id") or "").strip()
+    if value.isdigit():
+        return int(value)
+    key = value or f"{record['name'].strip()}\n{record['hospital'].strip()}"
+    return int.from_bytes(hashlib.blake2b(key.encode("utf-8"), digest_size=8).digest(), "big") >> 1
+
+
+class DoctorDirectory:
+    """Column-oriented doctor directory with secondary indexes."""
+
+    def __init__(self, records):
+        records = list(records)
+        self.ids = np.array([doctor_id(record) for record in records], dtype=np.int64)
+        self._row_for_id = {int(value): row for row, value in enumerate(self.ids)}
+        if len(self._row_for_id) < len(records):
+            raise ValueError("Doctor ids must be unique; add an id column to tell apart doctors "
+                             "with the same name and hospital")
+        self.names = np.array([record["name"] for record in records], dtype=object)
+        self.specialties, specialty_codes = np.unique(
+            [record["specialty"] for record in records], return_inverse=True)
+        self.hospitals, hospital_codes = np.unique(
+            [record["hospital"] for record in records], return_inverse=True)
+        self.specialty_codes = specialty_codes.astype(np.int32)
+        self.hospital_codes = hospital_codes.astype(np.int32)
+        self.ratings = np.array([float(record["rating"]) for record in records], dtype=np.float32)
+        self.experience_years = np.array([_parse_years(record["experience"]) for record in records], dtype=np.int16)
+
+        # Inverted indexes: code -> sorted row ids
+        self._by_specialty = self._group(self.specialty_codes, len(self.specialties))
+        self._by_hospital = self._group(self.hospital_codes, len(self.hospitals))
+        self._hospital_keys = np.array([hospital.lower() for hospital in self.hospitals])
+
+        # Rating index: row ids ordered by rating, for range queries
+        self._rating_order = np.argsort(self.ratings, kind="stable")
+        self._sorted_ratings = self.ratings[self._rating_order]
+
+        # Name prefix index: sorted tokens with the row id each belongs to
+        tokens, token_ids = [], []
+        for row, name in enumerate(self.names):
+            for token in _name_tokens(name):
+                tokens.append(token)
+                token_ids.append(row)
+        order = np.argsort(np.array(tokens), kind="stable")
+        self._tokens = np.array(tokens)[order]
+        self._token_ids = np.array(token_ids, dtype=np.int64)[order]
+
+    @staticmethod
+    def _group(codes, size):
+        order = np.argsort(codes, kind="stable")
+        bounds = np.searchsorted(codes[order], np.arange(size + 1))
+        return [order[bounds[i]:bounds[i + 1]] for i in range(size)]
+
+    @classmethod
+    def from_csv(cls, path):
+        """Load a directory from a CSV with name, specialty, experience, hospital and rating columns.
+
+        An optional id column gives each doctor a stable booking id.
+        """
+        with open(path, newline="", encoding="utf-8") as handle:
+            return cls(csv.DictReader(handle))
+
+    def __len__(self):
+        return len(self.names)
+
+    @staticmethod
+    def _prefix_range(sorted_keys, prefix):
+        lo = np.searchsorted(sorted_keys, prefix, side="left")
+        hi = np.searchsorted(sorted_keys, prefix + "\U0010ffff", side="left")
+        return lo, hi
+
+    def ids_for_name_prefix(self, prefix):
+        lo, hi = self._prefix_range(self._tokens, prefix.strip().lower())
+        return np.unique(self._token_ids[lo:hi])
+
+    def ids_for_specialties(self, specialties):
+        codes = np.searchsorted(self.specialties, specialties)
+        groups = [self._by_specialty[code] for code, specialty in zip(codes, specialties)
+                  if code < len(self.specialties) and self.specialties[code] == specialty]
+        return np.unique(np.concatenate(groups)) if groups else np.empty(0, dtype=np.int64)
+
+    def ids_for_hospital_prefix(self, prefix):
+        # Hospitals are few compared to doctors, so a linear scan of names is cheap
+        matches = np.flatnonzero(np.char.startswith(self._hospital_keys, prefix.strip().lower()))
+        groups = [self._by_hospital[code] for code in matches]
+        return np.unique(np.concatenate(groups)) if groups else np.empty(0, dtype=np.int64)
+
+    def ids_for_min_rating(self, min_rating):
+        # Compare in float32 so a doctor rated exactly min_rating is included
+        start = np.searchsorted(self._sorted_ratings, np.float32(min_rating), side="left")
+        return np.sort(self._rating_order[start:])
+
+    def relevance(self, stone_type=None, surgery_needed=False):
+        """Return the patient's relevance score for each specialty code."""
+        table = dict(SURGICAL_RELEVANCE if surgery_needed else CONSERVATIVE_RELEVANCE)
+        for specialty, boost in STONE_TYPE_BOOST.get(stone_type, {}).items():
+            table[specialty] = table.get(specialty, 0.0) + boost
+        return np.array([table.get(specialty, 0.0) for specialty in self.specialties], dtype=np.float32)
+
+    def search(self, name_prefix="", specialties=None, hospital_prefix="", min_rating=0.0,
+               stone_type=None, surgery_needed=False, page=0, page_size=PAGE_SIZE):
+        """Filter, rank and paginate the directory.
+
+        Returns (total_matches, page_records), where page_records is a list of
+        dicts for the requested page only. page_size=0 just counts matches.
+        """
+        candidates = None
+        for ids in self._filters(name_prefix, specialties, hospital_prefix, min_rating):
+            candidates = ids if candidates is None else np.intersect1d(candidates, ids, assume_unique=True)
+        if candidates is None:
+            candidates = np.arange(len(self))
+
+        total = len(candidates)
+        start = page * page_size
+        if page_size <= 0 or start >= total:
+            return total, []
+
+        scores = (RELEVANCE_WEIGHT * self.relevance(stone_type, surgery_needed)[self.specialty_codes[candidates]]
+                  + self.ratings[candidates]).astype(np.float64)
+        # Break ties by row id (well below the 0.1 rating step) so pages never overlap
+        scores -= candidates * TIE_BREAK
+        # Only the top (page + 1) * page_size need ordering
+        stop = min(total, start + page_size)
+        if stop < total:
+            top = np.argpartition(-scores, stop - 1)[:stop]
+        else:
+            top = np.arange(total)
+        top = top[np.argsort(-scores[top])]
+        return total, [self.record(row) for row in candidates[top[start:stop]]]
+
+    def _filters(self, name_prefix, specialties, hospital_prefix, min_rating):
+        if name_prefix and name_prefix.strip():
+            yield self.ids_for_name_prefix(name_prefix)
+        if specialties:
+            yield self.ids_for_specialties(list(specialties))
+        if hospital_prefix and hospital_prefix.strip():
+            yield self.ids_for_hospital_prefix(hospital_prefix)
+        if min_rating:
+            yield self.ids_for_min_rating(min_rating)
+
+    def doctor(self, doctor_id):
+        """Return the record for a stable doctor id; raises KeyError if unknown."""
+        return self.record(self._row_for_id[doctor_id])
+
+    def record(self, row):
+        return {
+            "id": int(self.ids[row]),
+            "name": str(self.names[row]),
+            "specialty": str(self.specialties[self.specialty_codes[row]]),
+            "experience": f"{self.experience_years[row]} years",
+            "hospital": str(self.hospitals[self.hospital_codes[row]]),
+            "rating": round(float(self.ratings[row]), 1),
+        }
+
+
+def synthetic_records(count, seed=0):
+    """Generate `count` plausible doctor records, e.g. for load testing."""
+    rng = np.random.default_rng(seed)
+    first = ["Sarah", "Michael", "Emily", "James", "Lisa", "David", "Priya", "Omar", "Anna", "Wei",
+             "Carlos", "Fatima", "John", "Mei", "Ravi", "Elena", "Kwame", "Sofia", "Ahmed", "Grace"]
+    last = ["Johnson", "Chen", "Rodriguez", "Wilson", "Patel", "Kim", "Singh", "Garcia", "Müller", "Okafor",
+            "Nguyen", "Rossi", "Cohen", "Sato", "Ivanova", "Brown", "Silva", "Haddad", "Larsen", "Kaur"]
+    specialties = list(CONSERVATIVE_RELEVANCE)
+    hospitals = [f"{city} {kind}" for city in ["North", "South", "East", "West", "Central", "Lakeside",
+                                               "Riverside", "Hillview", "Harbor", "Valley"]
+                 for kind in ["General Hospital", "Medical Center", "Kidney Institute", "Clinic", "University Hospital"]]
+    for i in range(count):
+        # Generated names and hospitals repeat, so each record carries its own id
+        yield {
+            "id": i,
+            "name": f"Dr. {first[rng.integers(len(first))]} {last[rng.integers(len(last))]}",
+            "specialty": specialties[rng.integers(len(specialties))],
+            "experience": f"{rng.integers(2, 40)} years",
+            "hospital": hospitals[rng.integers(len(hospitals))],
+            "rating": round(float(rng.uniform(3.0, 5.0)), 1),
+        }
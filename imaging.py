@@ -0,0 +1,225 @@
+"""Kidney stone detection and sizing for uploaded X-ray, CT and ultrasound images.
+
+Stones show up as small, compact, bright regions on all three modalities. Each
+image is converted to grayscale, downsampled if it is very large, and passed
+through a white top-hat filter (applied tile by tile) that keeps bright
+structures smaller than the largest plausible stone and removes bone, soft
+tissue and background. Connected regions above a contrast threshold are then
+measured with scikit-image.
+
+A CT upload may also be a whole multi-slice study, which ct_volume.py
+segments and measures in 3D.
+
+Images are analyzed in a process pool so a slow CT does not hold up the other
+modalities. Workers memory-map the ingested files rather than receiving their
+bytes, and results are cached by the files' content digests.
+"""
+from concurrent.futures import as_completed
+from concurrent.futures.process import BrokenProcessPool
+
+import cv2
+import numpy as np
+from skimage import measure
+
+from cache import LRUCache
+from ingest import open_mmap
+from workers import get_pool, reset_pool
+
+MODALITIES = ["xray", "ct", "ultrasound"]
+
+# Preferred source of the stone list when several modalities are uploaded
+MODALITY_PRIORITY = ["ct", "xray", "ultrasound"]
+
+# Assumed physical width covered by an uploaded image, used to convert pixels to mm
+FIELD_OF_VIEW_MM = {"xray": 350.0, "ct": 350.0, "ultrasound": 150.0}
+
+# Images larger than this (in pixels, longest side) are downsampled first
+MAX_DIMENSION = 2048
+TILE_SIZE = 512
+
+# Plausible stone sizes and detection limits
+MIN_STONE_MM = 1.0
+MAX_STONE_MM = 30.0
+MIN_SOLIDITY = 0.8
+MIN_CONTRAST = 40
+MAX_STONES = 5
+
+CACHE_SIZE = 256
+
+_result_cache = LRUCache(CACHE_SIZE, name="imaging_results")
+
+
+def decode_image(data):
+    """Decode image bytes to a 2D uint8 grayscale array."""
+    image = cv2.imdecode(np.frombuffer(data, dtype=np.uint8), cv2.IMREAD_GRAYSCALE)
+    if image is None:
+        raise ValueError("Could not decode image")
+    return image
+
+
+def downsample(image, max_dimension=MAX_DIMENSION):
+    """Shrink `image` so its longest side is at most `max_dimension` pixels."""
+    height, width = image.shape
+    longest = max(height, width)
+    if longest <= max_dimension:
+        return image
+    scale = max_dimension / longest
+    size = (max(1, round(width * scale)), max(1, round(height * scale)))
+    return cv2.resize(image, size, interpolation=cv2.INTER_AREA)
+
+
+def tiled_tophat(image, kernel, tile_size=TILE_SIZE):
+    """White top-hat of `image`, computed on overlapping tiles to bound memory."""
+    margin = max(kernel.shape) // 2 + 1
+    height, width = image.shape
+    result = np.empty_like(image)
+    for top in range(0, height, tile_size):
+        for left in range(0, width, tile_size):
+            y0, x0 = max(0, top - margin), max(0, left - margin)
+            y1, x1 = min(height, top + tile_size + margin), min(width, left + tile_size + margin)
+            filtered = cv2.morphologyEx(image[y0:y1, x0:x1], cv2.MORPH_TOPHAT, kernel)
+            bottom, right = min(height, top + tile_size), min(width, left + tile_size)
+            result[top:bottom, left:right] = filtered[top - y0:bottom - y0, left - x0:right - x0]
+    return result
+
+
+def tophat_kernel(mm_per_pixel):
+    """Structuring element for a top-hat that keeps bright structures up to MAX_STONE_MM across."""
+    kernel_size = int(np.clip(MAX_STONE_MM / mm_per_pixel, 3, TILE_SIZE // 2)) | 1
+    # A rectangular kernel is separable, so the top-hat stays cheap at large sizes
+    return cv2.getStructuringElement(cv2.MORPH_RECT, (kernel_size, kernel_size))
+
+
+def stone_location(x, y):
+    """Map a normalized centroid to an anatomical location.
+
+    Assumes a standard frontal (AP/coronal) view in radiological convention,
+    i.e. the patient's right side is on the left of the image.
+    """
+    side = "Right" if x < 0.5 else "Left"
+    if y < 0.3:
+        return f"{side} kidney upper pole"
+    if y < 0.5:
+        return f"{side} kidney lower pole"
+    if y < 0.8:
+        return f"{side} ureter"
+    return "Bladder"
+
+
+def analyze_image(data, modality):
+    """Detect and measure stones in one encoded image.
+
+    Returns a dict with the modality, the mm-per-pixel scale used and a list
+    of stones (largest first), each with its size in mm and location.
+    """
+    if modality not in FIELD_OF_VIEW_MM:
+        raise ValueError(f"Unknown modality '{modality}'")
+
+    image = downsample(decode_image(data))
+    height, width = image.shape
+    mm_per_pixel = FIELD_OF_VIEW_MM[modality] / width
+
+    if modality == "ultrasound":
+        # Suppress speckle before looking for echogenic foci
+        image = cv2.medianBlur(image, 5)
+    else:
+        image = cv2.GaussianBlur(image, (3, 3), 0)
+
+    tophat = tiled_tophat(image, tophat_kernel(mm_per_pixel))
+
+    threshold = max(MIN_CONTRAST, float(tophat.mean() + 3 * tophat.std()))
+    mask = (tophat > threshold).astype(np.uint8)
+    # Drop isolated noise pixels before labelling
+    mask = cv2.morphologyEx(mask, cv2.MORPH_OPEN, cv2.getStructuringElement(cv2.MORPH_ELLIPSE, (3, 3)))
+    labels = measure.label(mask, connectivity=2)
+
+    stones = []
+    for region in measure.regionprops(labels):
+        size_mm = region.axis_major_length * mm_per_pixel
+        if not MIN_STONE_MM <= size_mm <= MAX_STONE_MM or region.solidity < MIN_SOLIDITY:
+            continue
+        y, x = region.centroid
+        stones.append({
+            "size_mm": round(float(size_mm), 1),
+            "location": stone_location(x / width, y / height),
+        })
+
+    stones.sort(key=lambda stone: stone["size_mm"], reverse=True)
+    return {"modality": modality, "mm_per_pixel": mm_per_pixel, "stones": stones[:MAX_STONES]}
+
+
+def analyze_blob(handle, modality, slice_thickness_mm=None):
+    """analyze_image() for an ingested upload, read through a memory map.
+
+    CT uploads holding a whole study (a zip of slices or a .npy volume) are
+    measured in 3D by ct_volume.analyze_volume() instead, with
+    `slice_thickness_mm` if given.
+    """
+    if modality == "ct":
+        # Imported here: ct_volume builds on this module
+        from ct_volume import analyze_volume, volume_format
+        if volume_format(handle) is not None:
+            return analyze_volume(handle, slice_thickness_mm)
+    with open_mmap(handle) as data:
+        return analyze_image(data, modality)
+
+
+def analyze_images(images, on_result=None, slice_thickness_mm=None):
+    """Analyze several modalities in parallel.
+
+    `images` maps a modality name to the BlobHandle of an ingested upload,
+    and `slice_thickness_mm` is the user-supplied spacing of a CT study.
+    Returns a dict of modality to analyze_image() result. Workers read the
+    files from disk, and cached results (keyed by content digest) are
+    returned without touching the process pool. If given,
+    `on_result(modality, result)` is called as each modality finishes.
+    """
+    results = {}
+    pending = {}
+    for modality, handle in images.items():
+        key = (modality, handle.digest, slice_thickness_mm if modality == "ct" else None)
+        cached = _result_cache.get(key)
+        if cached is not None:
+            results[modality] = cached
+            if on_result is not None:
+                on_result(modality, cached)
+        else:
+            pending[modality] = (key, handle)
+
+    if len(pending) == 1:
+        # Not worth a round trip through the pool
+        (modality, (key, handle)), = pending.items()
+        results[modality] = analyze_blob(handle, modality, slice_thickness_mm)
+        _result_cache.put(key, results[modality])
+        if on_result is not None:
+            on_result(modality, results[modality])
+    elif pending:
+        pool = get_pool()
+        futures = {pool.submit(analyze_blob, handle, modality, slice_thickness_mm): modality
+                   for modality, (key, handle) in pending.items()}
+        for future in as_completed(futures):
+            modality = futures[future]
+            try:
+                results[modality] = future.result()
+            except BrokenProcessPool:
+                reset_pool(pool)
+                raise
+            _result_cache.put(pending[modality][0], results[modality])
+            if on_result is not None:
+                on_result(modality, results[modality])
+
+    return results
+
+
+def combine_results(results):
+    """Combine the per-modality results of analyze_images().
+
+    Returns a dict with the stone list of the most reliable modality that
+    found stones, and a CT study's slice thickness and whether it was
+    assumed (None and False without one).
+    """
+    stones = next((results[modality]["stones"] for modality in MODALITY_PRIORITY
+                   if modality in results and results[modality]["stones"]), [])
+    ct = results.get("ct", {})
+    return {"stones": stones, "slice_thickness_mm": ct.get("slice_thickness_mm"),
+            "slice_thickness_assumed": ct.get("slice_thickness_assumed", False)}
@@ -0,0 +1,244 @@
+"""Content-addressed on-disk store for uploaded documents.
+
+Uploads are streamed to disk in fixed-size chunks while being hashed, and
+stored under their SHA-256 digest, so the same file uploaded twice (by one
+patient or by many) is kept once. Callers hold a small BlobHandle instead of
+the file's bytes and read the content back through a memory map or in
+chunks.
+
+An SQLite index next to the blobs records each blob's size and last use
+and which sessions hold it. A blob is deleted when the last session that
+uploaded it ends (release()), when it has not been uploaded again for
+BLOB_TTL, or, least recently used first, while the store is over
+MAX_BYTES (collect_garbage(), run at most every GC_INTERVAL after an
+upload). Blobs used in the last MIN_AGE seconds are never evicted, since
+an analysis may still be reading them.
+"""
+import hashlib
+import mmap
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+from collections import namedtuple
+from contextlib import contextmanager
+
+import metrics
+from config import data_dir, data_path
+
+BLOB_DIR = "blobs"
+INDEX_FILE = "index.db"
+CHUNK_SIZE = 1024 * 1024
+
+MAX_BYTES = int(float(os.environ.get("NEPHROCARE_BLOB_STORE_MB") or 2048) * 1024 * 1024)
+BLOB_TTL = 30 * 24 * 60 * 60
+MIN_AGE = 60 * 60
+GC_INTERVAL = 10 * 60
+
+BUSY_TIMEOUT = 30.0
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS blob (
+    digest TEXT PRIMARY KEY,
+    size INTEGER NOT NULL,
+    last_used REAL NOT NULL
+) WITHOUT ROWID;
+
+CREATE INDEX IF NOT EXISTS blob_last_used ON blob (last_used);
+
+CREATE TABLE IF NOT EXISTS blob_owner (
+    session_id TEXT NOT NULL,
+    digest TEXT NOT NULL,
+    PRIMARY KEY (session_id, digest)
+) WITHOUT ROWID;
+
+CREATE INDEX IF NOT EXISTS blob_owner_digest ON blob_owner (digest);
+"""
+
+# What session state keeps per upload: a few short strings and an int
+BlobHandle = namedtuple("BlobHandle", ["digest", "name", "size", "mime"])
+
+
+def blob_path(digest):
+    """Return the path a blob is stored at, sharded by the first two hex digits."""
+    return data_path(BLOB_DIR, digest[:2], digest)
+
+
+_local = threading.local()
+_last_gc = 0.0
+_gc_lock = threading.Lock()
+
+
+def _connection():
+    # One connection per thread; BEGIN IMMEDIATE serializes index updates across them and across processes
+    conn = getattr(_local, "conn", None)
+    if conn is None:
+        conn = sqlite3.connect(data_path(BLOB_DIR, INDEX_FILE), timeout=BUSY_TIMEOUT, isolation_level=None)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.executescript(SCHEMA)
+        if conn.execute("SELECT 1 FROM blob LIMIT 1").fetchone() is None:
+            _index_existing(conn)
+        _local.conn = conn
+    return conn
+
+
+def _index_existing(conn):
+    # Blobs stored before the index existed, last used as of their mtime
+    rows = []
+    for shard in os.scandir(data_dir(BLOB_DIR)):
+        if shard.is_dir() and len(shard.name) == 2:
+            for entry in os.scandir(shard.path):
+                stat = entry.stat()
+                rows.append((entry.name, stat.st_size, stat.st_mtime))
+    conn.executemany("INSERT OR IGNORE INTO blob (digest, size, last_used) VALUES (?, ?, ?)", rows)
+
+
+@contextmanager
+def _transaction():
+    conn = _connection()
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        yield conn
+    except BaseException:
+        conn.execute("ROLLBACK")
+        raise
+    conn.execute("COMMIT")
+
+
+def _remove(conn, digests):
+    # Drop blobs from the index and the disk; called inside a transaction
+    conn.executemany("DELETE FROM blob WHERE digest = ?", [(digest,) for digest in digests])
+    conn.executemany("DELETE FROM blob_owner WHERE digest = ?", [(digest,) for digest in digests])
+    for digest in digests:
+        try:
+            os.remove(blob_path(digest))
+        except FileNotFoundError:
+            pass
+    metrics.increment("blobs_deleted", len(digests))
+
+
+def ingest(fileobj, name, mime=None, chunk_size=CHUNK_SIZE, owner=None):
+    """Stream a binary file object into the store and return its BlobHandle.
+
+    `owner` is the session the upload belongs to; the blob is deleted once
+    every owning session has been released.
+    """
+    hasher = hashlib.sha256()
+    size = 0
+    # Written next to the store so the final rename never crosses filesystems
+    fd, tmp_path = tempfile.mkstemp(dir=data_dir(BLOB_DIR, "tmp"))
+    try:
+        with os.fdopen(fd, "wb") as out:
+            while True:
+                chunk = fileobj.read(chunk_size)
+                if not chunk:
+                    break
+                hasher.update(chunk)
+                out.write(chunk)
+                size += len(chunk)
+        digest = hasher.hexdigest()
+        final_path = blob_path(digest)
+        # In one transaction with the index, so garbage collection cannot delete the blob in between
+        with _transaction() as conn:
+            if os.path.exists(final_path):
+                # Already stored: keep the existing copy
+                os.remove(tmp_path)
+                metrics.increment("uploads_deduplicated")
+            else:
+                os.replace(tmp_path, final_path)
+            conn.execute("INSERT INTO blob (digest, size, last_used) VALUES (?, ?, ?) "
+                         "ON CONFLICT (digest) DO UPDATE SET last_used = excluded.last_used",
+                         (digest, size, time.time()))
+            if owner is not None:
+                conn.execute("INSERT OR IGNORE INTO blob_owner (session_id, digest) VALUES (?, ?)",
+                             (owner, digest))
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    metrics.increment("uploads")
+    metrics.increment("upload_bytes", size)
+    _maybe_collect()
+    return BlobHandle(digest, name, size, mime)
+
+
+def ingest_upload(upload, chunk_size=CHUNK_SIZE, owner=None):
+    """Ingest a Streamlit UploadedFile."""
+    upload.seek(0)
+    return ingest(upload, upload.name, upload.type, chunk_size, owner)
+
+
+def release(owner):
+    """Forget a session's uploads, deleting blobs no other session holds; returns how many."""
+    with _transaction() as conn:
+        digests = [digest for digest, in conn.execute(
+            "SELECT digest FROM blob_owner WHERE session_id = ?", (owner,))]
+        conn.execute("DELETE FROM blob_owner WHERE session_id = ?", (owner,))
+        orphaned = [digest for digest in digests
+                    if conn.execute("SELECT 1 FROM blob_owner WHERE digest = ?", (digest,)).fetchone() is None]
+        _remove(conn, orphaned)
+    return len(orphaned)
+
+
+def collect_garbage(now=None, max_bytes=None, ttl=BLOB_TTL, min_age=MIN_AGE):
+    """Delete blobs unused for `ttl`, then the least recently used while over `max_bytes`.
+
+    Returns how many blobs were deleted.
+    """
+    now = now or time.time()
+    max_bytes = MAX_BYTES if max_bytes is None else max_bytes
+    with _transaction() as conn:
+        expired = [digest for digest, in conn.execute(
+            "SELECT digest FROM blob WHERE last_used < ?", (now - ttl,))]
+        _remove(conn, expired)
+        total = conn.execute("SELECT COALESCE(SUM(size), 0) FROM blob").fetchone()[0]
+        evicted = []
+        if total > max_bytes:
+            for digest, size in conn.execute(
+                    "SELECT digest, size FROM blob WHERE last_used < ? ORDER BY last_used", (now - min_age,)):
+                if total <= max_bytes:
+                    break
+                evicted.append(digest)
+                total -= size
+            _remove(conn, evicted)
+    return len(expired) + len(evicted)
+
+
+def _maybe_collect():
+    global _last_gc
+    now = time.time()
+    with _gc_lock:
+        if now - _last_gc < GC_INTERVAL:
+            return
+        _last_gc = now
+    collect_garbage(now)
+
+
+def exists(handle):
+    return os.path.exists(blob_path(handle.digest))
+
+
+@contextmanager
+def open_mmap(handle):
+    """Memory-map a stored blob read-only; yields a bytes-like object."""
+    if handle.size == 0:
+        yield b""
+        return
+    with open(blob_path(handle.digest), "rb") as f:
+        mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            yield mapped
+        finally:
+            mapped.close()
+
+
+def iter_chunks(handle, chunk_size=CHUNK_SIZE):
+    """Yield a stored blob's content in chunks of at most `chunk_size` bytes."""
+    with open(blob_path(handle.digest), "rb") as f:
+        while True:
+            chunk = f.read(chunk_size)
+            if not chunk:
+                return
+            yield chunk
@@ -0,0 +1,124 @@
+"""Background job queue for long-running work started from the app.
+
+Jobs run on a shared worker pool and are recorded in a job table keyed by
+session id, so a Streamlit script run can submit work, return immediately and
+pick the result up on a later rerun, even after visiting other pages.
+Finished jobs are dropped JOB_TTL seconds after they finish, checked
+whenever a job is submitted or looked up.
+"""
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+QUEUED = "queued"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+
+MAX_WORKERS = 4
+
+# Finished jobs are dropped from the table after this many seconds
+JOB_TTL = 60 * 60
+
+
+class Job:
+    """State of one submitted job, updated by the worker and read by the app."""
+
+    def __init__(self, session_id, name):
+        self.id = uuid.uuid4().hex
+        self.session_id = session_id
+        self.name = name
+        self.status = QUEUED
+        self.progress = 0.0
+        self.stage = "Queued"
+        self.result = None
+        self.error = None
+        self.submitted_at = time.time()
+        self.finished_at = None
+
+    @property
+    def finished(self):
+        return self.status in (DONE, FAILED)
+
+    def report(self, progress, stage=None):
+        """Progress callback handed to the job function (0.0 to 1.0)."""
+        self.progress = min(1.0, max(self.progress, float(progress)))
+        if stage is not None:
+            self.stage = stage
+
+
+class JobManager:
+    """Worker pool plus a job table holding the latest job per session and name."""
+
+    def __init__(self, max_workers=MAX_WORKERS, ttl=JOB_TTL):
+        self.ttl = ttl
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="nephrocare-job")
+        self._jobs = {}
+        self._lock = threading.Lock()
+
+    def submit(self, session_id, name, fn, *args, **kwargs):
+        """Run `fn(*args, progress=job.report, **kwargs)` in the background.
+
+        Replaces any earlier job with the same session and name and returns
+        the new Job. If that earlier job is still running it is returned
+        instead and nothing new is submitted.
+        """
+        self._prune()
+        with self._lock:
+            current = self._jobs.get((session_id, name))
+            if current is not None and not current.finished:
+                return current
+            job = Job(session_id, name)
+            self._jobs[(session_id, name)] = job
+        self._executor.submit(self._run, job, fn, args, kwargs)
+        return job
+
+    def get(self, session_id, name):
+        self._prune()
+        with self._lock:
+            return self._jobs.get((session_id, name))
+
+    def discard(self, session_id, name):
+        with self._lock:
+            self._jobs.pop((session_id, name), None)
+
+    def _run(self, job, fn, args, kwargs):
+        job.status = RUNNING
+        job.stage = "Starting"
+        try:
+            job.result = fn(*args, progress=job.report, **kwargs)
+        except Exception as exc:
+            job.error = f"{type(exc).__name__}: {exc}"
+            status = FAILED
+        else:
+            job.report(1.0, "Complete")
+            status = DONE
+        # finished_at first: once the status says finished, _prune reads it
+        job.finished_at = time.time()
+        job.status = status
+
+    def _prune(self):
+        cutoff = time.time() - self.ttl
+        with self._lock:
+            expired = [key for key, job in self._jobs.items()
+                       if job.finished and job.finished_at is not None and job.finished_at < cutoff]
+            for key in expired:
+                del self._jobs[key]
+
+    def __len__(self):
+        with self._lock:
+            return len(self._jobs)
+
+
+_manager = None
+_manager_lock = threading.Lock()
+
+
+def get_manager():
+    """Return the process-wide JobManager shared by all sessions."""
+    global _manager
+    with _manager_lock:
+        if _manager is None:
+            _manager = JobManager()
+        return _manager
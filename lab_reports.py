@@ -0,0 +1,265 @@
+"""Extraction of stone-risk analytes from uploaded lab reports.
+
+A PDF's text layer is read page by page; pages without usable text (scans)
+fall back to OCR of the page images after OpenCV preprocessing. Pages are
+processed in parallel on the shared process pool and the extracted analytes
+are cached by document digest.
+
+The text layer is read with pypdf; a PDF it cannot open is rejected as
+unreadable. OCR of scanned pages and of PNG/JPEG reports needs pytesseract
+and the tesseract binary; without them those yield no text.
+"""
+import re
+from concurrent.futures.process import BrokenProcessPool
+
+import numpy as np
+
+from cache import LRUCache
+from ingest import blob_path, open_mmap
+from workers import MAX_WORKERS, get_pool, reset_pool
+
+# (patient_data field, label, unit) for every analyte we extract
+ANALYTES = [
+    ("urine_calcium", "Urine calcium", "mg/day"),
+    ("urine_oxalate", "Urine oxalate", "mg/day"),
+    ("urine_citrate", "Urine citrate", "mg/day"),
+    ("urine_uric_acid", "Urine uric acid", "mg/day"),
+    ("urine_ph", "Urine pH", ""),
+    ("urine_volume", "Urine volume", "L/day"),
+    ("serum_calcium", "Serum calcium", "mg/dL"),
+    ("serum_uric_acid", "Serum uric acid", "mg/dL"),
+]
+ANALYTE_FIELDS = [field for field, _, _ in ANALYTES]
+
+# Plausible ranges; values outside them are treated as misreads
+PLAUSIBLE = {
+    "urine_calcium": (0, 1500), "urine_oxalate": (0, 300), "urine_citrate": (0, 2500),
+    "urine_uric_acid": (0, 3000), "urine_ph": (4.0, 9.0), "urine_volume": (0.1, 8.0),
+    "serum_calcium": (4.0, 16.0), "serum_uric_acid": (0.5, 20.0),
+}
+
+# Usual targets for stone formers; readings outside them are flagged
+RISK_LIMITS = {
+    "urine_calcium": (None, 250), "urine_oxalate": (None, 45), "urine_citrate": (320, None),
+    "urine_uric_acid": (None, 800), "urine_ph": (5.5, 7.0), "urine_volume": (2.0, None),
+    "serum_calcium": (8.5, 10.5), "serum_uric_acid": (None, 7.0),
+}
+
+# Molar masses (g/mol) for mmol -> mg conversion
+MOLAR_MASS = {"calcium": 40.08, "oxalate": 88.02, "citrate": 189.1, "uric_acid": 168.1}
+
+# Documents with fewer pages are parsed in-process
+PARALLEL_MIN_PAGES = 4
+
+# A page with less text than this is treated as scanned
+MIN_TEXT_CHARS = 20
+
+CACHE_SIZE = 256
+
+_result_cache = LRUCache(CACHE_SIZE, name="lab_results")
+
+_KEYWORDS = [
+    ("uric_acid", re.compile(r"\buric\s+acid\b|\burate\b")),
+    ("calcium", re.compile(r"\bcalcium\b")),
+    ("oxalate", re.compile(r"\boxalate\b")),
+    ("citrate", re.compile(r"\bcitrate\b")),
+    ("ph", re.compile(r"\bph\b")),
+    ("volume", re.compile(r"\bvolume\b")),
+]
+_SERUM = re.compile(r"\b(?:serum|blood|plasma)\b")
+_URINE = re.compile(r"\b(?:urine|urinary|24h)\b")
+_DAY = re.compile(r"(?<!/)\b24[\s-]*(?:h|hr|hrs|hour|hours)\b")
+_VALUE = re.compile(
+    r"(\d+(?:\.\d+)?)\s*"
+    r"(mg/dl|mg/d(?:ay)?|mg/24h|mmol/l|mmol/d(?:ay)?|mmol/24h|[uµ]mol/l|ml/d(?:ay)?|ml/24h|ml|l/d(?:ay)?|l/24h|l)?"
+    r"(?![a-z])"
+)
+_DAILY_UNIT = re.compile(r"/(?:24h|d(?:ay)?)$")
+
+
+def _normalize(analyte, sample, value, unit):
+    """Convert one reading to its patient_data field and canonical unit."""
+    unit = _DAILY_UNIT.sub("/day", unit or "")
+    if analyte == "ph":
+        return "urine_ph", value
+    if analyte == "volume":
+        if unit.startswith("ml") or (not unit and value > 20):
+            value /= 1000
+        return "urine_volume", value
+
+    if sample is None:
+        sample = "serum" if unit in ("mg/dl", "mmol/l", "umol/l", "µmol/l") else "urine"
+    if sample == "urine":
+        if analyte not in MOLAR_MASS:
+            return None, None
+        if unit == "mmol/day":
+            value *= MOLAR_MASS[analyte]
+        return f"urine_{analyte}", value
+    if analyte not in ("calcium", "uric_acid"):
+        return None, None
+    if unit == "mmol/l":
+        value *= MOLAR_MASS[analyte] / 10
+    elif unit in ("umol/l", "µmol/l"):
+        value *= MOLAR_MASS[analyte] / 10000
+    return f"serum_{analyte}", value
+
+
+def flag(field, value):
+    """Return "Low", "High" or "" for a reading against RISK_LIMITS."""
+    low, high = RISK_LIMITS[field]
+    if low is not None and value < low:
+        return "Low"
+    if high is not None and value > high:
+        return "High"
+    return ""
+
+
+def parse_analytes(text):
+    """Extract analyte values from report text; the first reading of each wins."""
+    results = {}
+    for raw_line in text.splitlines():
+        line = _DAY.sub(" 24h ", raw_line.lower())
+        for analyte, keyword in _KEYWORDS:
+            match = keyword.search(line)
+            if not match:
+                continue
+            # The value follows the analyte name; drop the 24h marker so it isn't read as one
+            rest = line[match.end():].replace(" 24h ", " ")
+            value_match = _VALUE.search(rest)
+            if not value_match:
+                break
+            sample = "serum" if _SERUM.search(line) else "urine" if _URINE.search(line) else None
+            field, value = _normalize(analyte, sample, float(value_match.group(1)), value_match.group(2))
+            if field and field not in results:
+                low, high = PLAUSIBLE[field]
+                if low <= value <= high:
+                    results[field] = round(value, 2)
+            break
+    return results
+
+
+# --- Scanned pages -------------------------------------------------------------
+
+def preprocess_scan(image):
+    """Clean up a scanned page for OCR: grayscale, upscale, denoise, binarize, deskew."""
+    import cv2
+
+    if isinstance(image, (bytes, bytearray, memoryview)):
+        image = cv2.imdecode(np.frombuffer(image, dtype=np.uint8), cv2.IMREAD_GRAYSCALE)
+        if image is None:
+            return None
+    if image.ndim == 3:
+        image = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+    if image.shape[1] < 1500:
+        scale = 1500 / image.shape[1]
+        image = cv2.resize(image, None, fx=scale, fy=scale, interpolation=cv2.INTER_CUBIC)
+    image = cv2.medianBlur(image, 3)
+    _, binary = cv2.threshold(image, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU)
+
+    # Deskew using the minimum-area rectangle around the ink
+    ink = np.column_stack(np.nonzero(binary == 0))
+    if len(ink) > 100:
+        angle = cv2.minAreaRect(ink[:, ::-1].astype(np.float32))[-1]
+        if angle > 45:
+            angle -= 90
+        if 0.5 < abs(angle) < 15:
+            height, width = binary.shape
+            rotation = cv2.getRotationMatrix2D((width / 2, height / 2), angle, 1.0)
+            binary = cv2.warpAffine(binary, rotation, (width, height), flags=cv2.INTER_NEAREST,
+                                    borderValue=255)
+    return binary
+
+
+def ocr_image(image):
+    """OCR one page image; returns "" when pytesseract is unavailable."""
+    try:
+        import pytesseract
+    except ImportError:
+        return ""
+    cleaned = preprocess_scan(image)
+    if cleaned is None:
+        return ""
+    try:
+        return pytesseract.image_to_string(cleaned)
+    except pytesseract.TesseractNotFoundError:
+        return ""
+
+
+# --- Pipeline ------------------------------------------------------------------
+
+_readers = {}
+
+
+def _unreadable(exc):
+    return ValueError(f"Unreadable lab report: {exc}")
+
+
+def _pypdf_page(digest, index):
+    import pypdf
+
+    # Each worker keeps its open readers so a document is parsed once per worker
+    try:
+        reader = _readers.get(digest)
+        if reader is None:
+            _readers.clear()
+            reader = _readers[digest] = pypdf.PdfReader(blob_path(digest))
+        page = reader.pages[index]
+        text = page.extract_text() or ""
+        images = []
+        if len(text.strip()) < MIN_TEXT_CHARS:
+            images = [image.data for image in page.images]
+    except pypdf.errors.PyPdfError as exc:
+        raise _unreadable(exc) from exc
+    return text, images
+
+
+def extract_page(task):
+    """Return the text of one page task, falling back to OCR for scans."""
+    if task[0] == "pypdf":
+        text, images = _pypdf_page(task[1], task[2])
+    else:  # "image"
+        text, images = "", [task[1]]
+    if len(text.strip()) < MIN_TEXT_CHARS:
+        text = "\n".join([text] + [ocr_image(image) for image in images])
+    return text
+
+
+def _page_tasks(handle):
+    # pypdf is imported on first use: it is slow to import and every page
+    # imports this module (via patient_record) for ANALYTE_FIELDS
+    import pypdf
+
+    with open_mmap(handle) as data:
+        if data[:5] != b"%PDF-":
+            return [("image", bytes(data))]
+    try:
+        pages = len(pypdf.PdfReader(blob_path(handle.digest)).pages)
+    except pypdf.errors.PyPdfError as exc:
+        raise _unreadable(exc) from exc
+    return [("pypdf", handle.digest, index) for index in range(pages)]
+
+
+def extract_text(handle, parallel=True):
+    """Return the text of every page of an ingested report, in page order."""
+    tasks = _page_tasks(handle)
+    if not parallel or MAX_WORKERS == 1 or len(tasks) < PARALLEL_MIN_PAGES:
+        return [extract_page(task) for task in tasks]
+    pool = get_pool()
+    try:
+        return list(pool.map(extract_page, tasks, chunksize=max(1, len(tasks) // (4 * MAX_WORKERS))))
+    except BrokenProcessPool:
+        reset_pool(pool)
+        raise
+
+
+def extract_lab_results(handle, parallel=True):
+    """Return {field: value} for the analytes found in an ingested lab report.
+
+    Results are cached by the document's digest.
+    """
+    cached = _result_cache.get(handle.digest)
+    if cached is not None:
+        return dict(cached)
+    results = parse_analytes("\n".join(extract_text(handle, parallel)))
+    _result_cache.put(handle.digest, results)
+    return dict(results)
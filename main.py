@@ -1,16 +1,223 @@
-# This is a sample Python script.
+"""Command line tools for NephroCare AI.
 
-# Press Shift+F10 to execute it or replace it with your code.
-# Press Double Shift to search everywhere for classes, files, tool windows, actions, and settings.
+Batch scoring streams a patient file in chunks so cohorts larger than memory
+can be re-scored, e.g. from a nightly job:
 
+    python main.py score patients.parquet scored.parquet --chunksize 100000
 
-def print_hi(name):
-    # Use a breakpoint in the code line below to debug your script.
-    print(f'Hi, {name}')  # Press Ctrl+F8 to toggle the breakpoint.
+With --cohort-id, the scored patients are also loaded into the Clinician
+Cohort page, keyed by that column (a stable id, not the name; a `name`
+column, if present, is what the page shows):
 
+    python main.py score patients.parquet scored.parquet --cohort-id patient_id
 
-# Press the green button in the gutter to run the script.
-if __name__ == '__main__':
-    print_hi('PyCharm')
+Training reads a labelled patient file the same way and saves the model the
+app and the score command use:
+
+    python main.py train cohort.parquet --epochs 5
+"""
+import argparse
+import os
+import sys
+import time
+
+import pandas as pd
+
+from risk import score_frame
+
+DEFAULT_CHUNKSIZE = 50_000
+
+# pandas' default NA markers minus "None", which is a real answer in the
+# patient form (family history, alcohol)
+CSV_NA_VALUES = ["", "#N/A", "#N/A N/A", "#NA", "-1.#IND", "-1.#QNAN", "-NaN", "-nan", "1.#IND",
+                 "1.#QNAN", "<NA>", "N/A", "NA", "NULL", "NaN", "n/a", "nan", "null"]
+SCORE_COLUMN = "recurrence_risk"
+STONE_TYPE_COLUMN = "predicted_stone_type"
+
+
+def _file_format(path):
+    extension = os.path.splitext(path)[1].lower()
+    if extension in (".csv", ".txt"):
+        return "csv"
+    if extension in (".parquet", ".pq"):
+        return "parquet"
+    raise ValueError(f"Unsupported file type '{extension}' (expected .csv or .parquet)")
+
+
+def iter_chunks(path, chunksize):
+    """Yield DataFrame chunks of at most `chunksize` rows from a CSV or Parquet file."""
+    if _file_format(path) == "csv":
+        yield from pd.read_csv(path, chunksize=chunksize, keep_default_na=False, na_values=CSV_NA_VALUES)
+    else:
+        import pyarrow.parquet as pq
+
+        for batch in pq.ParquetFile(path).iter_batches(batch_size=chunksize):
+            yield batch.to_pandas()
+
+
+class ChunkWriter:
+    """Append DataFrame chunks to a CSV or Parquet file."""
+
+    def __init__(self, path):
+        self.path = path
+        self.format = _file_format(path)
+        self._parquet_writer = None
+        self._wrote_header = False
+
+    def write(self, frame):
+        if self.format == "csv":
+            frame.to_csv(self.path, mode="a" if self._wrote_header else "w",
+                         header=not self._wrote_header, index=False)
+            self._wrote_header = True
+            return
+
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        if self._parquet_writer is None:
+            table = pa.Table.from_pandas(frame, preserve_index=False)
+            self._parquet_writer = pq.ParquetWriter(self.path, table.schema)
+        else:
+            # Later chunks may infer different types (e.g. an all-null column)
+            table = pa.Table.from_pandas(frame, schema=self._parquet_writer.schema, preserve_index=False)
+        self._parquet_writer.write_table(table)
+
+    def close(self):
+        if self._parquet_writer is not None:
+            self._parquet_writer.close()
+
+
+def cohort_rows(chunk, id_column):
+    """Return (rows, skipped) for a scored chunk.
+
+    rows are (patient id, cohort fields); skipped are the ids of rows left out
+    because their stone type is not one the cohort knows.
+    """
+    from analysis import STONE_TYPES
 
-# See PyCharm help at https://www.jetbrains.com/help/pycharm/
+    if id_column not in chunk:
+        raise KeyError(f"No '{id_column}' column to key the cohort by")
+    # Prefer the model's stone type; fall back to one recorded in the input
+    sources = {"name": "name", "recurrence_risk": SCORE_COLUMN, "largest_stone": "largest_stone",
+               "surgery_needed": "surgery_needed",
+               "stone_type": STONE_TYPE_COLUMN if STONE_TYPE_COLUMN in chunk else "stone_type"}
+    columns = {field: chunk[column].to_numpy(dtype=object) for field, column in sources.items() if column in chunk}
+    rows, skipped = [], []
+    for i, patient_id in enumerate(chunk[id_column].astype(str)):
+        # Missing values (NaN) are left out, so they don't overwrite what the cohort has
+        fields = {field: values[i] for field, values in columns.items() if values[i] == values[i]}
+        if fields.get("stone_type") is not None and fields["stone_type"] not in STONE_TYPES:
+            skipped.append(patient_id)
+        else:
+            rows.append((patient_id, fields))
+    return rows, skipped
+
+
+def score_file(input_path, output_path, chunksize=DEFAULT_CHUNKSIZE, model=None, cohort_id=None):
+    """Score every patient in `input_path` and write them, with scores, to `output_path`.
+
+    With a trained RiskModel the predicted stone type is added too;
+    without one the rule-based score from risk.py is used. With `cohort_id`
+    the results also update the clinician cohort, keyed by that column.
+    Returns (rows scored, ids of patients left out of the cohort).
+    """
+    cohort = None
+    if cohort_id is not None:
+        from cohort_store import get_cohort_store
+
+        cohort = get_cohort_store()
+    writer = ChunkWriter(output_path)
+    rows = 0
+    skipped = []
+    try:
+        for chunk in iter_chunks(input_path, chunksize):
+            if model is None:
+                chunk[SCORE_COLUMN] = score_frame(chunk)
+            else:
+                chunk[SCORE_COLUMN], chunk[STONE_TYPE_COLUMN] = model.predict_columns(chunk)
+            # Checked before anything is written, so a bad id column fails without partial output
+            if cohort is not None:
+                updates, bad = cohort_rows(chunk, cohort_id)
+            writer.write(chunk)
+            if cohort is not None:
+                cohort.upsert_many(updates)
+                skipped += bad
+            rows += len(chunk)
+    finally:
+        writer.close()
+    return rows, skipped
+
+
+def cmd_score(args):
+    from risk_model import MODEL_PATH, RiskModel
+
+    model_path = args.model or MODEL_PATH
+    if args.model and not os.path.exists(model_path):
+        raise FileNotFoundError(f"No model at {model_path}")
+    model = None
+    if not args.rule_based and os.path.exists(model_path):
+        model = RiskModel.load(model_path)
+    start = time.perf_counter()
+    rows, skipped = score_file(args.input, args.output, args.chunksize, model, args.cohort_id)
+    elapsed = time.perf_counter() - start
+    scorer = f"model {model.version}" if model is not None else "rule-based score"
+    print(f"Scored {rows} patients with {scorer} in {elapsed:.2f}s -> {args.output}")
+    if skipped:
+        print(f"Left {len(skipped)} patients with an unknown stone type out of the cohort: "
+              f"{', '.join(skipped[:10])}{', ...' if len(skipped) > 10 else ''}", file=sys.stderr)
+    return 0
+
+
+def cmd_train(args):
+    from model_training import train_model
+    from risk_model import MODEL_PATH
+
+    output = args.output or MODEL_PATH
+    model = train_model(lambda: iter_chunks(args.input, args.chunksize),
+                        epochs=args.epochs, alpha=args.alpha, eta0=args.eta0, seed=args.seed, log=print)
+    model.save(output)
+    print(f"Saved model {model.version} -> {output}")
+    print(f"Holdout: {model.metadata['holdout']}")
+    return 0
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog="main.py", description="NephroCare AI command line tools")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    score = subparsers.add_parser("score", help="Batch-score recurrence risk for a patient file")
+    score.add_argument("input", help="Input .csv or .parquet file")
+    score.add_argument("output", help="Output .csv or .parquet file")
+    score.add_argument("--chunksize", type=int, default=DEFAULT_CHUNKSIZE,
+                       help=f"Rows per chunk (default: {DEFAULT_CHUNKSIZE})")
+    score.add_argument("--model", help="Model artifact to score with (default: the app's trained model, if any)")
+    score.add_argument("--rule-based", action="store_true", help="Use the rule-based score even if a model exists")
+    score.add_argument("--cohort-id", metavar="COLUMN",
+                       help="Also update the Clinician Cohort page, keying patients by this column")
+    score.set_defaults(func=cmd_score)
+
+    train = subparsers.add_parser("train", help="Train the recurrence-risk and stone-type model")
+    train.add_argument("input", help="Labelled .csv or .parquet file (recurred and/or stone_type columns)")
+    train.add_argument("--output", help="Where to save the model (default: the app's model path)")
+    train.add_argument("--chunksize", type=int, default=DEFAULT_CHUNKSIZE,
+                       help=f"Rows per chunk (default: {DEFAULT_CHUNKSIZE})")
+    train.add_argument("--epochs", type=int, default=5)
+    train.add_argument("--alpha", type=float, default=1e-4, help="L2 regularization strength")
+    train.add_argument("--eta0", type=float, default=0.1, help="Initial SGD step size (decays as 1/sqrt(rows seen))")
+    train.add_argument("--seed", type=int, default=0)
+    train.set_defaults(func=cmd_train)
+
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    try:
+        return args.func(args)
+    except (OSError, KeyError, ValueError) as exc:
+        print(f"error: {exc}", file=sys.stderr)
+        return 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
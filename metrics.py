@@ -0,0 +1,351 @@
+"""Lightweight instrumentation: timing spans, counters and Prometheus export.
+
+Everything is off unless one of these is set:
+
+- NEPHROCARE_METRICS=1 collects spans and counters in-process;
+- NEPHROCARE_METRICS_FILE=<path> also writes them, in Prometheus text
+  format, to that file after script runs (at most every FILE_INTERVAL s);
+- NEPHROCARE_METRICS_PORT=<port> also serves them at
+  http://127.0.0.1:<port>/metrics.
+
+NEPHROCARE_PROFILE=cprofile or NEPHROCARE_PROFILE=sample profiles script
+runs with cProfile or a pure-Python stack sampler and writes the result to
+DATA_DIR/profiles/ (app.prof for pstats/snakeviz, app.folded for flame
+graph tools).
+
+When disabled, span() returns a shared no-op context manager and
+increment() returns immediately, so instrumented code pays one function
+call per span.
+"""
+import os
+import sys
+import threading
+import time
+import warnings
+from collections import Counter
+from contextlib import contextmanager, nullcontext
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from cache import named_caches
+from config import data_path
+
+METRICS_FILE = os.environ.get("NEPHROCARE_METRICS_FILE")
+METRICS_PORT = int(os.environ.get("NEPHROCARE_METRICS_PORT") or 0)
+ENABLED = os.environ.get("NEPHROCARE_METRICS", "0") not in ("", "0", "false") or bool(METRICS_FILE or METRICS_PORT)
+
+PROFILE = os.environ.get("NEPHROCARE_PROFILE", "")
+PROFILERS = ("cprofile", "sample")
+SAMPLE_INTERVAL = float(os.environ.get("NEPHROCARE_PROFILE_INTERVAL") or 0.005)
+
+PREFIX = "nephrocare"
+# Histogram bucket upper bounds for span durations, in seconds
+SPAN_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+# Minimum seconds between writes of the metrics file and profile output
+FILE_INTERVAL = 5.0
+
+_NULL_SPAN = nullcontext()
+
+_lock = threading.Lock()
+_counters = Counter()
+# Span name -> [count, total seconds, per-bucket counts]
+_spans = {}
+# Gauge name -> zero-argument function returning its current value
+_gauges = {}
+_last_write = 0.0
+_server = None
+
+
+class _Span:
+    __slots__ = ("name", "start")
+
+    def __init__(self, name):
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        # Also recorded when the block raises (st.rerun() and st.stop() do)
+        observe(self.name, time.perf_counter() - self.start)
+        return False
+
+
+def span(name):
+    """Time the enclosed block as `name`: ``with span("page.results"): ...``"""
+    if not ENABLED:
+        return _NULL_SPAN
+    return _Span(name)
+
+
+def observe(name, seconds):
+    """Record one duration for span `name`."""
+    if not ENABLED:
+        return
+    with _lock:
+        entry = _spans.get(name)
+        if entry is None:
+            entry = _spans[name] = [0, 0.0, [0] * len(SPAN_BUCKETS)]
+        entry[0] += 1
+        entry[1] += seconds
+        buckets = entry[2]
+        for i, bound in enumerate(SPAN_BUCKETS):
+            if seconds <= bound:
+                buckets[i] += 1
+                break
+
+
+def increment(name, amount=1):
+    """Add `amount` to counter `name` (exported as nephrocare_<name>_total)."""
+    if not ENABLED:
+        return
+    with _lock:
+        _counters[name] += amount
+
+
+def register_gauge(name, read):
+    """Export `read()` as gauge nephrocare_<name> (called at export time only)."""
+    with _lock:
+        _gauges[name] = read
+
+
+def reset():
+    """Forget all recorded spans and counters."""
+    with _lock:
+        _counters.clear()
+        _spans.clear()
+
+
+def _label(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def render():
+    """Return all metrics in the Prometheus text exposition format."""
+    with _lock:
+        counters = sorted(_counters.items())
+        spans = sorted((name, count, total, list(buckets)) for name, (count, total, buckets) in _spans.items())
+        gauges = sorted(_gauges.items())
+    lines = []
+    for name, value in counters:
+        lines.append(f"# TYPE {PREFIX}_{name}_total counter")
+        lines.append(f"{PREFIX}_{name}_total {value}")
+
+    metric = f"{PREFIX}_span_seconds"
+    lines.append(f"# HELP {metric} Wall time spent in instrumented code sections")
+    lines.append(f"# TYPE {metric} histogram")
+    for name, count, total, buckets in spans:
+        label = f'span="{_label(name)}"'
+        cumulative = 0
+        for bound, in_bucket in zip(SPAN_BUCKETS, buckets):
+            cumulative += in_bucket
+            lines.append(f'{metric}_bucket{{{label},le="{bound}"}} {cumulative}')
+        lines.append(f'{metric}_bucket{{{label},le="+Inf"}} {count}')
+        lines.append(f"{metric}_sum{{{label}}} {total:.6f}")
+        lines.append(f"{metric}_count{{{label}}} {count}")
+
+    for name, read in gauges:
+        lines.append(f"# TYPE {PREFIX}_{name} gauge")
+        lines.append(f"{PREFIX}_{name} {read()}")
+
+    # LRUCache keeps its own hit/miss counts, so these are free to collect
+    caches = sorted(named_caches().items())
+    for kind in ("hits", "misses"):
+        lines.append(f"# TYPE {PREFIX}_cache_{kind}_total counter")
+        for name, cache in caches:
+            lines.append(f'{PREFIX}_cache_{kind}_total{{cache="{_label(name)}"}} {getattr(cache, kind)}')
+    lines.append(f"# TYPE {PREFIX}_cache_entries gauge")
+    for name, cache in caches:
+        lines.append(f'{PREFIX}_cache_entries{{cache="{_label(name)}"}} {len(cache)}')
+    return "\n".join(lines) + "\n"
+
+
+def write_file(path=None):
+    """Write render() to `path` (default NEPHROCARE_METRICS_FILE) atomically."""
+    path = path or METRICS_FILE
+    tmp_path = f"{path}.tmp.{os.getpid()}.{threading.get_ident()}"
+    with open(tmp_path, "w") as f:
+        f.write(render())
+    os.replace(tmp_path, path)
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split("?")[0] != "/metrics":
+            self.send_error(404)
+            return
+        body = render().encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_http_server(port=None, host="127.0.0.1"):
+    """Serve /metrics on `port` (default NEPHROCARE_METRICS_PORT) from a daemon thread, once.
+
+    Returns the server, or None when the port could not be bound.
+    """
+    global _server
+    with _lock:
+        if _server is None:
+            try:
+                _server = ThreadingHTTPServer((host, port or METRICS_PORT), _MetricsHandler)
+            except OSError as exc:
+                # Don't retry on every rerun; metrics are still collected
+                warnings.warn(f"Not serving metrics on port {port or METRICS_PORT}: {exc}")
+                _server = False
+            else:
+                threading.Thread(target=_server.serve_forever, name="metrics-http", daemon=True).start()
+        return _server or None
+
+
+class _CProfiler:
+    """Accumulates cProfile stats over script runs; one run is profiled at a time."""
+
+    def __init__(self, path):
+        self.path = path
+        self.stats = None
+        self.lock = threading.Lock()
+        self.running = threading.Lock()
+
+    @contextmanager
+    def profile(self):
+        import cProfile
+
+        # cProfile can only follow one thread at a time, so concurrent runs go unprofiled
+        if not self.running.acquire(blocking=False):
+            yield
+            return
+        try:
+            profiler = cProfile.Profile()
+            profiler.enable()
+            try:
+                yield
+            finally:
+                profiler.disable()
+                self._add(profiler)
+        finally:
+            self.running.release()
+
+    def _add(self, profiler):
+        import pstats
+
+        with self.lock:
+            if self.stats is None:
+                self.stats = pstats.Stats(profiler)
+            else:
+                self.stats.add(profiler)
+
+    def write(self):
+        with self.lock:
+            if self.stats is not None:
+                self.stats.dump_stats(self.path)
+
+
+class _Sampler:
+    """Samples the stacks of threads inside a script run every `interval` seconds.
+
+    Stacks are written in the collapsed ("folded") format read by
+    flamegraph.pl and speedscope: ``frame;frame;frame count`` per line.
+    """
+
+    def __init__(self, path, interval):
+        self.path = path
+        self.interval = interval
+        self.stacks = Counter()
+        self.threads = set()
+        self.lock = threading.Lock()
+        threading.Thread(target=self._run, name="metrics-sampler", daemon=True).start()
+
+    @contextmanager
+    def profile(self):
+        ident = threading.get_ident()
+        with self.lock:
+            self.threads.add(ident)
+        try:
+            yield
+        finally:
+            with self.lock:
+                self.threads.discard(ident)
+
+    def _run(self):
+        while True:
+            time.sleep(self.interval)
+            with self.lock:
+                threads = set(self.threads)
+            if not threads:
+                continue
+            frames = sys._current_frames()
+            samples = []
+            for ident in threads:
+                frame = frames.get(ident)
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})")
+                    frame = frame.f_back
+                if stack:
+                    samples.append(";".join(reversed(stack)))
+            with self.lock:
+                self.stacks.update(samples)
+
+    def write(self):
+        with self.lock:
+            lines = [f"{stack} {count}" for stack, count in self.stacks.most_common()]
+        if lines:
+            with open(self.path, "w") as f:
+                f.write("\n".join(lines) + "\n")
+
+
+_profiler = None
+_profiler_lock = threading.Lock()
+
+
+def get_profiler():
+    """Return the process-wide profiler selected by NEPHROCARE_PROFILE, or None."""
+    global _profiler
+    if PROFILE not in PROFILERS:
+        return None
+    with _profiler_lock:
+        if _profiler is None:
+            if PROFILE == "cprofile":
+                _profiler = _CProfiler(data_path("profiles", "app.prof"))
+            else:
+                _profiler = _Sampler(data_path("profiles", "app.folded"), SAMPLE_INTERVAL)
+        return _profiler
+
+
+def _flush():
+    global _last_write
+    now = time.monotonic()
+    with _lock:
+        if now - _last_write < FILE_INTERVAL:
+            return
+        _last_write = now
+    if METRICS_FILE:
+        write_file()
+    profiler = get_profiler()
+    if profiler is not None:
+        profiler.write()
+
+
+@contextmanager
+def script_run(name="app"):
+    """Instrument one Streamlit script run: a root span, the profiler and the exporters."""
+    profiler = get_profiler()
+    if not ENABLED and profiler is None:
+        yield
+        return
+    if METRICS_PORT:
+        start_http_server()
+    try:
+        with span(name), (profiler.profile() if profiler is not None else _NULL_SPAN):
+            yield
+    finally:
+        increment("script_runs")
+        _flush()
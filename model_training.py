@@ -0,0 +1,227 @@
+"""Training for the recurrence-risk and stone-type model.
+
+Training streams the data in chunks: one pass fits the standardization, then
+each epoch feeds every chunk to SGD logistic regressions with partial_fit,
+so the dataset never has to fit in memory. Step sizes follow an inverse
+scaling schedule (eta0 / t ** POWER_T over the t rows seen so far) rather
+than scikit-learn's "optimal" default, whose large early steps push small
+cohorts to 0% or 100% risks. Every HOLDOUT_EVERY-th row is held out and
+scored with the exported model at the end; training fails if the recurrence
+model does worse on it than predicting the base rate for everyone. The
+result is saved as a RiskModel artifact (see risk_model.py), e.g.:
+
+    python main.py train cohort.parquet --epochs 5
+"""
+import time
+from datetime import datetime, timezone
+
+import numpy as np
+import sklearn
+from sklearn.linear_model import SGDClassifier
+from sklearn.preprocessing import StandardScaler
+
+from analysis import STONE_TYPES, STONE_TYPE_WEIGHTS
+from risk_model import ARTIFACT_VERSION, CATEGORICAL_FEATURES, RiskModel, feature_matrix
+
+# Label columns in the training data; rows missing a label are skipped for that model
+RECURRENCE_LABEL = "recurred"
+STONE_TYPE_LABEL = "stone_type"
+
+DEFAULT_EPOCHS = 5
+DEFAULT_ALPHA = 1e-4
+DEFAULT_ETA0 = 0.1
+POWER_T = 0.5
+HOLDOUT_EVERY = 10
+
+
+def _split(chunk, offset):
+    # Row positions are stable across passes, so the holdout is the same every epoch
+    return (offset + np.arange(len(chunk))) % HOLDOUT_EVERY == 0
+
+
+def _labels(chunk):
+    recurred = chunk[RECURRENCE_LABEL].to_numpy(dtype=float) if RECURRENCE_LABEL in chunk else None
+    stone_type = chunk[STONE_TYPE_LABEL].to_numpy(dtype=object) if STONE_TYPE_LABEL in chunk else None
+    return recurred, stone_type
+
+
+def train_model(make_chunks, epochs=DEFAULT_EPOCHS, alpha=DEFAULT_ALPHA, eta0=DEFAULT_ETA0, seed=0, log=None):
+    """Train a RiskModel on the DataFrames yielded by `make_chunks()`.
+
+    `make_chunks` is called once per pass and must yield the same rows in
+    the same order each time (e.g. ``lambda: iter_chunks(path, chunksize)``).
+    Raises ValueError if the recurrence model's holdout log loss is worse
+    than the base-rate prior's.
+    """
+    log = log or (lambda message: None)
+    rng = np.random.default_rng(seed)
+    start = time.perf_counter()
+
+    scaler = StandardScaler()
+    rows = 0
+    for chunk in make_chunks():
+        if RECURRENCE_LABEL not in chunk and STONE_TYPE_LABEL not in chunk:
+            raise KeyError(f"Training data needs a '{RECURRENCE_LABEL}' or '{STONE_TYPE_LABEL}' column")
+        # Columns with no values yet (e.g. no lab panels) keep a NaN mean and are imputed as 0
+        with np.errstate(invalid="ignore", divide="ignore"):
+            scaler.partial_fit(feature_matrix(chunk))
+        rows += len(chunk)
+    if rows == 0:
+        raise ValueError("No training rows")
+    model = RiskModel(scaler.mean_, scaler.scale_, None, 0.0, None, None, np.array(STONE_TYPES, dtype=object), {})
+    log(f"Fitted feature scaling on {rows} rows")
+
+    schedule = dict(loss="log_loss", alpha=alpha, learning_rate="invscaling", eta0=eta0, power_t=POWER_T,
+                    random_state=seed)
+    recurrence = SGDClassifier(**schedule)
+    stone_type = SGDClassifier(**schedule)
+    recurred_count = labelled_count = 0
+    for epoch in range(epochs):
+        offset = 0
+        for chunk in make_chunks():
+            train = ~_split(chunk, offset)
+            offset += len(chunk)
+            order = rng.permutation(np.flatnonzero(train))
+            scaled = model.scaled(feature_matrix(chunk))[order]
+            recurred, stones = _labels(chunk)
+            if recurred is not None:
+                recurred = recurred[order]
+                labelled = ~np.isnan(recurred)
+                if labelled.any():
+                    recurrence.partial_fit(scaled[labelled], recurred[labelled].astype(int), classes=[0, 1])
+                if epoch == 0:
+                    recurred_count += int(recurred[labelled].sum())
+                    labelled_count += int(labelled.sum())
+            if stones is not None:
+                stones = stones[order]
+                labelled = np.isin(stones, STONE_TYPES)
+                if labelled.any():
+                    stone_type.partial_fit(scaled[labelled], stones[labelled], classes=STONE_TYPES)
+        log(f"Epoch {epoch + 1}/{epochs} done ({time.perf_counter() - start:.1f}s)")
+
+    if hasattr(recurrence, "coef_"):
+        model.recurrence_coef = recurrence.coef_[0].copy()
+        model.recurrence_intercept = float(recurrence.intercept_[0])
+    else:
+        model.recurrence_coef = np.zeros(len(model.mean))
+    if hasattr(stone_type, "coef_"):
+        model.stone_coef = stone_type.coef_.copy()
+        model.stone_intercept = stone_type.intercept_.copy()
+        model.stone_classes = stone_type.classes_.astype(object)
+    else:
+        # No stone-type labels: predict the population's most common type
+        model.stone_coef = np.zeros((len(STONE_TYPES), len(model.mean)))
+        model.stone_intercept = np.log(np.asarray(STONE_TYPE_WEIGHTS))
+
+    trained_at = datetime.now(timezone.utc)
+    model.metadata = {
+        "artifact_version": ARTIFACT_VERSION,
+        "model_version": trained_at.strftime("%Y%m%d%H%M%S"),
+        "trained_at": trained_at.isoformat(timespec="seconds"),
+        "rows": rows,
+        "epochs": epochs,
+        "alpha": alpha,
+        "eta0": eta0,
+        "sklearn_version": sklearn.__version__,
+        "holdout": evaluate(model, make_chunks, recurred_count / labelled_count if labelled_count else None),
+    }
+    holdout = model.metadata["holdout"]
+    if holdout["recurrence_log_loss"] is not None and holdout["recurrence_log_loss"] > holdout["prior_log_loss"]:
+        raise ValueError(f"Recurrence model is worse than the base rate on the holdout (log loss "
+                         f"{holdout['recurrence_log_loss']} vs {holdout['prior_log_loss']}); "
+                         f"try more rows, more epochs or a smaller --eta0")
+    return model
+
+
+def evaluate(model, make_chunks, base_rate=None):
+    """Score the held-out rows; returns log loss and accuracy for each model.
+
+    With `base_rate` (the training set's recurrence rate), also returns the
+    log loss of predicting that rate for every held-out patient.
+    """
+    loss = prior_loss = correct = count = 0.0
+    stone_correct = stone_count = 0
+    offset = 0
+    for chunk in make_chunks():
+        holdout = _split(chunk, offset)
+        offset += len(chunk)
+        if not holdout.any():
+            continue
+        part = chunk[holdout]
+        scaled = model.scaled(feature_matrix(part))
+        recurred, stones = _labels(part)
+        if recurred is not None:
+            labelled = ~np.isnan(recurred)
+            probability = np.clip(model.recurrence_probability(scaled[labelled]), 1e-12, 1 - 1e-12)
+            outcome = recurred[labelled]
+            loss -= np.sum(outcome * np.log(probability) + (1 - outcome) * np.log(1 - probability))
+            if base_rate is not None:
+                prior = np.clip(base_rate, 1e-12, 1 - 1e-12)
+                prior_loss -= np.sum(outcome * np.log(prior) + (1 - outcome) * np.log(1 - prior))
+            correct += np.sum((probability >= 0.5) == (outcome == 1))
+            count += labelled.sum()
+        if stones is not None:
+            labelled = np.isin(stones, STONE_TYPES)
+            predicted = model.stone_classes[model.stone_type_probabilities(scaled[labelled]).argmax(axis=1)]
+            stone_correct += int(np.sum(predicted == stones[labelled]))
+            stone_count += int(labelled.sum())
+    return {
+        "rows": int(max(count, stone_count)),
+        "recurrence_log_loss": round(loss / count, 4) if count else None,
+        "prior_log_loss": round(prior_loss / count, 4) if count and base_rate is not None else None,
+        "recurrence_accuracy": round(correct / count, 4) if count else None,
+        "stone_type_accuracy": round(stone_correct / stone_count, 4) if stone_count else None,
+    }
+
+
+def synthetic_cohort(rows, seed=0):
+    """Return a labelled DataFrame of plausible synthetic patients (for demos and benchmarks)."""
+    import pandas as pd
+
+    rng = np.random.default_rng(seed)
+    frame = pd.DataFrame({
+        "age": rng.integers(18, 90, rows),
+        "gender": rng.choice(CATEGORICAL_FEATURES["gender"], rows, p=[0.55, 0.43, 0.02]),
+        "weight": rng.normal(78, 15, rows).clip(40, 180).round(),
+        "height": rng.normal(170, 10, rows).clip(140, 210).round(),
+        "previous_operations": rng.poisson(0.8, rows).clip(0, 10),
+        "last_operation": (np.datetime64("today", "D") - rng.integers(30, 3650, rows)).astype(str),
+        "family_history": rng.choice(CATEGORICAL_FEATURES["family_history"], rows, p=[0.6, 0.3, 0.1]),
+        "water_intake": rng.integers(1, 16, rows),
+        "diet": rng.choice(CATEGORICAL_FEATURES["diet"], rows, p=[0.45, 0.15, 0.2, 0.15, 0.05]),
+        "hypertension": rng.random(rows) < 0.25,
+        "diabetes": rng.random(rows) < 0.12,
+        "uti_history": rng.random(rows) < 0.1,
+        "kidney_disease": rng.random(rows) < 0.05,
+        "activity_level": rng.choice(CATEGORICAL_FEATURES["activity_level"], rows),
+        "smoking": rng.choice(CATEGORICAL_FEATURES["smoking"], rows, p=[0.6, 0.25, 0.15]),
+        "alcohol": rng.choice(CATEGORICAL_FEATURES["alcohol"], rows, p=[0.3, 0.4, 0.25, 0.05]),
+        "stress_level": rng.integers(1, 11, rows),
+    })
+    # About half the cohort has a 24-hour urine panel
+    has_lab = rng.random(rows) < 0.5
+    urine_ph = rng.normal(6.0, 0.5, rows).clip(4.5, 8.0).round(1)
+    urine_calcium = rng.normal(200, 70, rows).clip(20, 600).round()
+    for column, values in [("urine_ph", urine_ph), ("urine_calcium", urine_calcium),
+                           ("urine_oxalate", rng.normal(35, 12, rows).clip(5, 150).round()),
+                           ("urine_citrate", rng.normal(550, 200, rows).clip(50, 1500).round()),
+                           ("urine_volume", rng.normal(1.9, 0.6, rows).clip(0.5, 5).round(2))]:
+        frame[column] = np.where(has_lab, values, np.nan)
+
+    # Labels from a hidden logistic model over the main risk factors
+    logit = (-1.6 + 0.7 * frame["previous_operations"]
+             + 0.5 * (frame["family_history"] != "None") + 0.5 * (frame["family_history"] == "Multiple relatives")
+             - 0.18 * (frame["water_intake"] - 6)
+             + 0.6 * frame["diet"].isin(["High-protein", "High-salt"])
+             + 0.3 * frame["hypertension"] + 0.4 * frame["kidney_disease"]
+             + np.where(has_lab, 0.006 * (urine_calcium - 200), 0.0))
+    frame[RECURRENCE_LABEL] = (rng.random(rows) < 1 / (1 + np.exp(-logit))).astype(int)
+
+    type_scores = np.column_stack([
+        np.full(rows, 1.6),                                                   # Calcium Oxalate
+        0.4 + 2.5 * (has_lab & (urine_ph < 5.5)) + 0.6 * frame["diet"].eq("High-protein"),  # Uric Acid
+        -0.5 + 2.5 * frame["uti_history"],                                    # Struvite
+        np.full(rows, -1.5),                                                  # Cystine
+    ]) + rng.gumbel(size=(rows, len(STONE_TYPES)))
+    frame[STONE_TYPE_LABEL] = np.asarray(STONE_TYPES)[type_scores.argmax(axis=1)]
+    return frame
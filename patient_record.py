@@ -0,0 +1,187 @@
+"""Fixed-schema patient record kept per session.
+
+A PatientRecord holds exactly the fields the pages and the analysis fill in,
+in __slots__ rather than a per-instance dict. Values are stored compactly:
+choices as the shared option strings, whole numbers as ints (small ones are
+shared by the interpreter), stone sizes as a float32 array, stone locations
+as a tuple of interned strings and lab results as a float64 array over
+lab_reports.ANALYTE_FIELDS. Free text is capped at MAX_TEXT_LENGTH.
+
+Records read like the patient_data dicts they replace (``record.get(key)``,
+``record[key] = value``, ``record.update(...)``, ``dict(record)``), but only
+schema fields can be set and values are checked on the way in.
+"""
+import math
+import sys
+from array import array
+from datetime import date, datetime
+
+from analysis import STONE_TYPES
+from lab_reports import ANALYTE_FIELDS
+from risk_model import CATEGORICAL_FEATURES
+
+TEXT = "text"
+INT = "int"
+FLOAT = "float"
+BOOL = "bool"
+DATE = "date"
+CHOICE = "choice"
+SIZES = "sizes"
+LABELS = "labels"
+ANALYTES = "analytes"
+
+# Field -> kind, in the order the pages fill them in
+FIELDS = {
+    # Stable key for the patient's stored data (tracker log, cohort row, reminders)
+    "patient_id": TEXT,
+    # Patient Input
+    "name": TEXT, "age": INT, "gender": CHOICE, "weight": INT, "height": INT,
+    "previous_operations": INT, "last_operation": DATE, "family_history": CHOICE,
+    "water_intake": INT, "diet": CHOICE,
+    "hypertension": BOOL, "diabetes": BOOL, "uti_history": BOOL, "kidney_disease": BOOL,
+    "medications": TEXT, "activity_level": CHOICE, "smoking": CHOICE, "alcohol": CHOICE,
+    "stress_level": INT,
+    # Report Analysis results
+    "stone_sizes": SIZES, "largest_stone": FLOAT, "stone_count": INT, "stone_locations": LABELS,
+    "lab_results": ANALYTES, "stone_type": CHOICE, "recurrence_risk": INT, "model_version": TEXT,
+    "slice_thickness_mm": FLOAT, "slice_thickness_assumed": BOOL,
+    "surgery_needed": BOOL, "analysis_complete": BOOL,
+}
+
+# Choice field -> {value: the shared option string}
+CHOICES = {field: {value: value for value in values} for field, values in CATEGORICAL_FEATURES.items()}
+CHOICES["stone_type"] = {value: value for value in STONE_TYPES}
+
+MAX_TEXT_LENGTH = 200
+
+_MISSING = object()
+_ANALYTE_INDEX = {field: i for i, field in enumerate(ANALYTE_FIELDS)}
+
+
+def _encode(field, kind, value):
+    if kind == TEXT:
+        return str(value)[:MAX_TEXT_LENGTH]
+    if kind == INT:
+        return int(value)
+    if kind == FLOAT:
+        return float(value)
+    if kind == BOOL:
+        return bool(value)
+    if kind == DATE:
+        if isinstance(value, datetime):
+            return value.date()
+        if isinstance(value, date):
+            return value
+        return date.fromisoformat(str(value))
+    if kind == CHOICE:
+        try:
+            return CHOICES[field][value]
+        except KeyError:
+            raise ValueError(f"{value!r} is not a valid {field}") from None
+    if kind == SIZES:
+        return array("f", value)
+    if kind == LABELS:
+        return tuple(sys.intern(str(label)) for label in value)
+    if kind == ANALYTES:
+        if not value:
+            return None
+        values = array("d", [math.nan]) * len(ANALYTE_FIELDS)
+        for analyte, reading in value.items():
+            values[_ANALYTE_INDEX[analyte]] = float(reading)
+        return values
+    raise ValueError(f"Unknown field kind {kind!r}")
+
+
+def _decode(kind, stored):
+    if kind == ANALYTES:
+        return {field: value for field, value in zip(ANALYTE_FIELDS, stored) if not math.isnan(value)}
+    return stored
+
+
+class PatientRecord:
+    """One patient's form inputs and analysis results."""
+
+    __slots__ = tuple(FIELDS)
+
+    def __init__(self, data=None):
+        for field in FIELDS:
+            setattr(self, field, None)
+        if data:
+            self.update(data)
+
+    def get(self, key, default=None):
+        kind = FIELDS.get(key)
+        stored = None if kind is None else getattr(self, key)
+        return default if stored is None else _decode(kind, stored)
+
+    def __getitem__(self, key):
+        value = self.get(key, _MISSING)
+        if value is _MISSING:
+            raise KeyError(key)
+        return value
+
+    def __setitem__(self, key, value):
+        try:
+            kind = FIELDS[key]
+        except KeyError:
+            raise KeyError(f"PatientRecord has no field {key!r}") from None
+        setattr(self, key, None if value is None else _encode(key, kind, value))
+
+    def __delitem__(self, key):
+        self[key] = None
+
+    def update(self, data=(), **kwargs):
+        for key, value in dict(data, **kwargs).items():
+            self[key] = value
+
+    def keys(self):
+        """Names of the fields that are set."""
+        return [field for field in FIELDS if getattr(self, field) is not None]
+
+    def items(self):
+        return [(field, self[field]) for field in self.keys()]
+
+    def __iter__(self):
+        return iter(self.keys())
+
+    def __contains__(self, key):
+        return key in FIELDS and getattr(self, key) is not None
+
+    def __len__(self):
+        return len(self.keys())
+
+    def __repr__(self):
+        return f"PatientRecord({dict(self)!r})"
+
+    def footprint(self):
+        """Approximate bytes held by this record: the object and the values only it owns.
+
+        Shared values (bools, option strings, interned labels, small ints)
+        cost nothing beyond their slot.
+        """
+        size = sys.getsizeof(self)
+        for field, kind in FIELDS.items():
+            stored = getattr(self, field)
+            if stored is None or kind in (BOOL, CHOICE):
+                continue
+            if kind == INT and -5 <= stored <= 256:
+                continue
+            size += sys.getsizeof(stored)
+        return size
+
+    def to_state(self):
+        """Return the set fields as JSON-serializable values."""
+        state = {}
+        for field in self.keys():
+            value = self[field]
+            if FIELDS[field] == DATE:
+                value = value.isoformat()
+            elif isinstance(value, (array, tuple)):
+                value = list(value)
+            state[field] = value
+        return state
+
+    @classmethod
+    def from_state(cls, state):
+        """Rebuild a record from to_state(); fields no longer in the schema are dropped."""
+        return cls({key: value for key, value in state.items() if key in FIELDS})
@@ -0,0 +1,557 @@
+"""Patient reminders: a persistent scheduler with batched delivery.
+
+Every pending reminder is a row in an SQLite table indexed by due time, so
+millions of them cost disk, not memory, and survive restarts. Only the ones
+due within HORIZON seconds are also kept in an in-memory heap of (due, id)
+pairs, refilled from the index as time moves on. Inserting and cancelling
+are O(log n) B-tree updates plus, for near-term reminders, a heap push or a
+lazy cancel: the heap entry stays where it is and is dropped when popped,
+because its row is gone or now carries a different due time. The heap is
+rebuilt once stale entries make up half of it.
+
+A daemon thread pops due reminders in batches of BATCH_SIZE and hands each
+batch to a notifier - any object with a send(reminders) method. A batch is
+only marked delivered once send() returns, so a crash or a failing notifier
+means a reminder may be sent twice but never lost. Repeating reminders then
+move to their next occurrence after now. One-off reminders are deleted,
+except kinds in KEEP_UNTIL_REPLACED: those stay, marked delivered, until
+replaced or cancelled, so the Health Tracker can show them as overdue.
+Deliveries are kept for DELIVERY_RETENTION seconds for the Health Tracker.
+
+One server process is expected to deliver from a given database file.
+"""
+import atexit
+import heapq
+import logging
+import os
+import smtplib
+import sqlite3
+import threading
+import time
+from collections import namedtuple
+from datetime import date, datetime, time as clock, timedelta
+from email.message import EmailMessage
+
+import metrics
+from config import data_path
+from scheduling import SLOT_HOURS, slot_index
+from survival import DAYS_PER_MONTH, MAX_FOLLOW_UP_MONTHS, follow_up_months, patient_curve
+
+DB_FILE = "reminders.db"
+
+MEDICATION = "medication"
+REFILL = "refill"
+IMAGING = "imaging"
+LAB_TEST = "lab_test"
+DOCTOR_VISIT = "doctor_visit"
+KINDS = [MEDICATION, REFILL, IMAGING, LAB_TEST, DOCTOR_VISIT]
+
+# One-off reminders the patient has to act on; delivery does not clear them
+KEEP_UNTIL_REPLACED = {IMAGING, LAB_TEST}
+
+# Reminders handed to the notifier at once
+BATCH_SIZE = 500
+
+# Reminders due within this many seconds are kept in the heap, up to MAX_QUEUED of them
+HORIZON = 3600.0
+MAX_QUEUED = 100_000
+
+# Longest the delivery thread sleeps, and how long it waits after a failed send
+MAX_WAIT = 60.0
+RETRY_DELAY = 30.0
+
+DELIVERY_RETENTION = 30 * 86400
+PRUNE_INTERVAL = 3600.0
+
+# Patient reminder defaults
+MEDICATION_TIMES = ["8:00 AM", "12:00 PM", "6:00 PM", "10:00 PM"]
+MEDICATION_HOURS = [8, 12, 18, 22]
+REFILL_DAYS = 30
+LAB_TEST_MONTHS = 6
+REMINDER_HOUR = 9
+APPOINTMENT_NOTICE = timedelta(days=1)
+
+# Notifier selection: "log" (default) or "smtp", e.g. a local `python -m aiosmtpd -n` on port 1025
+NOTIFIER = os.environ.get("NEPHROCARE_REMINDER_NOTIFIER", "log")
+SMTP_HOST = os.environ.get("NEPHROCARE_SMTP_HOST", "localhost")
+SMTP_PORT = int(os.environ.get("NEPHROCARE_SMTP_PORT", "1025"))
+SMTP_FROM = os.environ.get("NEPHROCARE_SMTP_FROM", "reminders@nephrocare.local")
+# "{patient_id}" in the recipient is replaced per patient, e.g. for a relay that forwards to each patient
+SMTP_TO = os.environ.get("NEPHROCARE_SMTP_TO", "patient-{patient_id}@nephrocare.local")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS reminder (
+    id INTEGER PRIMARY KEY,
+    patient_id TEXT NOT NULL,
+    kind TEXT NOT NULL,
+    due REAL NOT NULL,
+    message TEXT NOT NULL,
+    repeat REAL,
+    delivered_at REAL
+);
+CREATE INDEX IF NOT EXISTS reminder_patient ON reminder (patient_id, kind, due);
+
+CREATE TABLE IF NOT EXISTS delivery (
+    id INTEGER PRIMARY KEY,
+    patient_id TEXT NOT NULL,
+    kind TEXT NOT NULL,
+    due REAL NOT NULL,
+    message TEXT NOT NULL,
+    delivered_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS delivery_patient ON delivery (patient_id, delivered_at);
+CREATE INDEX IF NOT EXISTS delivery_time ON delivery (delivered_at);
+"""
+
+# Only undelivered reminders are ever queued, so the due-time index leaves delivered ones out
+DUE_INDEX = "CREATE INDEX IF NOT EXISTS reminder_undelivered ON reminder (due, id) WHERE delivered_at IS NULL"
+
+# `due` is seconds since the epoch; `repeat` is the interval in seconds, or None for a one-off
+Reminder = namedtuple("Reminder", ["id", "patient_id", "kind", "due", "message", "repeat"])
+
+_COLUMNS = "id, patient_id, kind, due, message, repeat"
+
+# SQLite's default limit on bound parameters is 999 before 3.32
+_ID_CHUNK = 500
+
+log = logging.getLogger("nephrocare.reminders")
+
+
+def timestamp(due):
+    """Seconds since the epoch for a datetime, a date (at REMINDER_HOUR) or a number."""
+    if isinstance(due, datetime):
+        return due.timestamp()
+    if isinstance(due, date):
+        return datetime.combine(due, clock(REMINDER_HOUR)).timestamp()
+    return float(due)
+
+
+def _validate(kind, repeat):
+    if kind not in KINDS:
+        raise ValueError(f"Unknown reminder kind '{kind}'")
+    if repeat is not None and repeat <= 0:
+        raise ValueError("repeat must be a positive number of seconds")
+
+
+class LogNotifier:
+    """Writes each reminder to the nephrocare.reminders logger."""
+
+    def send(self, reminders):
+        for reminder in reminders:
+            log.info("Reminder for %s (%s): %s", reminder.patient_id, reminder.kind, reminder.message)
+
+
+class SMTPNotifier:
+    """Emails each patient's reminders in a batch as one message, over one connection.
+
+    Each message goes to `recipient` with "{patient_id}" filled in. The
+    subject never names the patient.
+    """
+
+    def __init__(self, host=SMTP_HOST, port=SMTP_PORT, sender=SMTP_FROM, recipient=SMTP_TO, timeout=10.0):
+        self.host = host
+        self.port = port
+        self.sender = sender
+        self.recipient = recipient
+        self.timeout = timeout
+
+    def send(self, reminders):
+        by_patient = {}
+        for reminder in reminders:
+            by_patient.setdefault(reminder.patient_id, []).append(reminder)
+        with smtplib.SMTP(self.host, self.port, timeout=self.timeout) as smtp:
+            for patient_id, items in by_patient.items():
+                message = EmailMessage()
+                message["From"] = self.sender
+                message["To"] = self.recipient.format(patient_id=patient_id)
+                message["Subject"] = "Your NephroCare reminders"
+                message.set_content("\n".join(f"{datetime.fromtimestamp(item.due):%b %d %H:%M}  {item.message}"
+                                              for item in items))
+                smtp.send_message(message)
+
+
+def get_notifier(name=NOTIFIER):
+    """Return the notifier named by NEPHROCARE_REMINDER_NOTIFIER."""
+    if name == "log":
+        return LogNotifier()
+    if name == "smtp":
+        return SMTPNotifier()
+    raise ValueError(f"Unknown reminder notifier '{name}'")
+
+
+class ReminderScheduler:
+    """SQLite-backed reminder queue with a near-term heap and batched delivery."""
+
+    def __init__(self, path=None, notifier=None, batch_size=BATCH_SIZE, horizon=HORIZON, max_queued=MAX_QUEUED):
+        self.path = path or data_path(DB_FILE)
+        self.notifier = notifier or LogNotifier()
+        self.batch_size = batch_size
+        self.horizon = horizon
+        self.max_queued = max_queued
+        self._conn = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(SCHEMA)
+        if "delivered_at" not in [column[1] for column in self._conn.execute("PRAGMA table_info(reminder)")]:
+            # Databases from before delivered reminders were kept
+            self._conn.execute("ALTER TABLE reminder ADD COLUMN delivered_at REAL")
+            self._conn.execute("DROP INDEX IF EXISTS reminder_due")
+        self._conn.execute(DUE_INDEX)
+        self._lock = threading.RLock()
+        self._wake = threading.Condition(self._lock)
+        self._heap = []
+        self._stale = 0
+        # Every row with (due, id) <= _loaded has an entry in the heap
+        self._loaded = (float("-inf"), 0)
+        self._retry_at = 0.0
+        self._pruned_at = 0.0
+        self._next_id = 1
+        self._thread = None
+        self._stopping = False
+        self.delivered = 0
+
+    def _write(self, apply):
+        # Run apply(conn) in one IMMEDIATE transaction
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                result = apply(self._conn)
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+            self._conn.execute("COMMIT")
+            return result
+
+    def _queue(self, due, reminder_id):
+        # Keep the heap in step with a new or moved row; wake the thread if it is the new earliest
+        if (due, reminder_id) <= self._loaded:
+            heapq.heappush(self._heap, (due, reminder_id))
+            if self._heap[0][1] == reminder_id:
+                self._wake.notify()
+
+    def _unqueue(self, due, reminder_id):
+        if (due, reminder_id) <= self._loaded:
+            self._stale += 1
+
+    def _insert(self, conn, rows):
+        # Ids are assigned here so a batch goes through one executemany; they are never reused
+        # within a process, so a stale heap entry cannot be mistaken for a new reminder
+        first = max(self._next_id, conn.execute("SELECT COALESCE(MAX(id), 0) + 1 FROM reminder").fetchone()[0])
+        for offset, row in enumerate(rows):
+            row[0] = first + offset
+        conn.executemany(f"INSERT INTO reminder ({_COLUMNS}) VALUES (?, ?, ?, ?, ?, ?)", rows)
+        self._next_id = first + len(rows)
+
+    def add(self, patient_id, kind, due, message, repeat=None):
+        """Schedule one reminder and return its id."""
+        return self.add_many([(patient_id, kind, due, message, repeat)])[0]
+
+    def add_many(self, reminders):
+        """Schedule (patient_id, kind, due, message, repeat) tuples in one transaction; return their ids."""
+        rows = []
+        for patient_id, kind, due, message, repeat in reminders:
+            _validate(kind, repeat)
+            rows.append([None, patient_id, kind, timestamp(due), message, repeat])
+
+        with self._lock:
+            self._write(lambda conn: self._insert(conn, rows))
+            for row in rows:
+                self._queue(row[3], row[0])
+        return [row[0] for row in rows]
+
+    def cancel(self, reminder_id):
+        """Cancel one reminder; returns False if it no longer exists."""
+        with self._lock:
+            row = self._write(lambda conn: conn.execute(
+                "DELETE FROM reminder WHERE id = ? RETURNING due, delivered_at", (reminder_id,)).fetchone())
+            if row is None:
+                return False
+            if row[1] is None:
+                self._unqueue(row[0], reminder_id)
+            return True
+
+    def cancel_patient(self, patient_id, kind=None):
+        """Cancel a patient's reminders, or only those of `kind`; returns how many."""
+        return self.replace(patient_id, kind, [])
+
+    def replace(self, patient_id, kind, reminders):
+        """Atomically swap a patient's reminders of `kind` (None: all kinds) for `reminders`.
+
+        `reminders` are (due, message, repeat) tuples; returns how many were cancelled.
+        """
+        rows = []
+        for due, message, repeat in reminders:
+            _validate(kind, repeat)
+            rows.append([None, patient_id, kind, timestamp(due), message, repeat])
+
+        def swap(conn):
+            where, params = ("patient_id = ?", (patient_id,)) if kind is None else \
+                ("patient_id = ? AND kind = ?", (patient_id, kind))
+            removed = conn.execute(f"DELETE FROM reminder WHERE {where} RETURNING id, due, delivered_at",
+                                   params).fetchall()
+            self._insert(conn, rows)
+            return removed
+
+        with self._lock:
+            removed = self._write(swap)
+            for reminder_id, due, delivered_at in removed:
+                if delivered_at is None:
+                    self._unqueue(due, reminder_id)
+            for row in rows:
+                self._queue(row[3], row[0])
+        return len(removed)
+
+    def reschedule(self, reminder_id, due):
+        """Move one reminder to `due`, to be delivered again if it already was; False if it no longer exists."""
+        due = timestamp(due)
+
+        def move(conn):
+            row = conn.execute("SELECT due, delivered_at FROM reminder WHERE id = ?", (reminder_id,)).fetchone()
+            if row is not None:
+                conn.execute("UPDATE reminder SET due = ?, delivered_at = NULL WHERE id = ?", (due, reminder_id))
+            return row
+
+        with self._lock:
+            row = self._write(move)
+            if row is None:
+                return False
+            if row[1] is None:
+                self._unqueue(row[0], reminder_id)
+            self._queue(due, reminder_id)
+            return True
+
+    def get(self, reminder_id):
+        with self._lock:
+            row = self._conn.execute(f"SELECT {_COLUMNS} FROM reminder WHERE id = ?", (reminder_id,)).fetchone()
+        return None if row is None else Reminder(*row)
+
+    def pending(self, patient_id, kind=None, limit=20):
+        """Return a patient's reminders, soonest first, including delivered ones kept until replaced."""
+        where, params = ("patient_id = ?", (patient_id,)) if kind is None else \
+            ("patient_id = ? AND kind = ?", (patient_id, kind))
+        with self._lock:
+            rows = self._conn.execute(f"SELECT {_COLUMNS} FROM reminder WHERE {where} ORDER BY due LIMIT ?",
+                                      (*params, limit)).fetchall()
+        return [Reminder(*row) for row in rows]
+
+    def next(self, patient_id, kind):
+        """Return the patient's soonest reminder of `kind`, or None."""
+        upcoming = self.pending(patient_id, kind, limit=1)
+        return upcoming[0] if upcoming else None
+
+    def deliveries(self, patient_id, limit=5):
+        """Return a patient's most recent deliveries as (kind, message, delivered_at) tuples."""
+        with self._lock:
+            return self._conn.execute(
+                "SELECT kind, message, delivered_at FROM delivery WHERE patient_id = ? "
+                "ORDER BY delivered_at DESC, id DESC LIMIT ?", (patient_id, limit)).fetchall()
+
+    def _refill(self, now):
+        # Rebuild a mostly stale heap, then load rows up to now + horizon that are not in it yet
+        if self._stale > max(1024, len(self._heap) // 2):
+            self._heap, self._stale, self._loaded = [], 0, (float("-inf"), 0)
+        end = now + self.horizon
+        if self._loaded[0] >= end - self.horizon / 2 or len(self._heap) >= self.max_queued // 2:
+            return
+        limit = self.max_queued - len(self._heap)
+        due, reminder_id = self._loaded
+        rows = self._conn.execute(
+            "SELECT due, id FROM reminder WHERE (due > ? OR (due = ? AND id > ?)) AND due < ? "
+            "AND delivered_at IS NULL ORDER BY due, id LIMIT ?", (due, due, reminder_id, end, limit)).fetchall()
+        for row in rows:
+            heapq.heappush(self._heap, row)
+        self._loaded = tuple(rows[-1]) if len(rows) == limit else (end, 0)
+
+    def _pop_due(self, now):
+        # Pop up to batch_size live reminders due by `now`
+        with self._lock:
+            self._refill(now)
+            entries = {}
+            while self._heap and self._heap[0][0] <= now and len(entries) < self.batch_size:
+                due, reminder_id = heapq.heappop(self._heap)
+                entries[reminder_id] = due
+            if not entries:
+                return [], 0
+            ids = list(entries)
+            rows = []
+            for start in range(0, len(ids), _ID_CHUNK):
+                chunk = ids[start:start + _ID_CHUNK]
+                rows += self._conn.execute(f"SELECT {_COLUMNS} FROM reminder WHERE delivered_at IS NULL "
+                                           f"AND id IN ({', '.join('?' * len(chunk))})", chunk).fetchall()
+            batch = [Reminder(*row) for row in rows if entries[row[0]] == row[3]]
+            # Entries whose row was cancelled or moved were counted as stale
+            self._stale = max(0, self._stale - (len(entries) - len(batch)))
+            return batch, len(entries)
+
+    def _complete(self, batch, now):
+        # Record a delivered batch: log it, drop or mark one-offs, advance repeating reminders past now
+        moved = []
+        for reminder in batch:
+            if reminder.repeat:
+                skipped = max(1, -(-(now - reminder.due) // reminder.repeat))
+                moved.append((reminder.due + skipped * reminder.repeat, reminder.id, reminder.due))
+
+        def record(conn):
+            conn.executemany("INSERT INTO delivery (patient_id, kind, due, message, delivered_at) "
+                             "VALUES (?, ?, ?, ?, ?)",
+                             [(r.patient_id, r.kind, r.due, r.message, now) for r in batch])
+            conn.executemany("DELETE FROM reminder WHERE id = ? AND due = ? AND repeat IS NULL",
+                             [(r.id, r.due) for r in batch if not r.repeat and r.kind not in KEEP_UNTIL_REPLACED])
+            conn.executemany("UPDATE reminder SET delivered_at = ? WHERE id = ? AND due = ? AND repeat IS NULL",
+                             [(now, r.id, r.due) for r in batch if not r.repeat and r.kind in KEEP_UNTIL_REPLACED])
+            # A reminder cancelled or moved while its batch was being sent is left alone
+            return [(due, reminder_id) for due, reminder_id, old in moved
+                    if conn.execute("UPDATE reminder SET due = ? WHERE id = ? AND due = ?",
+                                    (due, reminder_id, old)).rowcount]
+
+        with self._lock:
+            for due, reminder_id in self._write(record):
+                self._queue(due, reminder_id)
+            if now - self._pruned_at >= PRUNE_INTERVAL:
+                self._pruned_at = now
+                self._write(lambda conn: conn.execute("DELETE FROM delivery WHERE delivered_at < ?",
+                                                      (now - DELIVERY_RETENTION,)))
+            self.delivered += len(batch)
+
+    def run_pending(self, now=None):
+        """Deliver everything due by `now` in batches; returns how many were delivered.
+
+        Stops at the first failed send, leaving that batch queued for the next call.
+        """
+        now = time.time() if now is None else now
+        delivered = 0
+        while True:
+            batch, popped = self._pop_due(now)
+            if not popped:
+                return delivered
+            if not batch:
+                continue
+            try:
+                with metrics.span("reminders.send"):
+                    self.notifier.send(batch)
+            except Exception:
+                log.exception("Could not deliver %d reminders; retrying in %.0fs", len(batch), RETRY_DELAY)
+                metrics.increment("reminder_send_failures")
+                with self._lock:
+                    for reminder in batch:
+                        heapq.heappush(self._heap, (reminder.due, reminder.id))
+                    self._retry_at = time.time() + RETRY_DELAY
+                return delivered
+            self._complete(batch, now)
+            delivered += len(batch)
+            metrics.increment("reminder_batches")
+            metrics.increment("reminders_delivered", len(batch))
+
+    def _wait(self):
+        # Seconds the delivery thread may sleep: until the next due reminder, a retry or MAX_WAIT
+        now = time.time()
+        if self._retry_at > now:
+            return self._retry_at - now
+        if self._heap:
+            return min(MAX_WAIT, max(0.0, self._heap[0][0] - now))
+        return MAX_WAIT
+
+    def _run(self):
+        while True:
+            with self._lock:
+                if self._stopping:
+                    return
+                wait = self._wait()
+                if wait > 0:
+                    self._wake.wait(wait)
+                if self._stopping:
+                    return
+                if self._retry_at > time.time():
+                    continue
+            try:
+                self.run_pending()
+            except sqlite3.Error:
+                # Keep the thread alive; the reminders are still in the database
+                log.exception("Reminder delivery failed")
+
+    def start(self):
+        """Start the daemon delivery thread, once."""
+        with self._lock:
+            if self._thread is None:
+                self._stopping = False
+                self._thread = threading.Thread(target=self._run, daemon=True, name="nephrocare-reminders")
+                self._thread.start()
+
+    def stop(self, timeout=5.0):
+        """Stop the delivery thread; undelivered reminders stay in the database."""
+        with self._lock:
+            thread, self._thread = self._thread, None
+            self._stopping = True
+            self._wake.notify()
+        if thread is not None:
+            thread.join(timeout)
+
+    def stats(self):
+        with self._lock:
+            pending = self._conn.execute("SELECT COUNT(*) FROM reminder WHERE delivered_at IS NULL").fetchone()[0]
+            return {"pending": pending, "queued": len(self._heap), "delivered": self.delivered}
+
+    def close(self):
+        self.stop()
+        with self._lock:
+            self._conn.close()
+
+
+def medication_reminders(medications, times, today=None):
+    """Daily (due, message, repeat) reminders at each of `times` (from MEDICATION_TIMES)."""
+    today = today or date.today()
+    now = datetime.now()
+    reminders = []
+    for slot_time in times:
+        due = datetime.combine(today, clock(MEDICATION_HOURS[MEDICATION_TIMES.index(slot_time)]))
+        if due <= now:
+            due += timedelta(days=1)
+        reminders.append((due, f"Time to take your medication: {medications or 'as prescribed'}", 86400.0))
+    return reminders
+
+
+def refill_reminder(medications, days=REFILL_DAYS, today=None):
+    """A refill reminder `days` from today, repeating every `days` days."""
+    today = today or date.today()
+    return (today + timedelta(days=days), f"Medication refill due: {medications or 'your prescriptions'}",
+            days * 86400.0)
+
+
+def follow_up_reminder(patient_data, today=None):
+    """A follow-up imaging reminder timed from the patient's recurrence curve."""
+    today = today or date.today()
+    curve = patient_curve(patient_data, today)
+    months = MAX_FOLLOW_UP_MONTHS if curve is None else follow_up_months(curve)
+    return (today + timedelta(days=round(months * DAYS_PER_MONTH)),
+            "Follow-up imaging is due to check for new stones", None)
+
+
+def lab_test_reminder(today=None, months=LAB_TEST_MONTHS):
+    """A 24-hour urine and blood chemistry reminder `months` from today."""
+    today = today or date.today()
+    return (today + timedelta(days=round(months * DAYS_PER_MONTH)),
+            "Lab tests due: 24-hour urine analysis and blood chemistry", None)
+
+
+def appointment_reminder(day, slot_time, doctor_name):
+    """A reminder APPOINTMENT_NOTICE before an appointment, or now if that has passed."""
+    start = datetime.combine(day, clock(SLOT_HOURS[slot_index(slot_time)]))
+    due = max(datetime.now(), start - APPOINTMENT_NOTICE)
+    return (due, f"Appointment with {doctor_name} on {start:%b %d} at {slot_time}", None)
+
+
+_scheduler = None
+_scheduler_lock = threading.Lock()
+
+
+def get_reminder_scheduler():
+    """Return the process-wide ReminderScheduler, starting its delivery thread."""
+    global _scheduler
+    with _scheduler_lock:
+        if _scheduler is None:
+            _scheduler = ReminderScheduler(notifier=get_notifier())
+            _scheduler.start()
+            atexit.register(_scheduler.stop)
+            for name in ("pending", "queued"):
+                metrics.register_gauge(f"reminders_{name}", lambda name=name: _scheduler.stats()[name])
+        return _scheduler
@@ -0,0 +1,68 @@
+"""Recurrence-risk scoring shared by the Streamlit app and the batch CLI.
+
+Every function here works element-wise on NumPy arrays or pandas columns, so a
+whole cohort is scored in one pass. A single patient is scored by wrapping the
+session's values in length-one arrays, which keeps the app and the batch path
+on exactly the same arithmetic.
+"""
+import numpy as np
+
+# Columns (or patient_data keys) the score is built from
+RISK_COLUMNS = ["previous_operations", "family_history", "water_intake", "diet"]
+
+# Score parameters: min(MAX_RISK, BASE_RISK + risk_factors * POINTS_PER_FACTOR)
+BASE_RISK = 30
+POINTS_PER_FACTOR = 15
+MAX_RISK = 90
+
+# Risk factor thresholds and the points they add
+PREVIOUS_OPERATIONS_THRESHOLD = 1
+PREVIOUS_OPERATIONS_POINTS = 2
+LOW_WATER_INTAKE = 6
+FAMILY_HISTORY_POSITIVE = ["One relative", "Multiple relatives"]
+HIGH_RISK_DIETS = ["High-protein", "High-salt"]
+
+
+def _matches_any(values, choices):
+    # Plain equality per choice; np.isin would try to sort mixed object arrays
+    values = np.asarray(values, dtype=object)
+    mask = np.zeros(values.shape, dtype=bool)
+    for choice in choices:
+        mask |= values == choice
+    return mask
+
+
+def count_risk_factors(previous_operations, family_history, water_intake, diet):
+    """Return the number of risk factors for each patient as an int array.
+
+    Missing values (NaN/None) never count as a risk factor.
+    """
+    previous_operations = np.asarray(previous_operations, dtype=float)
+    water_intake = np.asarray(water_intake, dtype=float)
+
+    risk_factors = np.where(previous_operations > PREVIOUS_OPERATIONS_THRESHOLD,
+                            PREVIOUS_OPERATIONS_POINTS, 0)
+    risk_factors += _matches_any(family_history, FAMILY_HISTORY_POSITIVE)
+    risk_factors += water_intake < LOW_WATER_INTAKE
+    risk_factors += _matches_any(diet, HIGH_RISK_DIETS)
+    return risk_factors
+
+
+def score_recurrence_risk(previous_operations, family_history, water_intake, diet):
+    """Return the recurrence risk percentage for each patient as an int array."""
+    risk_factors = count_risk_factors(previous_operations, family_history, water_intake, diet)
+    return np.minimum(MAX_RISK, BASE_RISK + risk_factors * POINTS_PER_FACTOR)
+
+
+def score_frame(frame):
+    """Score every row of a DataFrame that has the RISK_COLUMNS."""
+    missing = [column for column in RISK_COLUMNS if column not in frame.columns]
+    if missing:
+        raise KeyError(f"Missing required column(s): {', '.join(missing)}")
+    return score_recurrence_risk(*(frame[column].to_numpy() for column in RISK_COLUMNS))
+
+
+def score_patient(patient_data):
+    """Score a single patient_data dict, as used by the Streamlit session."""
+    values = [[patient_data.get(key)] for key in RISK_COLUMNS]
+    return int(score_recurrence_risk(*values)[0])
@@ -0,0 +1,219 @@
+"""Trained recurrence-risk and stone-type model: features and inference.
+
+The model is a pair of linear classifiers trained by model_training.py and
+saved as a compact .npz artifact (standardization parameters, weights and
+metadata). Inference is a NumPy dot product, so this module loads without
+scikit-learn and answers a single patient in well under a millisecond.
+
+Features are built column-wise from anything that maps a patient_data key
+to an array-like (a DataFrame, or a dict of lists), so a single patient and
+a whole cohort go through exactly the same arithmetic.
+"""
+import json
+import os
+import threading
+import warnings
+from datetime import date
+
+import numpy as np
+
+from config import DATA_DIR
+
+# Bump when the artifact layout or the feature definitions change
+ARTIFACT_VERSION = 1
+
+MODEL_PATH = os.environ.get("NEPHROCARE_MODEL_PATH", os.path.join(DATA_DIR, "models", "risk_model.npz"))
+
+NUMERIC_FEATURES = [
+    "age", "bmi", "previous_operations", "days_since_operation", "water_intake", "stress_level",
+    # Lab analytes, when a lab report was uploaded (see lab_reports.ANALYTES)
+    "urine_calcium", "urine_oxalate", "urine_citrate", "urine_uric_acid", "urine_ph", "urine_volume",
+    "serum_calcium", "serum_uric_acid",
+]
+BOOLEAN_FEATURES = ["hypertension", "diabetes", "uti_history", "kidney_disease"]
+CATEGORICAL_FEATURES = {
+    "gender": ["Male", "Female", "Other"],
+    "family_history": ["None", "One relative", "Multiple relatives"],
+    "diet": ["Mixed", "Vegetarian", "High-protein", "High-salt", "Other"],
+    "activity_level": ["Sedentary", "Lightly active", "Moderately active", "Very active"],
+    "smoking": ["Never", "Former", "Current"],
+    "alcohol": ["None", "Occasional", "Moderate", "Heavy"],
+}
+FEATURE_NAMES = NUMERIC_FEATURES + BOOLEAN_FEATURES + [
+    f"{column}={value}" for column, values in CATEGORICAL_FEATURES.items() for value in values
+]
+
+_TRUE_VALUES = [True, "True", "true", "Yes", "yes"]
+
+_model = None
+_model_loaded = False
+_model_lock = threading.Lock()
+
+
+def _column(columns, name, length):
+    if name in columns:
+        return np.asarray(columns[name], dtype=object)
+    return np.full(length, None, dtype=object)
+
+
+def _matches_any(values, choices):
+    # Element-wise equality on object arrays; None/NaN never match
+    mask = np.zeros(values.shape, dtype=bool)
+    for choice in choices:
+        mask |= values == choice
+    return mask
+
+
+def _numbers(values):
+    try:
+        return values.astype(np.float64)
+    except (TypeError, ValueError):
+        # Stray text (e.g. "" from a CSV) counts as missing
+        return np.array([value if isinstance(value, (int, float)) else np.nan for value in values],
+                        dtype=np.float64)
+
+
+def _days_since(values, today):
+    try:
+        days = values.astype("datetime64[D]")
+    except (TypeError, ValueError):
+        # Missing CSV values come through as float NaN
+        days = np.array([None if value != value else value for value in values], dtype=object).astype("datetime64[D]")
+    elapsed = (np.datetime64(today, "D") - days).astype(np.float64)
+    elapsed[np.isnat(days)] = np.nan
+    return elapsed
+
+
+def feature_matrix(columns, today=None):
+    """Return the raw (unscaled) feature matrix, one row per patient.
+
+    `columns` maps patient_data keys to equal-length array-likes; absent
+    keys and missing values become NaN (numeric) or 0 (flags and one-hots).
+    """
+    first = next(iter(columns), None)
+    length = 0 if first is None else len(columns[first])
+    today = today or date.today()
+    features = np.empty((length, len(FEATURE_NAMES)), dtype=np.float64)
+
+    weight = _numbers(_column(columns, "weight", length))
+    height = _numbers(_column(columns, "height", length)) / 100
+    derived = {
+        "bmi": weight / (height * height),
+        "days_since_operation": _days_since(_column(columns, "last_operation", length), today),
+    }
+    index = 0
+    for name in NUMERIC_FEATURES:
+        features[:, index] = derived[name] if name in derived else _numbers(_column(columns, name, length))
+        index += 1
+    for name in BOOLEAN_FEATURES:
+        features[:, index] = _matches_any(_column(columns, name, length), _TRUE_VALUES)
+        index += 1
+    for name, choices in CATEGORICAL_FEATURES.items():
+        values = _column(columns, name, length)
+        for choice in choices:
+            features[:, index] = values == choice
+            index += 1
+    return features
+
+
+def patient_columns(patient_data):
+    """Wrap one session's patient_data (and its lab results) as length-one columns."""
+    flat = dict(patient_data)
+    flat.update(patient_data.get("lab_results") or {})
+    return {key: [value] for key, value in flat.items()}
+
+
+def _sigmoid(z):
+    return 1 / (1 + np.exp(-z))
+
+
+class RiskModel:
+    """Recurrence probability and stone-type classifier loaded from an artifact."""
+
+    def __init__(self, mean, scale, recurrence_coef, recurrence_intercept,
+                 stone_coef, stone_intercept, stone_classes, metadata):
+        self.mean = mean
+        self.scale = scale
+        self.recurrence_coef = recurrence_coef
+        self.recurrence_intercept = float(recurrence_intercept)
+        self.stone_coef = stone_coef
+        self.stone_intercept = stone_intercept
+        self.stone_classes = stone_classes
+        self.metadata = metadata
+
+    @property
+    def version(self):
+        return self.metadata.get("model_version", "unknown")
+
+    @classmethod
+    def load(cls, path=MODEL_PATH):
+        with np.load(path, allow_pickle=False) as artifact:
+            metadata = json.loads(str(artifact["metadata"]))
+            if metadata.get("artifact_version") != ARTIFACT_VERSION:
+                raise ValueError(f"{path}: artifact version {metadata.get('artifact_version')} "
+                                 f"is not supported (expected {ARTIFACT_VERSION})")
+            if list(artifact["feature_names"]) != FEATURE_NAMES:
+                raise ValueError(f"{path}: model was trained on different features; retrain it")
+            return cls(artifact["mean"], artifact["scale"],
+                       artifact["recurrence_coef"], artifact["recurrence_intercept"],
+                       artifact["stone_coef"], artifact["stone_intercept"],
+                       artifact["stone_classes"].astype(object), metadata)
+
+    def save(self, path=MODEL_PATH):
+        """Write the artifact atomically (readers never see a partial file)."""
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "wb") as f:
+            np.savez_compressed(
+                f, mean=self.mean, scale=self.scale,
+                recurrence_coef=self.recurrence_coef,
+                recurrence_intercept=np.float64(self.recurrence_intercept),
+                stone_coef=self.stone_coef, stone_intercept=self.stone_intercept,
+                stone_classes=np.asarray(self.stone_classes, dtype=str),
+                feature_names=np.asarray(FEATURE_NAMES), metadata=np.asarray(json.dumps(self.metadata)),
+            )
+        os.replace(tmp_path, path)
+
+    def scaled(self, features):
+        """Standardize a raw feature matrix; missing values get the training mean."""
+        scaled = (features - self.mean) / self.scale
+        scaled[np.isnan(scaled)] = 0.0
+        return scaled
+
+    def recurrence_probability(self, scaled):
+        return _sigmoid(scaled @ self.recurrence_coef + self.recurrence_intercept)
+
+    def stone_type_probabilities(self, scaled):
+        # One-vs-rest logistic scores, normalized as scikit-learn's predict_proba does
+        scores = _sigmoid(scaled @ self.stone_coef.T + self.stone_intercept)
+        return scores / scores.sum(axis=1, keepdims=True)
+
+    def predict_columns(self, columns, today=None):
+        """Return (recurrence risk % int array, stone type array) for a cohort."""
+        scaled = self.scaled(feature_matrix(columns, today))
+        risk = np.rint(100 * self.recurrence_probability(scaled)).astype(int)
+        stone_types = self.stone_classes[self.stone_type_probabilities(scaled).argmax(axis=1)]
+        return risk, stone_types
+
+    def predict(self, patient_data, today=None):
+        """Return (recurrence risk %, stone type) for one session's patient_data."""
+        risk, stone_types = self.predict_columns(patient_columns(patient_data), today)
+        return int(risk[0]), stone_types[0]
+
+
+def get_model():
+    """Return the process-wide RiskModel, or None when no model has been trained.
+
+    The artifact is read once per process; restart the app to pick up a
+    retrained model.
+    """
+    global _model, _model_loaded
+    with _model_lock:
+        if not _model_loaded:
+            _model_loaded = True
+            if os.path.exists(MODEL_PATH):
+                try:
+                    _model = RiskModel.load(MODEL_PATH)
+                except (OSError, KeyError, ValueError) as exc:
+                    warnings.warn(f"Ignoring unusable risk model: {exc}")
+        return _model
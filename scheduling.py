@@ -0,0 +1,183 @@
+"""Appointment slot allocation for consultations and virtual visits.
+
+Each doctor's calendar is one row per day holding a bitmap of booked slots
+(bit i set = SLOT_TIMES[i] taken). Booking sets the bit with a conditional
+UPDATE inside an IMMEDIATE transaction, so two sessions - or two processes
+sharing the database file - can never both get the same slot. "Next free
+slot" reads a few bitmap rows and finds the lowest clear bit.
+"""
+import sqlite3
+import threading
+import time
+from datetime import date, datetime, timedelta
+
+from config import data_path
+
+DB_FILE = "scheduling.db"
+
+# Bookable times, in order; index i is bit i of a day's bitmap
+SLOT_TIMES = ["9:00 AM", "11:00 AM", "2:00 PM", "4:00 PM", "6:00 PM"]
+SLOT_HOURS = [9, 11, 14, 16, 18]
+FULL_DAY = (1 << len(SLOT_TIMES)) - 1
+
+CONSULTATION = "consultation"
+VIRTUAL_VISIT = "virtual"
+
+# How far ahead next_free_slot() looks
+SEARCH_DAYS = 60
+
+BUSY_TIMEOUT = 30.0
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS calendar (
+    doctor_id INTEGER NOT NULL,
+    day TEXT NOT NULL,
+    booked INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (doctor_id, day)
+) WITHOUT ROWID;
+
+CREATE TABLE IF NOT EXISTS appointment (
+    id INTEGER PRIMARY KEY,
+    doctor_id INTEGER NOT NULL,
+    day TEXT NOT NULL,
+    slot INTEGER NOT NULL,
+    patient_id TEXT NOT NULL,
+    kind TEXT NOT NULL,
+    created_at REAL NOT NULL,
+    UNIQUE (doctor_id, day, slot)
+);
+
+CREATE INDEX IF NOT EXISTS appointment_patient ON appointment (patient_id, day);
+"""
+
+
+class SlotUnavailable(Exception):
+    """The requested slot is already booked or in the past."""
+
+
+def slot_index(slot_time):
+    """Return the bit index of a time from SLOT_TIMES."""
+    try:
+        return SLOT_TIMES.index(slot_time)
+    except ValueError:
+        raise ValueError(f"Unknown slot time '{slot_time}'") from None
+
+
+def _open_slots_mask(day, now):
+    # Slots that have not started yet on `day`
+    if day > now.date():
+        return FULL_DAY
+    if day < now.date():
+        return 0
+    mask = 0
+    for i, hour in enumerate(SLOT_HOURS):
+        if hour > now.hour:
+            mask |= 1 << i
+    return mask
+
+
+class Scheduler:
+    """Per-doctor daily slot bitmaps in SQLite with atomic booking."""
+
+    def __init__(self, path=None):
+        self.path = path or data_path(DB_FILE)
+        self._local = threading.local()
+        self._connection().executescript(SCHEMA)
+
+    def _connection(self):
+        # One connection per thread; SQLite's locking makes booking atomic across them
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=BUSY_TIMEOUT, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def next_free_slot(self, doctor_id, start=None, days=SEARCH_DAYS, now=None):
+        """Return (day, slot_time) of the doctor's earliest free slot, or None."""
+        now = now or datetime.now()
+        start = max(start or now.date(), now.date())
+        end = start + timedelta(days=days - 1)
+        booked = dict(self._connection().execute(
+            "SELECT day, booked FROM calendar WHERE doctor_id = ? AND day BETWEEN ? AND ?",
+            (doctor_id, start.isoformat(), end.isoformat())
+        ).fetchall())
+        for offset in range(days):
+            day = start + timedelta(days=offset)
+            free = ~booked.get(day.isoformat(), 0) & _open_slots_mask(day, now)
+            if free:
+                lowest = (free & -free).bit_length() - 1
+                return day, SLOT_TIMES[lowest]
+        return None
+
+    def next_appointment(self, patient_id, now=None):
+        """Return (doctor_id, day, slot_time, kind) of the patient's next appointment, or None."""
+        now = now or datetime.now()
+        rows = self._connection().execute(
+            "SELECT doctor_id, day, slot, kind FROM appointment WHERE patient_id = ? AND day >= ? "
+            "ORDER BY day, slot", (patient_id, now.date().isoformat()))
+        for doctor_id, day, slot, kind in rows:
+            day = date.fromisoformat(day)
+            if _open_slots_mask(day, now) & (1 << slot):
+                return doctor_id, day, SLOT_TIMES[slot], kind
+        return None
+
+    def book(self, doctor_id, day, slot_time, patient_id, kind=CONSULTATION, now=None):
+        """Atomically book one slot and return the appointment id.
+
+        Raises SlotUnavailable if the slot is taken or already past.
+        """
+        bit = 1 << slot_index(slot_time)
+        if not _open_slots_mask(day, now or datetime.now()) & bit:
+            raise SlotUnavailable(f"{day} at {slot_time} has already passed")
+
+        conn = self._connection()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.execute("INSERT OR IGNORE INTO calendar (doctor_id, day) VALUES (?, ?)",
+                         (doctor_id, day.isoformat()))
+            claimed = conn.execute(
+                "UPDATE calendar SET booked = booked | ? WHERE doctor_id = ? AND day = ? AND booked & ? = 0",
+                (bit, doctor_id, day.isoformat(), bit)
+            ).rowcount
+            if not claimed:
+                raise SlotUnavailable(f"{day} at {slot_time} is already booked")
+            appointment_id = conn.execute(
+                "INSERT INTO appointment (doctor_id, day, slot, patient_id, kind, created_at) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (doctor_id, day.isoformat(), slot_index(slot_time), patient_id, kind, time.time())
+            ).lastrowid
+            conn.execute("COMMIT")
+        except BaseException:
+            # Also after a failed COMMIT, which leaves the transaction open
+            if conn.in_transaction:
+                conn.execute("ROLLBACK")
+            raise
+        return appointment_id
+
+    def book_any(self, doctor_ids, day, slot_time, patient_id, kind=VIRTUAL_VISIT, now=None):
+        """Book the slot with the first doctor in `doctor_ids` who has it free.
+
+        Returns (doctor_id, appointment_id); raises SlotUnavailable if nobody
+        is free at that time.
+        """
+        for doctor_id in doctor_ids:
+            try:
+                return doctor_id, self.book(doctor_id, day, slot_time, patient_id, kind, now)
+            except SlotUnavailable:
+                continue
+        raise SlotUnavailable(f"No specialist is free on {day} at {slot_time}")
+
+
+_scheduler = None
+_scheduler_lock = threading.Lock()
+
+
+def get_scheduler():
+    """Return the process-wide Scheduler."""
+    global _scheduler
+    with _scheduler_lock:
+        if _scheduler is None:
+            _scheduler = Scheduler()
+        return _scheduler
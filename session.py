@@ -0,0 +1,97 @@
+"""Helpers for identifying the current Streamlit browser session."""
+import json
+import re
+import uuid
+from http.cookies import CookieError, SimpleCookie
+
+import streamlit as st
+import streamlit.components.v1 as components
+from streamlit.runtime.scriptrunner import get_script_run_ctx
+from streamlit.web.server.websocket_headers import _get_websocket_headers
+
+import ingest
+from session_store import SPILL_TTL, get_session_store
+
+# Cookie carrying the session id, so a reload or a server restart finds the
+# same patient record and background jobs. A cookie rather than the URL, so
+# the id never ends up in browser history, shared links or Referer headers.
+SESSION_COOKIE = "nephrocare_session"
+_SESSION_ID = re.compile(r"[0-9a-f]{32}")
+
+# Streamlit can only set cookies from the page, so a zero-height component does it
+_SET_COOKIE = """<script>
+const secure = window.parent.location.protocol === "https:" ? "; Secure" : "";
+window.parent.document.cookie = %s + "; Path=/; Max-Age=%d; SameSite=Strict" + secure;
+</script>"""
+
+
+def _session_cookie():
+    # The cookie the browser sent when it opened this session's websocket
+    try:
+        headers = _get_websocket_headers() or {}
+    except RuntimeError:
+        # No server, or a client that is not a browser (e.g. AppTest)
+        return None
+    try:
+        morsel = SimpleCookie(headers.get("Cookie", "")).get(SESSION_COOKIE)
+    except CookieError:
+        return None
+    return morsel.value if morsel is not None else None
+
+
+def current_session_id():
+    """Return an id that is stable across reruns and reloads of the current browser session."""
+    if 'session_id' not in st.session_state:
+        session_id = _session_cookie()
+        if session_id is None or not _SESSION_ID.fullmatch(session_id):
+            session_id = uuid.uuid4().hex
+            if get_script_run_ctx() is not None:
+                components.html(_SET_COOKIE % (json.dumps(f"{SESSION_COOKIE}={session_id}"), SPILL_TTL),
+                                height=0)
+        st.session_state.session_id = session_id
+    return st.session_state.session_id
+
+
+def current_patient():
+    """Return this session's PatientRecord from the shared session store."""
+    return get_session_store().get(current_session_id())
+
+
+def patient_key():
+    """Return the key under which the current patient's records are stored.
+
+    A random id generated once and kept in the patient record. It is never
+    derived from the name, so patients who share a name never share data.
+    """
+    patient = current_patient()
+    patient_id = patient.get('patient_id')
+    if patient_id is None:
+        patient_id = patient['patient_id'] = uuid.uuid4().hex
+    return patient_id
+
+
+def upload_handles(key, uploads):
+    """Return BlobHandles for the files currently in the uploader `key`.
+
+    Each file is streamed into the on-disk store the first time it is seen,
+    and session state keeps only the handles.
+    """
+    if uploads is None:
+        uploads = []
+    elif not isinstance(uploads, list):
+        uploads = [uploads]
+    known = st.session_state.setdefault('upload_handles', {}).get(key, {})
+    current = {}
+    for upload in uploads:
+        handle = known.get(upload.file_id)
+        if handle is None or not ingest.exists(handle):
+            handle = ingest.ingest_upload(upload, owner=current_session_id())
+        current[upload.file_id] = handle
+    st.session_state.upload_handles[key] = current
+    return list(current.values())
+
+
+def upload_handle(key, upload):
+    """Single-file form of upload_handles(); returns a BlobHandle or None."""
+    handles = upload_handles(key, upload)
+    return handles[0] if handles else None
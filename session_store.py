@@ -0,0 +1,186 @@
+"""Shared server-side store for per-session patient records.
+
+Every browser session's PatientRecord lives here rather than in Streamlit's
+session state. The store keeps records in memory in least-recently-used
+order and bounds them two ways: records idle for IDLE_TIMEOUT seconds, and
+the least recently used records once the total footprint passes MAX_BYTES,
+are spilled to one small JSON file each under DATA_DIR/sessions and loaded
+back on the session's next request. A loaded record's file stays on disk
+until the record is spilled over it or discarded, so a crash falls back to
+the last spilled copy rather than losing the record. Everything still in
+memory is spilled at exit, so records survive a restart; spilled files
+unused for SPILL_TTL are deleted, which ends the session (on_end is called,
+and the process-wide store then releases the session's uploads).
+
+Footprints are measured with PatientRecord.footprint() each time a record is
+handed out, so a record's size is current as of its session's last rerun.
+"""
+import atexit
+import json
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+
+import ingest
+import metrics
+from config import data_dir
+from patient_record import PatientRecord
+
+SESSION_DIR = "sessions"
+
+MAX_BYTES = int(float(os.environ.get("NEPHROCARE_SESSION_MEMORY_MB") or 64) * 1024 * 1024)
+IDLE_TIMEOUT = 30 * 60
+SPILL_TTL = 30 * 24 * 60 * 60
+
+# Records used this recently are never spilled: a script run may still be writing to them
+MIN_RESIDENT = 60
+
+_SESSION_ID = re.compile(r"[0-9A-Za-z_-]{1,64}")
+
+
+class SessionStore:
+    """Bounded in-memory PatientRecord store that spills to disk."""
+
+    def __init__(self, directory=None, max_bytes=MAX_BYTES, idle_timeout=IDLE_TIMEOUT,
+                 spill_ttl=SPILL_TTL, min_resident=MIN_RESIDENT, on_end=None):
+        self.directory = directory or data_dir(SESSION_DIR)
+        # Called with the session id when a session is discarded or its spilled record expires
+        self.on_end = on_end
+        os.makedirs(self.directory, exist_ok=True)
+        self.max_bytes = max_bytes
+        self.idle_timeout = idle_timeout
+        self.spill_ttl = spill_ttl
+        self.min_resident = min_resident
+        # session id -> [record, last used (time.time()), footprint], least recently used first
+        self._records = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+    def _path(self, session_id):
+        if not _SESSION_ID.fullmatch(session_id):
+            raise ValueError(f"Invalid session id {session_id!r}")
+        return os.path.join(self.directory, f"{session_id}.json")
+
+    def get(self, session_id):
+        """Return the session's record, loading or creating it as needed."""
+        now = time.time()
+        with self._lock:
+            entry = self._records.pop(session_id, None)
+            if entry is None:
+                record = self._load(session_id)
+            else:
+                record = entry[0]
+                self._bytes -= entry[2]
+            size = record.footprint()
+            self._records[session_id] = [record, now, size]
+            self._bytes += size
+            self._evict(now)
+        return record
+
+    def discard(self, session_id):
+        """Forget a session's record, in memory and on disk, and end the session."""
+        with self._lock:
+            entry = self._records.pop(session_id, None)
+            if entry is not None:
+                self._bytes -= entry[2]
+            try:
+                os.remove(self._path(session_id))
+            except FileNotFoundError:
+                pass
+        if self.on_end is not None:
+            self.on_end(session_id)
+
+    def footprint(self, session_id):
+        """Bytes the session's record held at its last access, or 0 when not in memory."""
+        with self._lock:
+            entry = self._records.get(session_id)
+            return entry[2] if entry is not None else 0
+
+    def stats(self):
+        with self._lock:
+            sessions = len(self._records)
+            return {
+                "sessions": sessions,
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+                "bytes_per_session": self._bytes / sessions if sessions else 0.0,
+            }
+
+    def flush(self):
+        """Spill every in-memory record to disk (at exit)."""
+        with self._lock:
+            while self._records:
+                session_id, (record, _, size) = self._records.popitem(last=False)
+                self._spill(session_id, record)
+                self._bytes -= size
+
+    def purge_spilled(self, now=None):
+        """Delete spilled records unused for spill_ttl seconds; returns how many."""
+        cutoff = (now or time.time()) - self.spill_ttl
+        removed = 0
+        for entry in os.scandir(self.directory):
+            session_id = entry.name[:-len(".json")]
+            # A record in memory is still in use, however old its last spill
+            if entry.name.endswith(".json") and session_id not in self._records and entry.stat().st_mtime < cutoff:
+                os.remove(entry.path)
+                removed += 1
+                if self.on_end is not None:
+                    self.on_end(session_id)
+        return removed
+
+    def _load(self, session_id):
+        path = self._path(session_id)
+        try:
+            with open(path) as f:
+                record = PatientRecord.from_state(json.load(f))
+        except FileNotFoundError:
+            metrics.increment("sessions_created")
+            return PatientRecord()
+        # Keep the file as a fallback until the record is written back; mark it used for purge_spilled()
+        os.utime(path)
+        metrics.increment("sessions_restored")
+        return record
+
+    def _spill(self, session_id, record):
+        path = self._path(session_id)
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(record.to_state(), f)
+        os.replace(tmp_path, path)
+        metrics.increment("sessions_spilled")
+
+    def _evict(self, now):
+        # Oldest first: spill idle records, then more until under the memory cap
+        idle_before = now - self.idle_timeout
+        resident_after = now - self.min_resident
+        while self._records:
+            session_id, (record, last_used, size) = next(iter(self._records.items()))
+            if last_used >= idle_before and (self._bytes <= self.max_bytes or last_used >= resident_after):
+                break
+            del self._records[session_id]
+            self._bytes -= size
+            self._spill(session_id, record)
+
+    def __len__(self):
+        with self._lock:
+            return len(self._records)
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_session_store():
+    """Return the process-wide SessionStore, spilling it to disk at exit."""
+    global _store
+    with _store_lock:
+        if _store is None:
+            # A session's uploads go with it
+            _store = SessionStore(on_end=ingest.release)
+            _store.purge_spilled()
+            atexit.register(_store.flush)
+            for name in ("sessions", "bytes", "max_bytes"):
+                metrics.register_gauge(f"session_store_{name}", lambda name=name: _store.stats()[name])
+        return _store
@@ -0,0 +1,97 @@
+"""Static reference data and markup, loaded once per process."""
+import os
+
+import streamlit as st
+
+# Optional CSV of specialists (name, specialty, experience, hospital, rating)
+DOCTORS_PATH = os.environ.get("NEPHROCARE_DOCTORS_PATH")
+
+# Custom CSS for styling
+APP_CSS = """
+    <style>
+    .main-header {
+        font-size: 3rem;
+        color: #1E90FF;
+        text-align: center;
+        margin-bottom: 2rem;
+    }
+    .sub-header {
+        font-size: 1.8rem;
+        color: #4682B4;
+        margin-bottom: 1rem;
+    }
+    .highlight {
+        background-color: #F0F8FF;
+        padding: 15px;
+        border-radius: 10px;
+        margin-bottom: 15px;
+    }
+    .doctor-card {
+        background-color: #E6F2FF;
+        padding: 15px;
+        border-radius: 10px;
+        margin-bottom: 15px;
+        box-shadow: 0 4px 6px rgba(0, 0, 0, 0.1);
+    }
+    .prediction-positive {
+        color: #FF4500;
+        font-weight: bold;
+    }
+    .prediction-negative {
+        color: #32CD32;
+        font-weight: bold;
+    }
+    </style>
+    """
+
+FOOTER_HTML = """
+    <div style='text-align: center'>
+        <p>NephroCare AI - Advanced Kidney Stone Management System</p>
+        <p>For educational purposes only | Always consult healthcare professionals for medical advice</p>
+    </div>
+"""
+
+
+@st.cache_resource
+def load_doctors():
+    # Mock database of doctors (in a real app, this would be a proper database)
+    return [
+        {"name": "Dr. Sarah Johnson", "specialty": "Nephrology", "experience": "15 years", "hospital": "City General Hospital", "rating": 4.8},
+        {"name": "Dr. Michael Chen", "specialty": "Urology", "experience": "12 years", "hospital": "University Medical Center", "rating": 4.7},
+        {"name": "Dr. Emily Rodriguez", "specialty": "Urological Surgery", "experience": "18 years", "hospital": "Regional Healthcare", "rating": 4.9},
+        {"name": "Dr. James Wilson", "specialty": "Nephrology", "experience": "14 years", "hospital": "Metropolitan Hospital", "rating": 4.6},
+        {"name": "Dr. Lisa Patel", "specialty": "Dietetics & Nutrition", "experience": "10 years", "hospital": "Wellness Center", "rating": 4.7}
+    ]
+
+
+@st.cache_resource
+def load_doctor_directory():
+    """Return the indexed DoctorDirectory, from DOCTORS_PATH if set."""
+    from doctor_directory import DoctorDirectory
+
+    if DOCTORS_PATH:
+        return DoctorDirectory.from_csv(DOCTORS_PATH)
+    return DoctorDirectory(load_doctors())
+
+
+@st.cache_resource
+def load_diet_recommendations():
+    # Food recommendations based on stone type
+    return {
+        "calcium_oxalate": {
+            "avoid": ["Spinach", "Rhubarb", "Nuts", "Wheat bran", "Beets", "Tea", "Chocolate"],
+            "consume": ["Calcium-rich foods with meals", "Citrus fruits", "Magnesium-rich foods", "Moderate protein"]
+        },
+        "uric_acid": {
+            "avoid": ["Organ meats", "Anchovies", "Sardines", "High-purine foods", "Alcohol"],
+            "consume": ["Low-purine diet", "Plenty of fluids", "Fruits and vegetables", "Low-fat dairy"]
+        },
+        "struvite": {
+            "avoid": ["Foods that promote UTIs", "High-phosphorus foods"],
+            "consume": ["Cranberry juice", "Probiotics", "Antibiotics as prescribed"]
+        },
+        "cystine": {
+            "avoid": ["High-methionine foods", "Excessive protein"],
+            "consume": ["High fluid intake", "Alkalinizing foods", "Specific medications"]
+        }
+    }
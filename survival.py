@@ -0,0 +1,128 @@
+"""Time-to-recurrence curves.
+
+Each patient's time to the next stone is modelled with a Weibull
+distribution. Its scale is anchored so that the chance of a recurrence
+within RISK_HORIZON_YEARS of the last operation equals the patient's
+recurrence_risk, and more previous operations lower the shape, front-loading
+the hazard. Curves are conditional on the time already spent stone-free
+since the last operation and give the cumulative chance of a recurrence for
+each month from today.
+
+Curves for many patients are evaluated at once, and memoized per quantized
+(risk %, months since operation, previous operations) key, so pages that
+show the same patient's curve on every rerun never recompute it.
+"""
+import math
+from datetime import date, timedelta
+
+import numpy as np
+
+from cache import LRUCache
+
+# Months from today each curve is evaluated at
+CURVE_MONTHS = np.arange(0, 61)
+DAYS_PER_MONTH = 365.25 / 12
+
+# recurrence_risk is the chance of a recurrence within this many years of an operation
+RISK_HORIZON_YEARS = 5
+
+# Weibull shape: BASE_SHAPE / (1 + SHAPE_PER_OPERATION * previous operations)
+BASE_SHAPE = 1.2
+SHAPE_PER_OPERATION = 0.1
+MAX_OPERATIONS = 5
+
+# Quantization bounds for the cache key
+MIN_RISK, MAX_RISK = 1, 99
+MAX_MONTHS_SINCE = 600
+
+# Suggest follow-up imaging once the chance of recurrence reaches this
+FOLLOW_UP_THRESHOLD = 0.2
+MIN_FOLLOW_UP_MONTHS = 3
+MAX_FOLLOW_UP_MONTHS = 24
+
+CACHE_SIZE = 4096
+
+_curve_cache = LRUCache(CACHE_SIZE, name="survival_curves")
+
+
+def recurrence_curves(risk, months_since, operations, months=CURVE_MONTHS):
+    """Return the cumulative chance of recurrence, shape (patients, len(months)).
+
+    `risk` (percent), `months_since` (the last operation) and `operations`
+    are equal-length arrays, one entry per patient.
+    """
+    p = np.clip(np.asarray(risk, dtype=np.float64) / 100, MIN_RISK / 100, MAX_RISK / 100)[:, None]
+    shape = BASE_SHAPE / (1 + SHAPE_PER_OPERATION * np.asarray(operations, dtype=np.float64))[:, None]
+    # Scale (in years) such that 1 - S(RISK_HORIZON_YEARS) = p
+    scale = RISK_HORIZON_YEARS / (-np.log1p(-p)) ** (1 / shape)
+    t0 = np.asarray(months_since, dtype=np.float64)[:, None] / 12
+    t = t0 + np.asarray(months, dtype=np.float64)[None, :] / 12
+    # 1 - S(t) / S(t0) with the Weibull cumulative hazard (t / scale) ** shape
+    return np.maximum(0.0, -np.expm1((t0 / scale) ** shape - (t / scale) ** shape))
+
+
+def curve_key(recurrence_risk, last_operation=None, previous_operations=None, today=None):
+    """Return the quantized cache key for one patient's curve."""
+    risk = min(MAX_RISK, max(MIN_RISK, int(round(recurrence_risk))))
+    months_since = 0
+    if last_operation is not None:
+        if hasattr(last_operation, "date"):
+            last_operation = last_operation.date()
+        elapsed = ((today or date.today()) - last_operation).days
+        months_since = min(MAX_MONTHS_SINCE, max(0, int(round(elapsed / DAYS_PER_MONTH))))
+    operations = previous_operations if previous_operations is not None else 0
+    operations = min(MAX_OPERATIONS, max(0, int(operations)))
+    return risk, months_since, operations
+
+
+def curves(keys):
+    """Return the curve for each key, computing all uncached ones in one batch."""
+    result = [None] * len(keys)
+    missing = {}
+    for i, key in enumerate(keys):
+        curve = _curve_cache.get(key)
+        if curve is None:
+            missing.setdefault(key, []).append(i)
+        else:
+            result[i] = curve
+    if missing:
+        risk, months_since, operations = np.array(list(missing), dtype=np.float64).T
+        for row, (key, positions) in zip(recurrence_curves(risk, months_since, operations), missing.items()):
+            curve = row.copy()
+            # Shared between sessions, so never modified in place
+            curve.setflags(write=False)
+            _curve_cache.put(key, curve)
+            for i in positions:
+                result[i] = curve
+    return result
+
+
+def patient_curve_key(patient_data, today=None):
+    """Return one session's curve key, or None before the recurrence risk is known."""
+    risk = patient_data.get('recurrence_risk')
+    if risk is None:
+        return None
+    return curve_key(risk, patient_data.get('last_operation'), patient_data.get('previous_operations'), today)
+
+
+def patient_curve(patient_data, today=None):
+    """Return one session's curve, or None before the recurrence risk is known."""
+    key = patient_curve_key(patient_data, today)
+    return None if key is None else curves([key])[0]
+
+
+def chance_within(curve, months):
+    """Chance of a recurrence within `months` months from today."""
+    return float(curve[min(months, len(curve) - 1)])
+
+
+def follow_up_months(curve):
+    """Months until the chance of recurrence reaches FOLLOW_UP_THRESHOLD, within bounds."""
+    reached = np.flatnonzero(curve >= FOLLOW_UP_THRESHOLD)
+    months = int(CURVE_MONTHS[reached[0]]) if len(reached) else MAX_FOLLOW_UP_MONTHS
+    return min(MAX_FOLLOW_UP_MONTHS, max(MIN_FOLLOW_UP_MONTHS, months))
+
+
+def curve_dates(start, months=CURVE_MONTHS):
+    """Calendar dates for each curve point, starting at `start`."""
+    return [start + timedelta(days=math.floor(month * DAYS_PER_MONTH)) for month in months]
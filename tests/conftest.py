@@ -0,0 +1,6 @@
+"""Keep the stores the tests touch out of the real data directory."""
+import os
+import tempfile
+
+# config reads this at import time, so it must be set before any app module is imported
+os.environ["NEPHROCARE_DATA_DIR"] = tempfile.mkdtemp(prefix="nephrocare-tests-")
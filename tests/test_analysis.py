@@ -0,0 +1,36 @@
+"""The Analyze Reports job without a trained model."""
+import numpy as np
+
+import risk_model
+from analysis import run_analysis
+from ct_volume import SLICE_THICKNESS_MM
+from ingest import ingest
+
+
+def test_stone_type_is_unknown_without_a_model(monkeypatch):
+    monkeypatch.setattr(risk_model, "_model", None)
+    monkeypatch.setattr(risk_model, "_model_loaded", True)
+    patient = {"age": 45, "previous_operations": 1, "water_intake": 6, "stone_type": "Uric Acid"}
+    results = run_analysis(patient, {}, progress=lambda *args: None)
+    assert results["stone_type"] is None
+    assert 0 <= results["recurrence_risk"] <= 100
+
+
+def test_assumed_slice_thickness_reaches_the_results(monkeypatch, tmp_path):
+    monkeypatch.setattr(risk_model, "_model", None)
+    monkeypatch.setattr(risk_model, "_model_loaded", True)
+    volume = np.zeros((20, 64, 64), dtype=np.uint8)
+    volume[8:12, 30:36, 30:36] = 255
+    np.save(tmp_path / "study.npy", volume)
+    with open(tmp_path / "study.npy", "rb") as f:
+        handle = ingest(f, "study.npy")
+
+    results = run_analysis({}, {"ct": handle}, progress=lambda *args: None)
+    assert results["slice_thickness_assumed"] and results["slice_thickness_mm"] == SLICE_THICKNESS_MM
+
+    # A thickness from the upload form is used instead, and not answered from the cache of the first run
+    results = run_analysis({}, {"ct": handle}, progress=lambda *args: None, slice_thickness_mm=2.5)
+    assert not results["slice_thickness_assumed"] and results["slice_thickness_mm"] == 2.5
+
+    results = run_analysis({}, {}, progress=lambda *args: None)
+    assert not results["slice_thickness_assumed"] and results["slice_thickness_mm"] is None
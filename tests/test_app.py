@@ -0,0 +1,16 @@
+"""app.py as seen by spawned worker processes."""
+import runpy
+from pathlib import Path
+
+import streamlit as st
+
+APP = Path(__file__).resolve().parent.parent / "app.py"
+
+
+def test_spawned_workers_do_not_render_the_app(monkeypatch):
+    # A spawn worker re-runs the parent's main script as __mp_main__ (multiprocessing.spawn)
+    calls = []
+    monkeypatch.setattr(st, "set_page_config", lambda *args, **kwargs: calls.append(kwargs))
+    namespace = runpy.run_path(str(APP), run_name="__mp_main__")
+    assert callable(namespace["main"])
+    assert calls == []
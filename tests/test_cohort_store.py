@@ -0,0 +1,78 @@
+"""Clinician cohort store."""
+import random
+
+import numpy as np
+
+from analysis import STONE_TYPES
+from cohort_store import RISK_BUCKETS, UNSCORED, CohortStore, risk_bucket
+
+
+def test_sees_rows_written_by_another_store(tmp_path):
+    # The app's store and a `main.py score --cohort-id` run each have their own connection
+    path = str(tmp_path / "cohort.db")
+    app, batch = CohortStore(path), CohortStore(path)
+    app.upsert("p1", name="Ada", recurrence_risk=20)
+    revision = app.revision()
+
+    batch.upsert_many([("p1", {"recurrence_risk": 75, "stone_type": "Uric Acid"}),
+                       ("p2", {"name": "Bo", "recurrence_risk": 5})])
+    assert app.revision() != revision
+    total, rows = app.query(sort="patient_id", descending=False)
+    assert total == 2
+    assert rows[0] == {"patient_id": "p1", "name": "Ada", "recurrence_risk": 75, "stone_type": "Uric Acid",
+                       "largest_stone": None, "surgery_needed": False, "last_log": None}
+    assert app.stats() == {"patients": 2, "scored": 2, "surgery_needed": 0}
+
+    # A write from the app keeps the fields the other store set
+    app.upsert("p2", surgery_needed=True)
+    assert batch.query(sort="patient_id", descending=False)[1][1]["recurrence_risk"] == 5
+    assert batch.stats()["surgery_needed"] == 1
+    assert_counts_match(app)
+    assert_counts_match(batch)
+
+
+def brute_force_histogram(store, surgery=None):
+    # Recount every row the store returns, independently of its maintained counts
+    counts = np.zeros((len(STONE_TYPES) + 1, RISK_BUCKETS + 1), dtype=np.int64)
+    _, rows = store.query(limit=len(store))
+    for row in rows:
+        if surgery is not None and row["surgery_needed"] != surgery:
+            continue
+        stone = 0 if row["stone_type"] is None else STONE_TYPES.index(row["stone_type"]) + 1
+        counts[stone, risk_bucket(row["recurrence_risk"])] += 1
+    return counts
+
+
+def assert_counts_match(store):
+    for surgery in (None, False, True):
+        np.testing.assert_array_equal(store.histogram(surgery=surgery), brute_force_histogram(store, surgery))
+    for stone_types in (["Uric Acid"], ["Calcium Oxalate", "Cystine"]):
+        expected = brute_force_histogram(store)
+        keep = [STONE_TYPES.index(stone_type) + 1 for stone_type in stone_types]
+        expected[[i for i in range(len(expected)) if i not in keep]] = 0
+        np.testing.assert_array_equal(store.histogram(stone_types=stone_types), expected)
+    expected = brute_force_histogram(store)
+    expected[:, :5] = 0
+    expected[:, UNSCORED] = 0
+    np.testing.assert_array_equal(store.histogram(min_risk=50), expected)
+
+
+def test_maintained_counts_match_a_full_recount(tmp_path):
+    path = str(tmp_path / "cohort.db")
+    store = CohortStore(path)
+    rng = random.Random(0)
+    store.upsert_many((f"p{i}", {"recurrence_risk": rng.choice([None, rng.randint(0, 100)]),
+                                 "stone_type": rng.choice([None, *STONE_TYPES]),
+                                 "surgery_needed": rng.random() < 0.3}) for i in range(300))
+    assert_counts_match(store)
+
+    # Re-scores move patients between buckets, stone types and surgery
+    for _ in range(200):
+        store.upsert(f"p{rng.randrange(400)}", recurrence_risk=rng.choice([None, rng.randint(0, 100)]),
+                     stone_type=rng.choice([None, *STONE_TYPES]), surgery_needed=rng.random() < 0.5)
+    store.upsert("p0", name="Ada")
+    assert_counts_match(store)
+
+    reloaded = CohortStore(path)
+    assert_counts_match(reloaded)
+    np.testing.assert_array_equal(reloaded.histogram(), store.histogram())
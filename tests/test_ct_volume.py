@@ -0,0 +1,43 @@
+"""3D stone segmentation of CT volumes."""
+import numpy as np
+import pytest
+
+import ct_volume
+from ct_volume import Volume, label_components
+
+SPACING = np.array([1.5, 0.5, 0.5])
+
+
+def write_volume(path, volume):
+    volume.astype(np.uint8).tofile(path)
+    return Volume(str(path), 0, volume.shape)
+
+
+def components(volume, slab_slices, monkeypatch):
+    # Sorted so the same components compare equal whatever order they were closed in
+    height, width = volume.shape[1:]
+    monkeypatch.setattr(ct_volume, "SLAB_VOXELS", slab_slices * height * width)
+    found = [tuple(np.round(moments, 6)) for moments in label_components(volume, 100, SPACING)]
+    return sorted(found)
+
+
+def test_components_spanning_slab_boundaries(tmp_path, monkeypatch):
+    volume = np.zeros((12, 32, 32), dtype=np.uint8)
+    # A stone across slices 2-7, so it spans the boundaries at 3 and 6 with three-slice slabs
+    volume[2:8, 4:9, 4:9] = 200
+    # Two arms that stay apart for two slabs and are joined by a bar in the third
+    volume[1:8, 14:18, 14:18] = 200
+    volume[1:8, 24:28, 14:18] = 200
+    volume[7, 14:28, 14:18] = 200
+    # Shifted sideways where it crosses the boundary at 9
+    volume[6:9, 22:28, 22:28] = 200
+    volume[9:11, 25:31, 25:31] = 200
+    # Closed inside the last slab
+    volume[10:12, 4:8, 20:24] = 200
+    path = write_volume(tmp_path / "volume.u8", volume)
+
+    # One slab: scikit-image labels the whole volume and no union-find is needed
+    whole = components(path, len(volume), monkeypatch)
+    assert len(whole) == 4
+    for slab_slices in (1, 2, 3, 5):
+        assert components(path, slab_slices, monkeypatch) == pytest.approx(whole)
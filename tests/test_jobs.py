@@ -0,0 +1,28 @@
+"""Background job table."""
+import threading
+
+from jobs import DONE, Job, JobManager
+
+
+def test_finished_jobs_expire_on_lookup():
+    manager = JobManager(ttl=60)
+    job = manager.submit("session", "analysis", lambda progress: 42)
+    manager._executor.shutdown(wait=True)
+    assert manager.get("session", "analysis") is job and job.status == DONE and job.result == 42
+
+    job.finished_at -= 61
+    assert manager.get("session", "analysis") is None
+    assert len(manager) == 0
+
+
+def test_submit_while_another_job_is_finishing():
+    # The window in which a job is already marked finished but has no finish time yet
+    manager = JobManager(ttl=60)
+    finishing = Job("other", "analysis")
+    finishing.status = DONE
+    manager._jobs[("other", "analysis")] = finishing
+
+    done = threading.Event()
+    manager.submit("session", "analysis", lambda progress: done.set())
+    assert done.wait(5)
+    assert manager.get("other", "analysis") is finishing
@@ -0,0 +1,40 @@
+"""Lab report extraction from PDFs written by a third-party producer (matplotlib)."""
+import io
+
+import matplotlib
+import pytest
+
+matplotlib.use("Agg")
+import matplotlib.pyplot as plt  # noqa: E402
+
+import lab_reports  # noqa: E402
+from ingest import ingest  # noqa: E402
+
+LINES = ["Calcium, 24h urine 312 mg/24h", "Oxalate (urine) 52 mg/day", "Citrate, urine 280 mg/day",
+         "Urine pH 5.2", "Serum calcium 9.8 mg/dL"]
+EXPECTED = {"urine_calcium": 312.0, "urine_oxalate": 52.0, "urine_citrate": 280.0, "urine_ph": 5.2,
+            "serum_calcium": 9.8}
+
+
+def matplotlib_pdf(fonttype):
+    """A one-page report; matplotlib writes content stream lengths as indirect objects."""
+    with plt.rc_context({"pdf.fonttype": fonttype}):
+        fig = plt.figure(figsize=(8.5, 11))
+        for i, line in enumerate(LINES):
+            fig.text(0.1, 0.9 - i * 0.05, line)
+        out = io.BytesIO()
+        fig.savefig(out, format="pdf")
+        plt.close(fig)
+    return out.getvalue()
+
+
+@pytest.mark.parametrize("fonttype", [3, 42])
+def test_pypdf_reads_matplotlib_pdf(fonttype):
+    handle = ingest(io.BytesIO(matplotlib_pdf(fonttype)), f"report{fonttype}.pdf")
+    assert lab_reports.extract_lab_results(handle, parallel=False) == EXPECTED
+
+
+def test_unreadable_pdf_is_rejected():
+    handle = ingest(io.BytesIO(b"%PDF-1.4\nnot really a pdf\n"), "broken.pdf")
+    with pytest.raises(ValueError, match="Unreadable lab report"):
+        lab_reports.extract_lab_results(handle, parallel=False)
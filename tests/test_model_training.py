@@ -0,0 +1,23 @@
+"""Risk model training on small cohorts."""
+import numpy as np
+import pytest
+
+from model_training import synthetic_cohort, train_model
+
+
+def chunks_of(frame, size=250):
+    return lambda: iter([frame.iloc[start:start + size] for start in range(0, len(frame), size)])
+
+
+def test_small_cohort_beats_the_base_rate():
+    model = train_model(chunks_of(synthetic_cohort(1000, seed=1)))
+    holdout = model.metadata["holdout"]
+    assert holdout["recurrence_log_loss"] < holdout["prior_log_loss"]
+
+    risk, _ = model.predict_columns(synthetic_cohort(500, seed=2))
+    assert np.mean((risk == 0) | (risk == 100)) < 0.05
+
+
+def test_model_worse_than_the_base_rate_is_rejected():
+    with pytest.raises(ValueError, match="worse than the base rate"), np.errstate(over="ignore"):
+        train_model(chunks_of(synthetic_cohort(1000, seed=1)), eta0=1000)
@@ -0,0 +1,48 @@
+"""Vectorized recurrence scoring against the per-patient score."""
+import random
+
+import numpy as np
+import pandas as pd
+
+from main import ChunkWriter, iter_chunks
+from risk import RISK_COLUMNS, score_frame, score_patient
+from risk_model import CATEGORICAL_FEATURES
+
+
+def random_patients(count, seed=0):
+    rng = random.Random(seed)
+    return pd.DataFrame({
+        # Both sides of each threshold, plus missing values
+        "previous_operations": [rng.choice([None, 0, 1, 2, 5]) for _ in range(count)],
+        "family_history": [rng.choice([None, *CATEGORICAL_FEATURES["family_history"]]) for _ in range(count)],
+        "water_intake": [rng.choice([None, 0, 5, 5.5, 6, 12]) for _ in range(count)],
+        "diet": [rng.choice([None, "", *CATEGORICAL_FEATURES["diet"]]) for _ in range(count)],
+        "name": [f"patient {i}" for i in range(count)],
+    })
+
+
+def assert_matches_score_patient(frame):
+    scores = score_frame(frame)
+    assert len(scores) == len(frame)
+    for row, score in zip(frame.to_dict("records"), scores):
+        assert score == score_patient(row), row
+
+
+def test_score_frame_matches_score_patient():
+    assert_matches_score_patient(random_patients(500))
+
+
+def test_score_frame_matches_score_patient_after_a_file_round_trip(tmp_path):
+    # The batch CLI scores what it reads back, where missing cells are NaN rather than None
+    frame = random_patients(300, seed=1)
+    for name in ("patients.csv", "patients.parquet"):
+        writer = ChunkWriter(str(tmp_path / name))
+        for start in range(0, len(frame), 100):
+            writer.write(frame.iloc[start:start + 100])
+        writer.close()
+        chunks = list(iter_chunks(str(tmp_path / name), 128))
+        assert sum(len(chunk) for chunk in chunks) == len(frame)
+        for chunk in chunks:
+            assert_matches_score_patient(chunk)
+        read_back = pd.concat(chunks, ignore_index=True)
+        np.testing.assert_array_equal(score_frame(read_back), score_frame(frame[RISK_COLUMNS]))
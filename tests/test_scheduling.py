@@ -0,0 +1,81 @@
+"""Appointment slot booking."""
+import sqlite3
+import threading
+from datetime import date, datetime, timedelta
+
+import pytest
+
+from scheduling import CONSULTATION, VIRTUAL_VISIT, Scheduler, SlotUnavailable
+
+
+def test_next_appointment_skips_past_ones(tmp_path):
+    scheduler = Scheduler(str(tmp_path / "scheduling.db"))
+    today = date(2030, 5, 10)
+    booked_at = datetime(2030, 5, 1, 8)
+    scheduler.book(1, today, "9:00 AM", "patient", now=booked_at)
+    scheduler.book(2, today + timedelta(days=1), "2:00 PM", "patient", VIRTUAL_VISIT, now=booked_at)
+    scheduler.book(3, today, "11:00 AM", "someone else", now=booked_at)
+
+    assert scheduler.next_appointment("patient", now=datetime(2030, 5, 10, 8)) == (1, today, "9:00 AM", CONSULTATION)
+    # Once the morning appointment has started, the next one is tomorrow's virtual visit
+    assert scheduler.next_appointment("patient", now=datetime(2030, 5, 10, 9)) == (
+        2, today + timedelta(days=1), "2:00 PM", VIRTUAL_VISIT)
+    assert scheduler.next_appointment("patient", now=datetime(2030, 5, 12)) is None
+    assert scheduler.next_appointment("nobody") is None
+
+
+def test_concurrent_bookings_of_one_slot(tmp_path):
+    path = str(tmp_path / "scheduling.db")
+    day = date.today() + timedelta(days=1)
+    threads = 8
+    barrier = threading.Barrier(threads)
+    outcomes = []
+
+    def book(patient):
+        # A Scheduler per thread as well as a connection per thread, like separate app processes
+        scheduler = Scheduler(path)
+        barrier.wait()
+        try:
+            outcomes.append(scheduler.book(7, day, "11:00 AM", patient))
+        except SlotUnavailable:
+            outcomes.append(None)
+
+    workers = [threading.Thread(target=book, args=(f"patient-{i}",)) for i in range(threads)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+
+    assert len(outcomes) == threads
+    assert sum(outcome is not None for outcome in outcomes) == 1
+    rows = sqlite3.connect(path).execute("SELECT COUNT(*) FROM appointment WHERE doctor_id = 7").fetchone()
+    assert rows == (1,)
+
+
+class _FailingCommit:
+    # Passes everything through to the real connection except COMMIT
+    def __init__(self, conn):
+        self.conn = conn
+
+    def execute(self, sql, *args):
+        if sql == "COMMIT":
+            raise sqlite3.OperationalError("disk I/O error")
+        return self.conn.execute(sql, *args)
+
+    def __getattr__(self, name):
+        return getattr(self.conn, name)
+
+
+def test_failed_commit_is_rolled_back(tmp_path):
+    scheduler = Scheduler(str(tmp_path / "scheduling.db"))
+    day = date.today() + timedelta(days=1)
+    conn = scheduler._connection()
+    scheduler._local.conn = _FailingCommit(conn)
+    with pytest.raises(sqlite3.OperationalError):
+        scheduler.book(7, day, "2:00 PM", "patient")
+    assert not conn.in_transaction
+
+    scheduler._local.conn = conn
+    assert scheduler.next_free_slot(7, start=day, days=1, now=datetime.combine(day, datetime.min.time())) == (
+        day, "9:00 AM")
+    assert scheduler.book(7, day, "2:00 PM", "patient")
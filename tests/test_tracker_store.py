@@ -0,0 +1,68 @@
+"""Health Tracker log and its delta-maintained rollups."""
+import random
+from datetime import date, timedelta
+
+import pytest
+
+from tracker_store import PERIODS, ROLLUP_FIELDS, TrackerStore, _contribution, period_start
+
+
+def brute_force_rollups(store):
+    # Recompute every rollup from the raw log
+    expected = {}
+    rows = store._conn.execute(
+        "SELECT patient_id, day, water_intake, pain_level, medication_taken, symptoms, recurrence_risk FROM daily_log")
+    for patient_id, day, *values in rows:
+        for period in PERIODS:
+            key = (patient_id, period, period_start(date.fromisoformat(day), period).isoformat())
+            current = expected.get(key, [0] * len(ROLLUP_FIELDS))
+            expected[key] = [a + b for a, b in zip(current, _contribution(values))]
+    return expected
+
+
+def assert_rollups_match(store):
+    store.flush()
+    stored = {tuple(row[:3]): list(row[3:]) for row in store._conn.execute(
+        f"SELECT patient_id, period, start, {', '.join(ROLLUP_FIELDS)} FROM rollup")}
+    expected = brute_force_rollups(store)
+    for key, sums in stored.items():
+        # Buckets whose entries were all deleted keep a row of zeros
+        assert sums == pytest.approx(expected.get(key, [0] * len(ROLLUP_FIELDS))), key
+    assert set(expected) <= set(stored)
+
+
+def random_entry(rng):
+    return dict(water_intake=rng.randint(1, 15), pain_level=rng.choice([None, rng.randint(0, 10)]),
+                medication_taken=rng.random() < 0.7, symptoms=rng.choice([[], ["Pain"], ["Pain", "Nausea"], "None"]),
+                recurrence_risk=rng.choice([None, round(rng.uniform(5, 95), 1)]))
+
+
+def test_rollups_match_a_recompute(tmp_path):
+    store = TrackerStore(str(tmp_path / "tracker.db"), batch_size=16)
+    rng = random.Random(0)
+    first = date(2030, 1, 1)
+    days = [first + timedelta(days=offset) for offset in range(120)]
+
+    for day in days:
+        for patient_id in ("a", "b"):
+            store.add_entry(patient_id, day, **random_entry(rng))
+    assert_rollups_match(store)
+
+    # Edits: re-saving a day replaces its entry, sometimes twice within one batch
+    for _ in range(80):
+        store.add_entry(rng.choice("ab"), rng.choice(days), **random_entry(rng))
+    assert_rollups_match(store)
+
+    # Deletes, including days never logged and a delete followed by a new entry
+    for day in rng.sample(days, 40):
+        store.delete_entry("a", day)
+    store.delete_entry("a", first - timedelta(days=1))
+    store.delete_entry("b", days[0])
+    store.add_entry("b", days[0], **random_entry(rng))
+    assert_rollups_match(store)
+
+    series = store.series("a", "month", first, days[-1])
+    expected = brute_force_rollups(store)
+    for start, entries in zip(series["start"], series["entries"]):
+        assert entries == expected[("a", "month", start.isoformat())][0]
+    assert store.entry("a", first - timedelta(days=1)) is None
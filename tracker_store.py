@@ -0,0 +1,285 @@
+"""Persistent store for the Health Tracker daily log.
+
+Entries live in an SQLite database in WAL mode, keyed by (patient, day).
+Writes are buffered and flushed in batches; each flush also updates daily,
+weekly and monthly rollups in the same transaction, so dashboard queries read
+a handful of pre-aggregated rows instead of scanning the raw log.
+"""
+import atexit
+import sqlite3
+import threading
+import time
+from datetime import date, timedelta
+
+from config import data_path
+
+DB_FILE = "tracker.db"
+
+# Buffered entries are flushed once this many are pending or this many seconds pass
+BATCH_SIZE = 64
+FLUSH_INTERVAL = 2.0
+
+PERIODS = ["day", "week", "month"]
+
+ENTRY_FIELDS = ["water_intake", "pain_level", "medication_taken", "symptoms", "protein_intake",
+                "sodium_intake", "oxalate_foods", "citrus_intake", "recurrence_risk"]
+
+# Rollup sums and counts; averages are derived at query time
+ROLLUP_FIELDS = ["entries", "water_sum", "pain_sum", "medication_days", "symptom_days",
+                 "risk_sum", "risk_entries"]
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS daily_log (
+    patient_id TEXT NOT NULL,
+    day TEXT NOT NULL,
+    water_intake INTEGER,
+    pain_level INTEGER,
+    medication_taken INTEGER,
+    symptoms TEXT,
+    protein_intake TEXT,
+    sodium_intake TEXT,
+    oxalate_foods TEXT,
+    citrus_intake INTEGER,
+    recurrence_risk REAL,
+    PRIMARY KEY (patient_id, day)
+) WITHOUT ROWID;
+
+CREATE TABLE IF NOT EXISTS rollup (
+    patient_id TEXT NOT NULL,
+    period TEXT NOT NULL,
+    start TEXT NOT NULL,
+    entries INTEGER NOT NULL DEFAULT 0,
+    water_sum REAL NOT NULL DEFAULT 0,
+    pain_sum REAL NOT NULL DEFAULT 0,
+    medication_days INTEGER NOT NULL DEFAULT 0,
+    symptom_days INTEGER NOT NULL DEFAULT 0,
+    risk_sum REAL NOT NULL DEFAULT 0,
+    risk_entries INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (patient_id, period, start)
+) WITHOUT ROWID;
+
+-- Bumped by every flush that writes a patient's entries, whichever process flushes
+CREATE TABLE IF NOT EXISTS revision (
+    patient_id TEXT PRIMARY KEY,
+    value INTEGER NOT NULL
+) WITHOUT ROWID;
+"""
+
+
+def period_start(day, period):
+    """Return the first day of the day/week/month containing `day`."""
+    if period == "day":
+        return day
+    if period == "week":
+        return day - timedelta(days=day.weekday())
+    if period == "month":
+        return day.replace(day=1)
+    raise ValueError(f"Unknown period '{period}'")
+
+
+def _contribution(row):
+    # What one daily_log row adds to each rollup field
+    water, pain, medication, symptoms, risk = row
+    has_symptoms = bool(symptoms) and symptoms != "None"
+    return (1, water or 0, pain or 0, int(bool(medication)), int(has_symptoms),
+            risk or 0, int(risk is not None))
+
+
+class TrackerStore:
+    """SQLite-backed daily log with incrementally maintained rollups."""
+
+    def __init__(self, path=None, batch_size=BATCH_SIZE, flush_interval=FLUSH_INTERVAL):
+        self.path = path or data_path(DB_FILE)
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._conn = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(SCHEMA)
+        self._db_lock = threading.Lock()
+        self._pending = {}
+        self._pending_lock = threading.Lock()
+        self._oldest_pending = None
+
+    def add_entry(self, patient_id, day, **fields):
+        """Queue one day's entry; a later entry for the same day replaces it."""
+        unknown = set(fields) - set(ENTRY_FIELDS)
+        if unknown:
+            raise ValueError(f"Unknown field(s): {', '.join(sorted(unknown))}")
+        values = [fields.get(name) for name in ENTRY_FIELDS]
+        for i, name in enumerate(ENTRY_FIELDS):
+            if isinstance(values[i], (list, tuple)):
+                values[i] = ", ".join(values[i])
+            elif isinstance(values[i], bool):
+                values[i] = int(values[i])
+        with self._pending_lock:
+            self._pending[(patient_id, day.isoformat())] = values
+            if self._oldest_pending is None:
+                self._oldest_pending = time.monotonic()
+            due = (len(self._pending) >= self.batch_size
+                   or time.monotonic() - self._oldest_pending >= self.flush_interval)
+        if due:
+            self.flush()
+
+    def delete_entry(self, patient_id, day):
+        """Queue removal of one day's entry (and its share of the rollups)."""
+        with self._pending_lock:
+            self._pending[(patient_id, day.isoformat())] = None
+            if self._oldest_pending is None:
+                self._oldest_pending = time.monotonic()
+        self.flush()
+
+    def flush(self):
+        """Write all queued entries and update the rollups in one transaction."""
+        # Take the batch under the database lock, so concurrent flushes commit
+        # batches in the order they were queued and a newer entry for a day is
+        # never overwritten by an older one
+        with self._db_lock:
+            with self._pending_lock:
+                batch, self._pending = self._pending, {}
+                self._oldest_pending = None
+            if not batch:
+                return 0
+
+            cursor = self._conn.cursor()
+            try:
+                cursor.execute("BEGIN IMMEDIATE")
+                deltas = {}
+                for (patient_id, day_iso), values in batch.items():
+                    old = cursor.execute(
+                        "SELECT water_intake, pain_level, medication_taken, symptoms, recurrence_risk "
+                        "FROM daily_log WHERE patient_id = ? AND day = ?", (patient_id, day_iso)
+                    ).fetchone()
+                    if values is None:
+                        # A deletion takes the old entry's contribution back out
+                        if old is None:
+                            continue
+                        new = [-b for b in _contribution(old)]
+                    else:
+                        new = _contribution((values[0], values[1], values[2], values[3], values[8]))
+                        if old is not None:
+                            new = [a - b for a, b in zip(new, _contribution(old))]
+                    day = date.fromisoformat(day_iso)
+                    for period in PERIODS:
+                        key = (patient_id, period, period_start(day, period).isoformat())
+                        current = deltas.get(key)
+                        deltas[key] = new if current is None else [a + b for a, b in zip(current, new)]
+
+                cursor.executemany(
+                    f"INSERT OR REPLACE INTO daily_log (patient_id, day, {', '.join(ENTRY_FIELDS)}) "
+                    f"VALUES ({', '.join('?' * (len(ENTRY_FIELDS) + 2))})",
+                    [(patient_id, day_iso, *values) for (patient_id, day_iso), values in batch.items()
+                     if values is not None]
+                )
+                cursor.executemany(
+                    "DELETE FROM daily_log WHERE patient_id = ? AND day = ?",
+                    [key for key, values in batch.items() if values is None]
+                )
+                updates = ", ".join(f"{name} = {name} + excluded.{name}" for name in ROLLUP_FIELDS)
+                cursor.executemany(
+                    f"INSERT INTO rollup (patient_id, period, start, {', '.join(ROLLUP_FIELDS)}) "
+                    f"VALUES ({', '.join('?' * (len(ROLLUP_FIELDS) + 3))}) "
+                    f"ON CONFLICT (patient_id, period, start) DO UPDATE SET {updates}",
+                    [(*key, *delta) for key, delta in deltas.items()]
+                )
+                cursor.executemany(
+                    "INSERT INTO revision (patient_id, value) VALUES (?, 1) "
+                    "ON CONFLICT (patient_id) DO UPDATE SET value = value + 1",
+                    [(patient_id,) for patient_id in {patient_id for patient_id, _ in batch}]
+                )
+                cursor.execute("COMMIT")
+            except BaseException:
+                if self._conn.in_transaction:
+                    cursor.execute("ROLLBACK")
+                self._requeue(batch)
+                raise
+        return len(batch)
+
+    def _requeue(self, batch):
+        # Put a failed batch back, without overwriting entries queued since
+        with self._pending_lock:
+            for key, values in batch.items():
+                self._pending.setdefault(key, values)
+            if self._oldest_pending is None:
+                self._oldest_pending = time.monotonic()
+
+    def revision(self, patient_id):
+        """Return a counter that changes whenever an entry is added for the patient.
+
+        Lets callers cache anything derived from a patient's log until new
+        entries arrive. Queued entries are flushed first, and the counter is
+        kept in the database, so entries written by other processes count too.
+        """
+        self.flush()
+        with self._db_lock:
+            row = self._conn.execute("SELECT value FROM revision WHERE patient_id = ?", (patient_id,)).fetchone()
+        return row[0] if row else 0
+
+    def series(self, patient_id, period, start, end):
+        """Return pre-aggregated rows for `period` buckets between two dates.
+
+        The result is a dict of equal-length lists: start (date), entries,
+        and the per-bucket averages water, pain and risk (None where no
+        entry had a value) plus medication_rate.
+        """
+        if period not in PERIODS:
+            raise ValueError(f"Unknown period '{period}'")
+        self.flush()
+        with self._db_lock:
+            rows = self._conn.execute(
+                "SELECT start, entries, water_sum, pain_sum, medication_days, risk_sum, risk_entries "
+                "FROM rollup WHERE patient_id = ? AND period = ? AND start BETWEEN ? AND ? AND entries > 0 "
+                "ORDER BY start",
+                (patient_id, period, period_start(start, period).isoformat(), end.isoformat())
+            ).fetchall()
+
+        result = {"start": [], "entries": [], "water": [], "pain": [], "medication_rate": [], "risk": []}
+        for bucket, entries, water_sum, pain_sum, medication_days, risk_sum, risk_entries in rows:
+            result["start"].append(date.fromisoformat(bucket))
+            result["entries"].append(entries)
+            result["water"].append(water_sum / entries)
+            result["pain"].append(pain_sum / entries)
+            result["medication_rate"].append(medication_days / entries)
+            result["risk"].append(risk_sum / risk_entries if risk_entries else None)
+        return result
+
+    def entry(self, patient_id, day):
+        """Return the saved entry for one day as a dict, or None."""
+        self.flush()
+        with self._db_lock:
+            row = self._conn.execute(
+                f"SELECT {', '.join(ENTRY_FIELDS)} FROM daily_log WHERE patient_id = ? AND day = ?",
+                (patient_id, day.isoformat())
+            ).fetchone()
+        return None if row is None else dict(zip(ENTRY_FIELDS, row))
+
+    def close(self):
+        self.flush()
+        with self._db_lock:
+            self._conn.close()
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def _flush_periodically(store):
+    while True:
+        time.sleep(store.flush_interval)
+        try:
+            store.flush()
+        except sqlite3.Error:
+            # Keep the flusher alive; the entries are retried on the next write or read
+            pass
+
+
+def get_store():
+    """Return the process-wide TrackerStore, starting its background flusher."""
+    global _store
+    with _store_lock:
+        if _store is None:
+            _store = TrackerStore()
+            threading.Thread(target=_flush_periodically, args=(_store,), daemon=True,
+                             name="nephrocare-tracker-flush").start()
+            atexit.register(_store.flush)
+        return _store
@@ -0,0 +1,35 @@
+"""One module per app page, imported only when the page is shown.
+
+Each module exposes a render() function. Keeping heavy imports (pandas,
+plotly, the imaging stack) inside the page modules means a rerun only pays
+for the page that is actually on screen.
+"""
+import importlib
+
+from config import CLINICIAN_MODE
+from metrics import span
+
+# Sidebar title -> module in this package
+PAGES = {
+    "Patient Input": "patient_input",
+    "Report Analysis": "report_analysis",
+    "Results & Recommendations": "results",
+    "Doctor Connect": "doctor_connect",
+    "Health Tracker": "health_tracker",
+}
+
+# Pages that show other patients' data, only in NEPHROCARE_CLINICIAN_MODE
+CLINICIAN_PAGES = {
+    "Clinician Cohort": "cohort",
+}
+if CLINICIAN_MODE:
+    PAGES.update(CLINICIAN_PAGES)
+
+
+def render_page(title):
+    """Import (on first use) and render the page shown as `title` in the sidebar."""
+    name = PAGES[title]
+    with span(f"import.{name}"):
+        module = importlib.import_module(f"{__name__}.{name}")
+    with span(f"page.{name}"):
+        module.render()
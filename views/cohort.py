@@ -0,0 +1,107 @@
+"""Clinician Cohort page: every patient's latest results, filtered, sorted and paged."""
+import pandas as pd
+import plotly.graph_objects as go
+import streamlit as st
+
+from analysis import STONE_TYPES
+from charts import cached_figure
+from cohort_store import BUCKET_WIDTH, PAGE_SIZE, bucket_labels, get_cohort_store
+from config import CLINICIAN_MODE
+from metrics import span
+
+SURGERY_FILTERS = {"Any": None, "Surgery recommended": True, "No surgery": False}
+
+# Sort option -> cohort column
+SORT_OPTIONS = {
+    "Recurrence risk": "recurrence_risk",
+    "Largest stone": "largest_stone",
+    "Last log": "last_log",
+    "Stone type": "stone_type",
+    "Surgery needed": "surgery_needed",
+    "Patient": "name",
+}
+
+TABLE_COLUMNS = {
+    "name": "Patient",
+    "recurrence_risk": "Recurrence risk (%)",
+    "stone_type": "Stone type",
+    "largest_stone": "Largest stone (mm)",
+    "surgery_needed": "Surgery needed",
+    "last_log": "Last log",
+}
+
+
+def _histogram_figure(counts, include_unscored):
+    labels = bucket_labels() + (["Not scored"] if include_unscored else [])
+    columns = len(labels)
+    fig = go.Figure()
+    for i, stone_type in enumerate(["Unknown", *STONE_TYPES]):
+        if counts[i, :columns].any():
+            fig.add_trace(go.Bar(x=labels, y=counts[i, :columns], name=stone_type))
+    fig.update_layout(
+        barmode="stack",
+        title="Patients by Recurrence Risk",
+        xaxis_title="Recurrence risk (%)",
+        yaxis_title="Patients",
+    )
+    return fig
+
+
+def render():
+    if not CLINICIAN_MODE:
+        st.error("The clinician cohort is only available when NEPHROCARE_CLINICIAN_MODE is set.")
+        return
+    store = get_cohort_store()
+    st.markdown('<h2 class="sub-header">Clinician Cohort</h2>', unsafe_allow_html=True)
+
+    stats = store.stats()
+    if stats['patients'] == 0:
+        st.info("No patients yet. Patients appear here once their reports are analyzed, "
+                "or load a scored cohort with `python main.py score ... --cohort-id <column>`.")
+        return
+    col1, col2, col3 = st.columns(3)
+    col1.metric("Patients", f"{stats['patients']:,}")
+    col2.metric("Scored", f"{stats['scored']:,}")
+    col3.metric("Surgery Recommended", f"{stats['surgery_needed']:,}")
+
+    labels = bucket_labels()
+    filter_col1, filter_col2 = st.columns(2)
+    with filter_col1:
+        low, high = st.select_slider("Recurrence risk (%)", options=labels, value=(labels[0], labels[-1]),
+                                     key='cohort_risk')
+        stone_types = st.multiselect("Stone type", STONE_TYPES, key='cohort_stone_types')
+    with filter_col2:
+        surgery = SURGERY_FILTERS[st.selectbox("Treatment", list(SURGERY_FILTERS), key='cohort_surgery')]
+        prefix = st.text_input("Patient name starts with", key='cohort_prefix').strip()
+
+    # The slider moves in whole buckets, so the histogram can use the maintained counts
+    min_risk = labels.index(low) * BUCKET_WIDTH
+    max_risk = 100 if high == labels[-1] else labels.index(high) * BUCKET_WIDTH + BUCKET_WIDTH - 1
+    filters = dict(min_risk=min_risk, max_risk=max_risk, stone_types=stone_types, surgery=surgery, prefix=prefix)
+
+    with span("cohort.histogram"):
+        include_unscored = min_risk == 0 and max_risk == 100
+        fig = cached_figure(("cohort", min_risk, max_risk, tuple(stone_types), surgery, prefix), store.revision(),
+                            lambda: _histogram_figure(store.histogram(**filters), include_unscored))
+        st.plotly_chart(fig, use_container_width=True)
+
+    sort_col1, sort_col2 = st.columns([3, 1])
+    with sort_col1:
+        sort = SORT_OPTIONS[st.selectbox("Sort by", list(SORT_OPTIONS), key='cohort_sort')]
+    with sort_col2:
+        descending = st.toggle("Descending", value=sort != "name", key=f'cohort_descending_{sort}')
+
+    with span("cohort.query"):
+        total, _ = store.query(**filters, limit=0)
+        if total == 0:
+            st.info("No patients match these filters.")
+            return
+        pages = -(-total // PAGE_SIZE)
+        page = st.number_input(f"Page (of {pages:,})", min_value=1, max_value=pages, value=1, key='cohort_page')
+        page = min(page, pages) - 1
+        # Only this page of rows is sent to the browser
+        _, rows = store.query(**filters, sort=sort, descending=descending, offset=page * PAGE_SIZE)
+
+    st.caption(f"Showing {page * PAGE_SIZE + 1:,}-{page * PAGE_SIZE + len(rows):,} of {total:,} patients")
+    table = pd.DataFrame(rows, columns=list(TABLE_COLUMNS)).rename(columns=TABLE_COLUMNS)
+    st.dataframe(table, hide_index=True, use_container_width=True)
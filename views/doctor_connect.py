@@ -0,0 +1,122 @@
+"""Doctor Connect page: specialists and virtual consultations."""
+from datetime import datetime
+
+import streamlit as st
+
+from doctor_directory import PAGE_SIZE
+from reminders import DOCTOR_VISIT, appointment_reminder, get_reminder_scheduler
+from scheduling import CONSULTATION, SLOT_TIMES, VIRTUAL_VISIT, SlotUnavailable, get_scheduler
+from session import current_patient, patient_key, upload_handles
+from static_data import load_doctor_directory
+
+# Specialists tried, best match first, when scheduling a virtual visit
+VIRTUAL_VISIT_CANDIDATES = 50
+
+
+def _remind(day, slot_time, doctor_name):
+    """Schedule a reminder ahead of a booked appointment."""
+    get_reminder_scheduler().add(patient_key(), DOCTOR_VISIT, *appointment_reminder(day, slot_time, doctor_name))
+
+
+def render():
+    directory = load_doctor_directory()
+    scheduler = get_scheduler()
+    patient_data = current_patient()
+
+    st.markdown('<h2 class="sub-header">Connect with Specialist Doctors</h2>', unsafe_allow_html=True)
+
+    st.info("Based on your condition, we recommend these specialists:")
+
+    with st.expander("Search specialists"):
+        filter_col1, filter_col2 = st.columns(2)
+        with filter_col1:
+            name_prefix = st.text_input("Doctor name", key='doctor_name')
+            specialties = st.multiselect("Specialty", list(directory.specialties), key='doctor_specialties')
+        with filter_col2:
+            hospital_prefix = st.text_input("Hospital", key='doctor_hospital')
+            min_rating = st.slider("Minimum rating", 0.0, 5.0, 0.0, 0.1, key='doctor_min_rating')
+
+    query = dict(name_prefix=name_prefix, specialties=specialties, hospital_prefix=hospital_prefix,
+                 min_rating=min_rating, stone_type=patient_data.get('stone_type'),
+                 surgery_needed=bool(patient_data.get('surgery_needed')))
+    # The page selector needs the total, so fetch the page it currently shows along with it;
+    # only narrower filters that leave that page past the end need a second search
+    requested = max(1, st.session_state.get('doctor_page', 1)) - 1
+    total, doctors = directory.search(**query, page=requested, page_size=PAGE_SIZE)
+    if total == 0:
+        st.warning("No specialists match your search.")
+    else:
+        pages = -(-total // PAGE_SIZE)
+        page = st.number_input(f"Page (of {pages})", min_value=1, max_value=pages, value=1, key='doctor_page')
+        page = min(page, pages) - 1
+        if page != requested:
+            _, doctors = directory.search(**query, page=page, page_size=PAGE_SIZE)
+        st.caption(f"Showing {page * PAGE_SIZE + 1}-{page * PAGE_SIZE + len(doctors)} of {total} specialists")
+
+    # Only the visible page of doctor cards is rendered
+    for doctor in doctors:
+        with st.container():
+            st.markdown(f'<div class="doctor-card">', unsafe_allow_html=True)
+            col1, col2, col3 = st.columns([1, 3, 1])
+
+            with col1:
+                st.image("https://img.icons8.com/color/96/000000/doctor-male.png", width=80)
+
+            with col2:
+                st.subheader(doctor['name'])
+                st.write(f"**Specialty:** {doctor['specialty']}")
+                st.write(f"**Experience:** {doctor['experience']}")
+                st.write(f"**Hospital:** {doctor['hospital']}")
+
+            with col3:
+                st.write(f"**Rating:** {doctor['rating']}/5.0")
+                availability = st.empty()
+                next_slot = scheduler.next_free_slot(doctor['id'])
+                if st.button("Book Consultation", key=f"doc_{doctor['id']}", disabled=next_slot is None):
+                    try:
+                        scheduler.book(doctor['id'], *next_slot, patient_key(), CONSULTATION)
+                    except SlotUnavailable:
+                        st.warning("That slot was just taken. Please try again.")
+                    else:
+                        _remind(*next_slot, doctor['name'])
+                        st.success(f"Consultation booked with {doctor['name']} on {next_slot[0]} at {next_slot[1]}!")
+                    next_slot = scheduler.next_free_slot(doctor['id'])
+                if next_slot is None:
+                    availability.caption("No free slots in the next two months")
+                else:
+                    availability.caption(f"Next available: {next_slot[0]:%b %d} at {next_slot[1]}")
+
+            st.markdown('</div>', unsafe_allow_html=True)
+
+    # Telemedicine option
+    st.markdown("---")
+    st.markdown("### Virtual Consultation")
+
+    col1, col2 = st.columns(2)
+
+    with col1:
+        st.write("Schedule a video consultation with available specialists:")
+        appointment_date = st.date_input("Preferred Date", min_value=datetime.now().date())
+        appointment_time = st.selectbox("Preferred Time", SLOT_TIMES)
+
+        if st.button("Schedule Virtual Visit"):
+            # Offer the slot to the best-ranked specialists first
+            _, specialists = directory.search(stone_type=query['stone_type'], surgery_needed=query['surgery_needed'],
+                                              page_size=VIRTUAL_VISIT_CANDIDATES)
+            try:
+                doctor_id, _ = scheduler.book_any([doctor['id'] for doctor in specialists], appointment_date,
+                                                  appointment_time, patient_key(), VIRTUAL_VISIT)
+            except SlotUnavailable as exc:
+                st.warning(f"{exc}. Please choose another time.")
+            else:
+                doctor_name = directory.doctor(doctor_id)['name']
+                _remind(appointment_date, appointment_time, doctor_name)
+                st.success(f"Virtual consultation scheduled for {appointment_date} at {appointment_time} "
+                           f"with {doctor_name}")
+
+    with col2:
+        st.write("**Upload additional documents for your consultation:**")
+        additional_docs = upload_handles("consultation_docs", st.file_uploader(
+            "Medical records", type=['pdf', 'jpg', 'png'], accept_multiple_files=True))
+        if additional_docs:
+            st.info(f"{len(additional_docs)} files ready for consultation")
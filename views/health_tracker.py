@@ -0,0 +1,216 @@
+"""Health Tracker page: daily log, progress dashboard and reminders."""
+from datetime import date, datetime, timedelta
+
+import plotly.graph_objects as go
+import streamlit as st
+
+from charts import cached_figure, finite_points, series_figure
+from cohort_store import get_cohort_store
+from diet import score_day
+from metrics import span
+from reminders import (IMAGING, LAB_TEST, LAB_TEST_MONTHS, MEDICATION, MEDICATION_HOURS,
+                       MEDICATION_TIMES, REFILL, REFILL_DAYS, follow_up_reminder, get_reminder_scheduler,
+                       lab_test_reminder, medication_reminders, refill_reminder)
+from scheduling import VIRTUAL_VISIT, get_scheduler
+from session import current_patient, patient_key
+from static_data import load_doctor_directory
+from survival import curve_dates, curves, patient_curve_key
+from tracker_store import get_store
+
+# Dashboard view -> (rollup period, days of history shown; None for everything)
+DASHBOARD_VIEWS = {
+    "Daily": ("day", 30),
+    "Weekly": ("week", 7 * 26),
+    "Monthly": ("month", 365 * 2),
+    "All time": ("day", None),
+}
+HISTORY_START = date(1900, 1, 1)
+
+# How far "Snooze" pushes the follow-up imaging reminder
+SNOOZE = timedelta(weeks=1)
+
+# Months of projected recurrence chance overlaid on the risk trend
+PROJECTION_MONTHS = 24
+
+# Dashboard chart -> (series, trace kind, title, y-axis label, reference lines)
+DASHBOARD_CHARTS = {
+    "Hydration": ("water", "line", "Water Intake", "Glasses of Water",
+                  [(8, "green", "Target")]),
+    "Symptoms": ("pain", "bar", "Pain Level", "Pain Level (0-10)",
+                 [(3, "orange", "Concern Level")]),
+    "Risk Trends": ("risk", "line", "Recurrence Risk", "Risk Percentage",
+                    [(30, "green", "Low Risk"), (50, "orange", "Medium Risk"), (70, "red", "High Risk")]),
+}
+
+
+def _due_text(due, today):
+    """Describe a reminder's due time relative to `today`."""
+    day = date.fromtimestamp(due)
+    days = (day - today).days
+    if days < 0:
+        return "overdue"
+    if days <= 1:
+        return "due today" if days == 0 else "due tomorrow"
+    return f"due in {days} days" if days <= 60 else f"due {day:%b %d, %Y}"
+
+
+def _next_visit_text(patient_id):
+    """Describe the patient's next booked appointment, read from the booking calendar."""
+    appointment = get_scheduler().next_appointment(patient_id)
+    if appointment is None:
+        return "No appointment booked"
+    doctor_id, day, slot_time, kind = appointment
+    try:
+        doctor_name = load_doctor_directory().doctor(doctor_id)["name"]
+    except KeyError:
+        doctor_name = "your specialist"
+    visit = "Virtual visit" if kind == VIRTUAL_VISIT else "Appointment"
+    return f"{visit} with {doctor_name} on {day:%b %d} at {slot_time}"
+
+
+def render():
+    st.markdown('<h2 class="sub-header">Kidney Health Monitoring</h2>', unsafe_allow_html=True)
+
+    st.markdown("### Daily Health Log")
+    patient = current_patient()
+
+    col1, col2 = st.columns(2)
+
+    with col1:
+        st.write("**Today's Input**")
+        water_intake = st.slider("Water intake (glasses)", 0, 15, patient.get('water_intake', 5), key='daily_water')
+        pain_level = st.slider("Pain level (0-10)", 0, 10, 0)
+        medication_taken = st.checkbox("Taken prescribed medication today")
+        symptoms = st.multiselect("Symptoms experienced",
+                                 ["Back pain", "Abdominal pain", "Frequent urination",
+                                  "Blood in urine", "Nausea", "Fever", "None"])
+
+    with col2:
+        st.write("**Diet Log**")
+        protein_intake = st.selectbox("Protein consumption", ["Low", "Moderate", "High"])
+        sodium_intake = st.selectbox("Sodium consumption", ["Low", "Moderate", "High"])
+        oxalate_foods = st.multiselect("High-oxalate foods consumed",
+                                      ["Spinach", "Nuts", "Beets", "Tea", "Chocolate", "Berries", "None"])
+        citrus_intake = st.checkbox("Consumed citrus fruits/juices today")
+
+        stone_type = patient.get('stone_type')
+        day = score_day({"protein_intake": protein_intake, "sodium_intake": sodium_intake,
+                         "oxalate_foods": oxalate_foods, "citrus_intake": citrus_intake}, stone_type)
+        st.metric(f"Diet score ({stone_type or 'general prevention'})", f"{day['score']}/100")
+        for nutrient in day['nutrients']:
+            if nutrient['status'] != "ok":
+                limit = nutrient['max'] if nutrient['status'] == "high" else nutrient['min']
+                st.caption(f"{nutrient['nutrient'].capitalize()} {nutrient['status']}: about "
+                           f"{nutrient['total']:g} {nutrient['unit']} (target "
+                           f"{'at most' if nutrient['status'] == 'high' else 'at least'} {limit:g})")
+
+    store = get_store()
+    patient_id = patient_key()
+
+    if st.button("Save Daily Entry"):
+        store.add_entry(
+            patient_id, date.today(),
+            water_intake=water_intake, pain_level=pain_level, medication_taken=medication_taken,
+            symptoms=symptoms, protein_intake=protein_intake, sodium_intake=sodium_intake,
+            oxalate_foods=oxalate_foods, citrus_intake=citrus_intake,
+            recurrence_risk=patient.get('recurrence_risk'),
+        )
+        get_cohort_store().record_log(patient_id, date.today())
+        st.success("Daily health data saved successfully!")
+
+    st.markdown("---")
+    st.markdown("### Health Progress Dashboard")
+
+    view_col, chart_col = st.columns(2)
+    with view_col:
+        view = st.radio("View by", list(DASHBOARD_VIEWS), horizontal=True, key='dashboard_view')
+    with chart_col:
+        # Only the selected chart is built and sent to the browser
+        chart = st.radio("Chart", list(DASHBOARD_CHARTS), horizontal=True, key='dashboard_chart')
+
+    period, days = DASHBOARD_VIEWS[view]
+    today = date.today()
+    start = HISTORY_START if days is None else today - timedelta(days=days)
+    series, kind, title, y_label, hlines = DASHBOARD_CHARTS[chart]
+    projection = patient_curve_key(patient, today) if series == "risk" else None
+
+    def build():
+        history = store.series(patient_id, period, start, today)
+        dates, values = finite_points(history["start"], history[series])
+        if not dates and projection is None:
+            return None
+        chart_title = "Recurrence Risk Trend" if series == "risk" else f"{view} {title}"
+        fig = series_figure(dates, values, chart_title, "Date", y_label, kind, hlines)
+        if projection is not None:
+            fig.data[0].name = "Recorded risk"
+            curve = curves([projection])[0][:PROJECTION_MONTHS + 1]
+            fig.add_trace(go.Scatter(x=curve_dates(today, range(len(curve))), y=100 * curve, mode="lines",
+                                     line_dash="dot", name="Projected chance of recurrence"))
+        return fig
+
+    fig = cached_figure((patient_id, series, view, today, projection), store.revision(patient_id), build)
+    if fig is not None:
+        with span("health_tracker.plot"):
+            st.plotly_chart(fig, use_container_width=True)
+    elif series == "risk":
+        st.info("Analyze your reports to start tracking your recurrence risk.")
+    else:
+        st.info("No entries yet. Save a daily entry above to start tracking your progress.")
+
+    # Reminders and alerts
+    st.markdown("### Health Reminders")
+    reminders = get_reminder_scheduler()
+    medications = patient.get('medications')
+    # Every patient gets follow-up imaging and lab test reminders
+    if reminders.next(patient_id, IMAGING) is None:
+        reminders.replace(patient_id, IMAGING, [follow_up_reminder(patient, today)])
+    if reminders.next(patient_id, LAB_TEST) is None:
+        reminders.replace(patient_id, LAB_TEST, [lab_test_reminder(today)])
+    reminder_col1, reminder_col2, reminder_col3 = st.columns(3)
+
+    with reminder_col1:
+        st.info("**Next Doctor Visit**")
+        visit_text = st.empty()
+        imaging = reminders.next(patient_id, IMAGING)
+        if st.button("Snooze 1 Week", key="reschedule"):
+            reminders.reschedule(imaging.id, imaging.due + SNOOZE.total_seconds())
+            imaging = reminders.next(patient_id, IMAGING)
+        visit_text.write(f"{_next_visit_text(patient_id)}  \n"
+                         f"Follow-up imaging {_due_text(imaging.due, today)}")
+
+    with reminder_col2:
+        st.warning("**Lab Tests Due**")
+        lab_text = st.empty()
+        if st.button("Order Test", key="order_test"):
+            reminders.replace(patient_id, LAB_TEST, [lab_test_reminder(today)])
+            st.success(f"Test ordered. We'll remind you again in {LAB_TEST_MONTHS} months.")
+        lab_test = reminders.next(patient_id, LAB_TEST)
+        lab_text.write(f"Urine analysis {_due_text(lab_test.due, today)}")
+
+    with reminder_col3:
+        st.error("**Medication Refill**")
+        refill_text = st.empty()
+        refill = reminders.next(patient_id, REFILL)
+        refill_days = round(refill.repeat / 86400) if refill else REFILL_DAYS
+        if st.button("Request Refill", key="request_refill"):
+            reminders.replace(patient_id, REFILL, [refill_reminder(medications, refill_days, today)])
+            st.success("Refill requested.")
+
+    with st.expander("Medication reminders"):
+        scheduled = {datetime.fromtimestamp(reminder.due).hour
+                     for reminder in reminders.pending(patient_id, MEDICATION)}
+        times = st.multiselect("Daily medication times", MEDICATION_TIMES, key='medication_times',
+                               default=[t for t, hour in zip(MEDICATION_TIMES, MEDICATION_HOURS) if hour in scheduled])
+        refill_days = st.number_input("Refill every (days)", 7, 180, refill_days, key='refill_days')
+        if st.button("Save Reminders", key="save_reminders"):
+            reminders.replace(patient_id, MEDICATION, medication_reminders(medications, times, today))
+            reminders.replace(patient_id, REFILL, [refill_reminder(medications, refill_days, today)])
+            st.success("Reminders saved.")
+    refill = reminders.next(patient_id, REFILL)
+    refill_text.write(f"Refill {_due_text(refill.due, today)}" if refill else "No refill reminder set")
+
+    recent = reminders.deliveries(patient_id)
+    if recent:
+        st.write("**Recent reminders**")
+        for _, message, delivered_at in recent:
+            st.caption(f"{datetime.fromtimestamp(delivered_at):%b %d, %I:%M %p} - {message}")
@@ -0,0 +1,67 @@
+"""Patient Input page: demographics, history and lifestyle."""
+from datetime import date, timedelta
+
+import streamlit as st
+
+from patient_record import MAX_TEXT_LENGTH
+from session import current_patient
+
+
+def _field(patient, field, widget, label, default, **kwargs):
+    """Render `widget` for a record field, starting from the stored value, and store its value."""
+    key = f"patient_{field}"
+    if key not in st.session_state:
+        # First render of this widget in this browser session (or a restored record)
+        st.session_state[key] = patient.get(field, default)
+    patient[field] = widget(label, key=key, **kwargs)
+
+
+def render():
+    st.markdown('<h2 class="sub-header">Patient Information</h2>', unsafe_allow_html=True)
+    patient = current_patient()
+
+    col1, col2 = st.columns(2)
+
+    with col1:
+        _field(patient, 'name', st.text_input, "Full Name", "", max_chars=MAX_TEXT_LENGTH)
+        _field(patient, 'age', st.number_input, "Age", 30, min_value=1, max_value=100)
+        _field(patient, 'gender', st.selectbox, "Gender", "Male", options=["Male", "Female", "Other"])
+        _field(patient, 'weight', st.number_input, "Weight (kg)", 70, min_value=20, max_value=200)
+        _field(patient, 'height', st.number_input, "Height (cm)", 170, min_value=100, max_value=250)
+
+    with col2:
+        _field(patient, 'previous_operations', st.number_input, "Number of previous kidney stone operations", 1,
+               min_value=0, max_value=10)
+        _field(patient, 'last_operation', st.date_input, "Date of last operation", date.today() - timedelta(days=180))
+        _field(patient, 'family_history', st.selectbox, "Family history of kidney stones", "None",
+               options=["None", "One relative", "Multiple relatives"])
+        _field(patient, 'water_intake', st.slider, "Daily water intake (glasses)", 5, min_value=1, max_value=15)
+        _field(patient, 'diet', st.selectbox, "Primary diet type", "Mixed",
+               options=["Mixed", "Vegetarian", "High-protein", "High-salt", "Other"])
+
+    # Medical history
+    st.markdown("### Medical History")
+    medical_col1, medical_col2 = st.columns(2)
+
+    with medical_col1:
+        _field(patient, 'hypertension', st.checkbox, "Hypertension", False)
+        _field(patient, 'diabetes', st.checkbox, "Diabetes", False)
+        _field(patient, 'uti_history', st.checkbox, "Recurrent UTIs", False)
+
+    with medical_col2:
+        _field(patient, 'kidney_disease', st.checkbox, "Chronic Kidney Disease", False)
+        _field(patient, 'medications', st.text_input, "Current medications", "", max_chars=MAX_TEXT_LENGTH)
+
+    # Lifestyle factors
+    st.markdown("### Lifestyle Factors")
+    lifestyle_col1, lifestyle_col2 = st.columns(2)
+
+    with lifestyle_col1:
+        _field(patient, 'activity_level', st.selectbox, "Physical activity level", "Sedentary",
+               options=["Sedentary", "Lightly active", "Moderately active", "Very active"])
+        _field(patient, 'smoking', st.selectbox, "Smoking status", "Never", options=["Never", "Former", "Current"])
+
+    with lifestyle_col2:
+        _field(patient, 'alcohol', st.selectbox, "Alcohol consumption", "None",
+               options=["None", "Occasional", "Moderate", "Heavy"])
+        _field(patient, 'stress_level', st.slider, "Stress level (1-10)", 5, min_value=1, max_value=10)
@@ -0,0 +1,89 @@
+"""Report Analysis page: upload reports and run the analysis job."""
+import time
+
+import streamlit as st
+
+from analysis import JOB_NAME as ANALYSIS_JOB, run_analysis
+from cohort_store import get_cohort_store
+from jobs import DONE, get_manager
+from reminders import IMAGING, follow_up_reminder, get_reminder_scheduler
+from session import current_patient, current_session_id, patient_key, upload_handle
+
+# Seconds between reruns while an analysis job is in progress
+JOB_POLL_INTERVAL = 0.3
+
+# Analysis results copied to the clinician cohort
+COHORT_RESULTS = ["name", "recurrence_risk", "stone_type", "largest_stone", "surgery_needed"]
+
+# Slice thickness accepted for a .npy CT volume (ct_volume.MAX_SLICE_THICKNESS_MM is the upper bound)
+SLICE_THICKNESS_RANGE = (0.1, 10.0)
+
+
+def collect_analysis():
+    """Merge a finished background analysis into this session, once."""
+    job = get_manager().get(current_session_id(), ANALYSIS_JOB)
+    if job is None or job.status != DONE or st.session_state.collected_job == job.id:
+        return
+    patient = current_patient()
+    patient.update(job.result)
+    patient['analysis_complete'] = True
+    st.session_state.collected_job = job.id
+    get_cohort_store().upsert(patient_key(), **{column: patient.get(column) for column in COHORT_RESULTS})
+    # Time the next follow-up imaging from the new recurrence risk
+    get_reminder_scheduler().replace(patient_key(), IMAGING, [follow_up_reminder(patient)])
+
+
+def render():
+    st.markdown('<h2 class="sub-header">Upload Medical Reports</h2>', unsafe_allow_html=True)
+
+    col1, col2 = st.columns(2)
+
+    with col1:
+        st.info("Please upload clear images of your medical reports")
+        xray_image = st.file_uploader("X-Ray Image", type=['png', 'jpg', 'jpeg'])
+        ct_scan_image = st.file_uploader(
+            "CT Scan (one image, a zip of slices or a .npy volume)", type=['png', 'jpg', 'jpeg', 'zip', 'npy'],
+            help="Whole studies are measured in 3D. Name zipped slices in head-to-feet order and add a "
+                 "study.json with the slice thickness, e.g. {\"slice_thickness_mm\": 2.5}; "
+                 "otherwise slices are assumed to be 1 mm apart.")
+        slice_thickness = None
+        if ct_scan_image is not None and ct_scan_image.name.lower().endswith(".npy"):
+            # A .npy array cannot carry its slice spacing
+            slice_thickness = st.number_input(
+                "CT slice thickness (mm)", *SLICE_THICKNESS_RANGE, value=None, step=0.5,
+                help="From the scan report. Left empty, slices are assumed to be 1 mm apart.")
+
+    with col2:
+        ultrasound_image = st.file_uploader("Ultrasound Image", type=['png', 'jpg', 'jpeg'])
+        lab_report = st.file_uploader("Lab Report (PDF or image)", type=['pdf', 'png', 'jpg', 'jpeg'])
+
+    analysis_jobs = get_manager()
+    session_id = current_session_id()
+
+    if st.button("Analyze Reports"):
+        if xray_image or ct_scan_image or ultrasound_image or lab_report:
+            # Stream uploads to the on-disk store; the job only gets small handles
+            images = {modality: upload_handle(modality, upload) for modality, upload in [
+                ("xray", xray_image), ("ct", ct_scan_image), ("ultrasound", ultrasound_image)
+            ] if upload is not None}
+            lab_handle = upload_handle("lab_report", lab_report)
+            analysis_jobs.submit(session_id, ANALYSIS_JOB, run_analysis,
+                                 dict(current_patient()), images, lab_report=lab_handle,
+                                 slice_thickness_mm=slice_thickness)
+            st.session_state.reports_uploaded = True
+        else:
+            st.warning("Please upload at least one medical report to analyze.")
+
+    job = analysis_jobs.get(session_id, ANALYSIS_JOB)
+    if job is not None:
+        if not job.finished:
+            # Poll the background job; navigating away simply stops polling
+            st.info("Analyzing your reports with our AI engine...")
+            st.progress(job.progress, text=job.stage)
+            time.sleep(JOB_POLL_INTERVAL)
+            st.rerun()
+        elif job.status == DONE:
+            collect_analysis()
+            st.success("Analysis complete! Navigate to the Results page to see your report.")
+        else:
+            st.error(f"Analysis failed: {job.error}")
@@ -0,0 +1,211 @@
+"""Results & Recommendations page."""
+import plotly.graph_objects as go
+import streamlit as st
+
+from diet import FOOD_NAMES, meal_plan
+from metrics import span
+from session import current_patient
+from static_data import load_diet_recommendations
+from survival import CURVE_MONTHS, chance_within, follow_up_months, patient_curve
+
+
+def _target_range(nutrient):
+    low, high, unit = nutrient['min'], nutrient['max'], nutrient['unit']
+    if high is None:
+        return f"at least {low:g} {unit}"
+    if low is None:
+        return f"at most {high:g} {unit}"
+    return f"{low:g}-{high:g} {unit}"
+
+
+def render():
+    diet_recommendations = load_diet_recommendations()
+    patient = current_patient()
+
+    st.markdown('<h2 class="sub-header">Analysis Results & Recommendations</h2>', unsafe_allow_html=True)
+
+    if not patient.get('analysis_complete'):
+        st.warning("Please upload and analyze your medical reports first on the Report Analysis page.")
+    else:
+        # Display patient summary
+        st.markdown("### Patient Summary")
+        col1, col2, col3 = st.columns(3)
+
+        with col1:
+            st.metric("Name", patient.get('name', 'Not provided'))
+            st.metric("Age", patient.get('age', 'Not provided'))
+
+        with col2:
+            st.metric("Previous Operations", patient.get('previous_operations', 0))
+            risk_level = "High" if patient.get('recurrence_risk', 0) > 50 else "Medium" if patient.get('recurrence_risk', 0) > 30 else "Low"
+            st.metric("Recurrence Risk", f"{patient.get('recurrence_risk', 0)}%", risk_level)
+
+        with col3:
+            stone_status = "Surgery Recommended" if patient.get('surgery_needed', False) else "Can Pass Naturally"
+            status_color = "red" if patient.get('surgery_needed', False) else "green"
+            st.metric("Treatment Status", stone_status)
+            st.metric("Stone Type", patient.get('stone_type', 'Unknown'),
+                      help=None if patient.get('stone_type') else "Stone types are predicted once a model is trained")
+
+        # Stone visualization
+        st.markdown("### Stone Analysis")
+        fig = go.Figure()
+
+        if patient.get('slice_thickness_assumed'):
+            st.warning(f"The CT study did not give its slice thickness, so its slices were assumed to be "
+                       f"{patient.get('slice_thickness_mm'):g} mm apart. Stone sizes and volumes measured on it "
+                       "are only as accurate as that guess; enter the thickness from your scan report and "
+                       "analyze again.")
+
+        if not patient.get('stone_sizes'):
+            st.info("No stones were detected in the uploaded images.")
+        else:
+            for i, (size, location) in enumerate(zip(
+                patient['stone_sizes'],
+                patient['stone_locations']
+            )):
+                fig.add_trace(go.Bar(
+                    x=[f"Stone {i+1}"],
+                    y=[size],
+                    name=f"{location} ({size:.1f}mm)",
+                    hovertemplate=f"Location: {location}<br>Size: {size:.1f}mm<extra></extra>"
+                ))
+
+            fig.update_layout(
+                title="Kidney Stone Sizes and Locations",
+                xaxis_title="Stones",
+                yaxis_title="Size (mm)",
+                showlegend=True
+            )
+            with span("results.plot"):
+                st.plotly_chart(fig, use_container_width=True)
+
+        # Analytes read from the uploaded lab report
+        lab_results = patient.get('lab_results')
+        if lab_results is not None:
+            from lab_reports import ANALYTES, flag
+
+            st.markdown("### Lab Results")
+            if not lab_results:
+                st.info("No stone-risk analytes could be read from the uploaded lab report.")
+            else:
+                st.table([
+                    {"Analyte": label, "Value": f"{lab_results[field]:g} {unit}".strip(),
+                     "Flag": flag(field, lab_results[field])}
+                    for field, label, unit in ANALYTES if field in lab_results
+                ])
+
+        # Treatment recommendations
+        st.markdown("### Treatment Recommendations")
+
+        if patient.get('surgery_needed'):
+            st.warning("""
+            **Surgical intervention recommended** based on stone size and location.
+            Options may include:
+            - Extracorporeal Shock Wave Lithotripsy (ESWL)
+            - Ureteroscopy
+            - Percutaneous Nephrolithotomy (PCNL)
+            """)
+        else:
+            st.success("""
+            **Natural passage possible** with conservative management:
+            - Increased water intake (3-4L daily)
+            - Medical expulsive therapy
+            - Pain management
+            - Activity and positional techniques
+            """)
+
+        # Diet recommendations
+        st.markdown("### Personalized Diet Plan")
+
+        stone_type_key = patient.get('stone_type', '').lower().replace(' ', '_')
+        if stone_type_key in diet_recommendations:
+            rec = diet_recommendations[stone_type_key]
+
+            col1, col2 = st.columns(2)
+
+            with col1:
+                st.markdown("#### Foods to Avoid")
+                for food in rec['avoid']:
+                    st.write(f"• {food}")
+
+            with col2:
+                st.markdown("#### Foods to Consume")
+                for food in rec['consume']:
+                    st.write(f"• {food}")
+        else:
+            st.info("General kidney stone prevention diet:")
+            st.write("""
+            - Drink 2.5-3L of water daily
+            - Limit sodium intake to <2300mg/day
+            - Consume moderate amounts of animal protein
+            - Include citrus fruits and juices
+            - Ensure adequate calcium from food sources
+            """)
+
+        st.markdown("#### Sample Daily Meal Plan")
+        plan_col1, plan_col2, plan_col3 = st.columns([1, 1, 2])
+        vegetarian = plan_col1.checkbox("Vegetarian", key='diet_vegetarian')
+        dairy_free = plan_col2.checkbox("Dairy-free", key='diet_dairy_free')
+        exclude = plan_col3.multiselect("Leave out", FOOD_NAMES, key='diet_exclude')
+        try:
+            with span("results.meal_plan"):
+                plan = meal_plan(patient.get('stone_type'), vegetarian, dairy_free, exclude)
+        except ValueError as e:
+            st.warning(str(e))
+        else:
+            meal_col, nutrient_col = st.columns([3, 2])
+            meal_col.table([{"Meal": row['meal'], "Food": row['food'], "Serving": row['serving']}
+                            for row in plan['meals']])
+            nutrient_col.metric("Plan score", f"{plan['score']}/100")
+            nutrient_col.table([{
+                "Nutrient": nutrient['nutrient'].capitalize(),
+                "Plan": f"{nutrient['total']:g} {nutrient['unit']}",
+                "Target": _target_range(nutrient),
+            } for nutrient in plan['nutrients']])
+
+        # Prevention strategies
+        st.markdown("### Recurrence Prevention Strategies")
+
+        prevention_col1, prevention_col2, prevention_col3 = st.columns(3)
+
+        with prevention_col1:
+            st.markdown("**Hydration**")
+            st.write(f"Target: {max(8, patient.get('water_intake', 5) + 3)} glasses daily")
+            st.progress(min(1.0, (patient.get('water_intake', 5) / 12)))
+
+        with prevention_col2:
+            st.markdown("**Diet Modification**")
+            if patient.get('diet') in ['High-protein', 'High-salt']:
+                st.error("Modify current diet")
+                st.write("Reduce protein/salt intake")
+            else:
+                st.success("Diet appears balanced")
+                st.write("Maintain current patterns")
+
+        curve = patient_curve(patient)
+
+        with prevention_col3:
+            st.markdown("**Monitoring**")
+            st.write("Follow-up imaging recommended in:")
+            if curve is None:
+                st.metric("", "12 months")
+            else:
+                st.metric("", f"{follow_up_months(curve)} months")
+
+        if curve is not None:
+            st.markdown("### Time to Recurrence")
+            curve_col1, curve_col2, curve_col3 = st.columns(3)
+            curve_col1.metric("Within 1 year", f"{chance_within(curve, 12):.0%}")
+            curve_col2.metric("Within 2 years", f"{chance_within(curve, 24):.0%}")
+            curve_col3.metric("Within 5 years", f"{chance_within(curve, 60):.0%}")
+
+            fig = go.Figure(go.Scatter(x=CURVE_MONTHS, y=100 * curve, mode="lines", fill="tozeroy"))
+            fig.update_layout(
+                title="Chance of a New Stone Over Time",
+                xaxis_title="Months from today",
+                yaxis_title="Chance of recurrence (%)",
+                yaxis_range=[0, 100]
+            )
+            with span("results.plot"):
+                st.plotly_chart(fig, use_container_width=True)